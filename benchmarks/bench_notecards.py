@@ -0,0 +1,167 @@
+#!/usr/bin/python
+"""Benchmarks NotecardsHandler and safeDatabase on synthetic decks, without any gtk.
+
+	python benchmarks/bench_notecards.py --sizes 1000,100000 --output results.json
+	python benchmarks/bench_notecards.py --compare results.json
+
+Every operation is timed call by call; the JSON has the throughput and the p50/p99
+latency of each one, per deck size. Writes only queue a statement, so their
+throughput includes the flush that commits them.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+from timeit import default_timer as clock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lexiconner import NotecardsHandler
+
+
+def percentile(latencies, fraction):
+	return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+def summary(operation, cards, latencies, elapsed):
+	"""Turns a list of per-call latencies, in seconds, into a result row.
+	"""
+	latencies = sorted(latencies)
+	return {
+		'operation': operation,
+		'cards': cards,
+		'calls': len(latencies),
+		'throughput': len(latencies) / elapsed if elapsed else None,
+		'p50_ms': percentile(latencies, 0.50) * 1000,
+		'p99_ms': percentile(latencies, 0.99) * 1000,
+	}
+
+def timed(function, args_list):
+	"""Calls function once for each tuple in args_list, returns (latencies, elapsed).
+	"""
+	latencies = []
+	start = clock()
+	for args in args_list:
+		before = clock()
+		function(*args)
+		latencies.append(clock() - before)
+	return latencies, clock() - start
+
+def make_deck(path, cards, readers):
+	"""Creates a deck of cards synthetic notecards at path and returns its handler.
+	"""
+	notecards = NotecardsHandler(path, readers=readers)
+	lines = ('word%d|meaning of word %d, %s\n' % (i, i, random.choice(['noun', 'verb', 'adjective'])) for i in range(cards))
+	notecards.import_csv(lines)
+	notecards.flush()
+	return notecards
+
+def bench_deck(cards, calls, readers, threads):
+	"""Runs every benchmark on one deck of cards notecards and returns the result rows.
+	"""
+	directory = tempfile.mkdtemp(prefix='lexiconner-bench-')
+	results = []
+	try:
+		start = clock()
+		notecards = make_deck(os.path.join(directory, 'bench.db'), cards, readers)
+		results.append(summary('import_csv', cards, [clock() - start], clock() - start))
+
+		def run(operation, function, args_list, flush=False):
+			latencies, elapsed = timed(function, args_list)
+			if flush:
+				start = clock()
+				notecards.flush()
+				elapsed += clock() - start
+			results.append(summary(operation, cards, latencies, elapsed))
+
+		existing = [(random.randrange(cards),) for i in range(calls)]
+		run('get_smallest_avialable_id', notecards.get_smallest_avialable_id, [()] * calls)
+		run('lookup', notecards.lookup, [('word%d' % _id,) for _id, in existing])
+		run('random_question', notecards.random_question, [()] * calls)
+		run('edit_notecard', notecards.edit_notecard, [(_id, None, 'edited %d' % _id) for _id, in existing], flush=True)
+
+		new_ids = range(cards, cards + calls)		#The deck has ids 0 to cards - 1
+		run('add_notecard', notecards.add_notecard, [(_id, 'new%d' % _id, 'added') for _id in new_ids], flush=True)
+		run('delete_notecard', notecards.delete_notecard, [(_id,) for _id in new_ids], flush=True)
+
+		run('get_all_notecards', notecards.get_all_notecards, [()] * max(1, min(calls, 1000000 // cards)))
+
+		#Several callers hammering the queues at once, as the timer, the prefetcher and the edit window do
+		latencies = [[] for i in range(threads)]
+		def caller(latencies):
+			for i in range(calls // threads):
+				before = clock()
+				if i % 2:
+					notecards.lookup('word%d' % random.randrange(cards))
+				else:
+					notecards.random_question()
+				latencies.append(clock() - before)
+		workers = [threading.Thread(target=caller, args=(latencies[i],)) for i in range(threads)]
+		start = clock()
+		for worker in workers:
+			worker.start()
+		for worker in workers:
+			worker.join()
+		results.append(summary('contention_%d_threads' % threads, cards, sum(latencies, []), clock() - start))
+
+		notecards.close()
+		notecards.database.join()
+		for reader in notecards.database.readers:
+			reader.join()
+	finally:
+		shutil.rmtree(directory)
+	return results
+
+def compare(results, baseline):
+	"""Prints how each result's throughput and p99 moved against the baseline run.
+	"""
+	before = dict(((row['operation'], row['cards']), row) for row in baseline['results'])
+	for row in results:
+		old = before.get((row['operation'], row['cards']))
+		if not old:
+			continue
+		print('%-28s %9d cards  throughput x%5.2f  p99 x%5.2f' % (row['operation'], row['cards'],
+			(row['throughput'] or 0) / (old['throughput'] or 1), row['p99_ms'] / (old['p99_ms'] or 1)))
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Benchmarks NotecardsHandler on synthetic decks.")
+	parser.add_argument('--sizes', default='1000,10000,100000', help="deck sizes, comma separated (default %(default)s)")
+	parser.add_argument('--calls', type=int, default=2000, help="calls per operation (default %(default)s)")
+	parser.add_argument('--readers', type=int, default=2, help="reader connections (default %(default)s)")
+	parser.add_argument('--threads', type=int, default=4, help="callers in the contention benchmark (default %(default)s)")
+	parser.add_argument('--output', help="write the results here as JSON, instead of standard output")
+	parser.add_argument('--compare', metavar='BASELINE', help="JSON from an earlier run to compare against")
+	args = parser.parse_args(argv)
+
+	random.seed(0)
+	results = []
+	for cards in [int(size) for size in args.sizes.split(',')]:
+		print("Benchmarking %d cards" % cards, file=sys.stderr)
+		results.extend(bench_deck(cards, args.calls, args.readers, args.threads))
+
+	report = {
+		'python': platform.python_version(),
+		'sqlite': sqlite3.sqlite_version,
+		'readers': args.readers,
+		'calls': args.calls,
+		'results': results,
+	}
+	if args.output:
+		with open(args.output, 'w') as output:
+			json.dump(report, output, indent=1, sort_keys=True)
+	else:
+		json.dump(report, sys.stdout, indent=1, sort_keys=True)
+		print()
+	if args.compare:
+		with open(args.compare) as baseline:
+			compare(results, json.load(baseline))
+
+
+if __name__ == '__main__':
+	main()
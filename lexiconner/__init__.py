@@ -0,0 +1,11 @@
+"""Lexiconner, a notecard app for the Ubuntu desktop.
+
+The package itself needs nothing beyond the standard library, so NotecardsHandler can be used
+from scripts without gtk or a display. The indicator lives in lexiconner.gui, which is only
+imported when it's launched.
+"""
+from lexiconner.config import APP_NAME, CONFIG_DIR, DATABASE_FILE
+from lexiconner.database import safeDatabase
+from lexiconner.notecards import NotecardsHandler
+
+__all__ = ['APP_NAME', 'CONFIG_DIR', 'DATABASE_FILE', 'safeDatabase', 'NotecardsHandler']
@@ -0,0 +1,3 @@
+from lexiconner.cli import main
+
+main()
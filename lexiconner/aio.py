@@ -0,0 +1,301 @@
+"""An asyncio front-end for NotecardsHandler, Python 3 only.
+
+Statements still go through the handler's safeDatabase, its writer and readers, but instead of
+a Queue per call that some thread blocks on, the worker threads hand the rows to an object
+whose put() resolves a future on the event loop. So any number of calls can be in flight
+from one thread:
+
+	notecards = AsyncNotecardsHandler(NotecardsHandler(path, readers=2))
+	await notecards.add_notecard(_id, front, back)
+	backs = await asyncio.gather(*[notecards.lookup(front) for front in fronts])
+	async for _id, front, back in notecards.iter_all():
+		...
+
+Written without async/await, so the package still byte-compiles on Python 2.
+"""
+import asyncio
+import collections
+
+from lexiconner.database import EndOfStream, WorkerError
+
+
+def on_loop(loop, function, *args):
+	"""call_soon_threadsafe, unless the loop has been closed and nobody is waiting any more.
+	"""
+	try:
+		loop.call_soon_threadsafe(function, *args)
+	except RuntimeError:
+		pass
+
+
+class FutureRows(object):
+	"""Takes the place of a result queue: gathers the chunks of a statement in the worker
+		thread, then resolves future with the rows, or whatever transform makes of them.
+	"""
+	def __init__(self, loop, transform=None):
+		self.loop = loop
+		self.future = loop.create_future()
+		self.transform = transform
+		self.rows = []		#Only the worker touches it until the end
+
+	def put(self, chunk):
+		if chunk is EndOfStream or isinstance(chunk, WorkerError):
+			on_loop(self.loop, self.done, chunk)
+		else:
+			self.rows.extend(chunk)
+
+	def done(self, chunk):
+		if self.future.cancelled():
+			return
+		if isinstance(chunk, WorkerError):
+			self.future.set_exception(chunk.error)
+			return
+		try:
+			self.future.set_result(self.transform(self.rows) if self.transform else self.rows)
+		except Exception as e:
+			self.future.set_exception(e)
+
+
+class AsyncRows(object):
+	"""An async iterator over the rows of a statement, read a page at a time. req takes the
+		first column of the last row read so far as its second to last parameter, and how many
+		rows to send as its last, see iter_all(). The next page is asked for once no more
+		than a page is left to read, so at most two wait in memory.
+
+		Nothing is ever kept waiting for the loop: each page is a statement of its own, done
+		as soon as its rows are sent. So a loop that stops reading halfway leaves no thread
+		behind, aclose() only saves asking for the pages in flight. And without readers, the
+		writer is free between pages for whatever is awaited meanwhile. Each page sees the
+		notecards as they are when it's read.
+	"""
+	def __init__(self, loop, database, req, arg, page=1024, reader=True):
+		self.loop = loop
+		self.database = database
+		self.req = req
+		self.arg = list(arg)
+		self.page = page
+		self.reader = reader
+		self.rows = collections.deque()
+		self.last = None		#First column of the last row read, the key of the next page
+		self.pending = None		#Future of the page being read
+		self.waiter = None		#Future of the __anext__ waiting for a page
+		self.finished = False
+		self.error = None
+		self.closed = False
+		self.fetch(-1)
+
+	def fetch(self, after):
+		res = FutureRows(self.loop)
+		self.pending = res.future
+		self.pending.add_done_callback(self.arrived)
+		self.database.submit(self.req, self.arg + [after, self.page], res, self.reader)
+
+	def arrived(self, future):
+		self.pending = None
+		if future.cancelled() or self.closed:
+			return
+		if future.exception() is not None:
+			self.error = future.exception()
+		else:
+			rows = future.result()
+			self.rows.extend(rows)
+			if rows:
+				self.last = rows[-1][0]
+			self.finished = len(rows) < self.page
+			self.more()
+		if self.waiter is not None and not self.waiter.done():
+			self.waiter.set_result(None)
+		self.waiter = None
+
+	def more(self):
+		"""Asks for the next page, unless there's enough to read already.
+		"""
+		if self.pending is None and not (self.finished or self.closed or self.error) and len(self.rows) <= self.page:
+			self.fetch(self.last)
+
+	def __aiter__(self):
+		return self
+
+	def __anext__(self):
+		future = self.loop.create_future()
+		self.next_row(future)
+		return future
+
+	def next_row(self, future, ignored=None):
+		"""Resolves future with the next row, as soon as there is one.
+		"""
+		if future.done():
+			return
+		if self.rows:
+			future.set_result(self.rows.popleft())
+			self.more()
+		elif self.error is not None:
+			future.set_exception(self.error)
+		elif self.finished or self.closed:
+			future.set_exception(StopAsyncIteration())
+		else:
+			self.waiter = self.loop.create_future()
+			self.waiter.add_done_callback(lambda waiter: self.next_row(future))
+
+	def aclose(self):
+		"""Stops reading: no more pages are asked for, and what's left is dropped.
+		"""
+		self.closed = True
+		self.rows.clear()
+		future = self.loop.create_future()
+		future.set_result(None)
+		return future
+
+
+class AsyncNotecardsHandler(object):
+	"""The same calls as NotecardsHandler, returning futures. Writes resolve once they are
+		committed, reads once the rows are in. Whatever NotecardsHandler keeps in memory
+		(ids, samplers, cache, scheduler) is used and kept up to date just the same.
+	"""
+	def __init__(self, notecards, loop=None):
+		self.notecards = notecards
+		self.database = notecards.database
+		self.loop = loop or asyncio.get_event_loop()
+
+	def done(self, result):
+		future = self.loop.create_future()
+		future.set_result(result)
+		return future
+
+	def then(self, future, transform):
+		"""Returns a future of transform(what future resolves to).
+		"""
+		result = self.loop.create_future()
+		def done(future):
+			if result.cancelled():
+				return
+			if future.cancelled():
+				result.cancel()
+			elif future.exception() is not None:
+				result.set_exception(future.exception())
+			else:
+				try:
+					result.set_result(transform(future.result()))
+				except Exception as e:
+					result.set_exception(e)
+		future.add_done_callback(done)
+		return result
+
+	def rows(self, req, arg=None, reader=True, transform=None):
+		"""Returns a future of the rows of req, passed through transform if given.
+		"""
+		res = FutureRows(self.loop, transform)
+		self.database.submit(req, arg, res, reader)
+		return res.future
+
+	def flush(self, result=None):
+		"""Returns a future resolved with result once everything queued so far is committed.
+			Flushes from many callers end up in one commit.
+		"""
+		res = FutureRows(self.loop, lambda rows: result)
+		self.database.execute('--flush--', res=res)
+		return res.future
+
+	def add_notecard(self, _id, front, back, deck_id=None):
+		"""Future of the id the notecard got, see NotecardsHandler.add_notecard(), once it's committed.
+		"""
+		notecards = self.notecards
+		deck_id = notecards.check_new_notecard(_id, front, back, deck_id)
+		inserted = self.rows(notecards.inserting(_id, front, back, deck_id), reader=False,
+							transform=lambda rows: notecards.added(rows[0][0], front, back, deck_id, self.database.queued))
+		return self.then(asyncio.gather(inserted, self.flush()), lambda results: results[0])
+
+	def edit_notecard(self, _id, front=None, back=None):
+		self.notecards.edit_notecard(_id, front, back)
+		return self.flush()
+
+	def delete_notecard(self, _id):
+		self.notecards.delete_notecard(_id)
+		return self.flush()
+
+	def update_notecards(self, rows):
+		self.notecards.update_notecards(rows)
+		return self.flush()
+
+	def delete_notecards(self, ids):
+		self.notecards.delete_notecards(ids)
+		return self.flush()
+
+	def lookup(self, front):
+		"""Future of the back of the notecard with front, or "".
+		"""
+		cache = self.notecards.cache
+		answer = cache.answer(front)
+		if answer is not None:
+			return self.done(answer[1] or "")
+		version, read = cache.source(('front', front))
+		def store(rows):
+			row = rows[0] if rows else (None, u'')
+			cache.store_answer(version, front, *row)
+			return row[1] or ""
+		return self.rows("SELECT id, back FROM notecard_table WHERE front =? LIMIT 1", [front],
+							read == self.database.read, store)
+
+	def get_notecards(self, ids):
+		"""Future of the (front, back) of each id that exists, in the order of ids.
+		"""
+		if self.notecards.snapshot is not None:
+			return self.done(self.notecards.snapshot.get(ids))
+		ids = list(ids)
+		cache = self.notecards.cache
+		notecards = {}
+		missing = []
+		for _id in ids:
+			card = cache.card(_id)
+			if card is None:
+				missing.append(_id)
+			else:
+				notecards[_id] = card
+		def found(rows):
+			cache.store_cards(version, rows)
+			notecards.update((row[0], row[1:]) for row in rows)
+			return [notecards[_id] for _id in ids if _id in notecards]
+		if not missing:
+			return self.done([notecards[_id] for _id in ids])
+		version, read = cache.source(*[('id', _id) for _id in missing])
+		return self.rows("SELECT id, front, back FROM notecard_table WHERE id IN (%s)" % ','.join('?' * len(missing)), missing,
+							read == self.database.read, found)
+
+	def get_notecard_by_id(self, _id):
+		"""Future of the (front, back) of _id, or None if there is no such notecard.
+		"""
+		return self.then(self.get_notecards([_id]), lambda cards: cards[0] if cards else None)
+
+	def random_question(self, choices=3):
+		"""Future of a question, see NotecardsHandler.random_question.
+		"""
+		return self.question(None, choices)
+
+	def question(self, _id, choices=3):
+		"""Future of a question about notecard _id, see NotecardsHandler.question.
+		"""
+		return self.then(self.get_notecards(self.notecards.question_ids(_id, choices)),
+							lambda notecards: self.notecards.make_question(notecards, choices))
+
+	def next_question(self, choices=3):
+		"""Future of (id, question) for the card the scheduler wants to ask next, or of None if
+			there are no notecards.
+		"""
+		_id = self.notecards.scheduler.next_card()
+		if _id is None:
+			return self.done(None)
+		return self.then(self.question(_id, choices), lambda question: (_id, question))
+
+	def count_notecards(self):
+		where, decks = self.notecards.deck_filter()
+		return self.rows("SELECT COUNT(*) FROM notecard_table WHERE " + where, decks, transform=lambda rows: rows[0][0])
+
+	def iter_all(self, page=1024):
+		"""Async iterator over the (id, front, back) of every notecard in the selected decks, by
+			id, read page notecards at a time, see AsyncRows.
+		"""
+		where, decks = self.notecards.deck_filter()
+		return AsyncRows(self.loop, self.database, "SELECT id, front, back FROM notecard_table WHERE %s AND id > ? ORDER BY id LIMIT ?" % where, decks, page)
+
+	def close(self):
+		self.notecards.close()
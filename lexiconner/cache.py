@@ -0,0 +1,177 @@
+"""NotecardCache, which keeps recently read notecards in memory so they don't cross the queues again.
+"""
+import sys
+import threading
+import collections
+
+try:
+	basestring
+except NameError:		#Python 3
+	basestring = str
+
+class NotecardCache(object):
+	"""A bounded LRU of notecards by id, (front, back), and of lookup() answers by front,
+		(id, back), or (None, u'') when there is no such front. Both share max_bytes,
+		a rough count of what the entries take up.
+
+		Writes must go through add(), edit() and remove() with the ticket safeDatabase gave
+		the statement. Until that ticket is committed the readers may still answer with
+		what was there before, so source() sends the reads of those keys to the writer.
+		A read only gets stored if nothing was written since it started, see version.
+	"""
+	ENTRY_BYTES = 200		#Roughly what an OrderedDict entry and its tuple cost, besides the strings
+	MAX_DIRTY = 10000		#Committed keys are only cleaned out of self.dirty beyond that, or when read
+
+	def __init__(self, database, max_bytes=4 * 1024 * 1024):
+		self.database = database
+		self.max_bytes = max_bytes
+		self.lock = threading.Lock()
+		self.by_id = collections.OrderedDict()
+		self.by_front = collections.OrderedDict()
+		self.front_of = {}		#id -> the front it answers in self.by_front
+		self.dirty = {}			#Key -> ticket of the last write to it, until that is committed
+		self.version = 0		#Bumped on every write
+		self.purge_at = self.MAX_DIRTY
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def size(self, key, value):
+		return self.ENTRY_BYTES + sum(sys.getsizeof(item) for item in (key,) + value if isinstance(item, basestring))
+
+	def card(self, _id):
+		"""Returns the cached (front, back) of _id, or None.
+		"""
+		with self.lock:
+			return self._get(self.by_id, _id)
+
+	def answer(self, front):
+		"""Returns the cached (id, back) for front, or None.
+		"""
+		with self.lock:
+			return self._get(self.by_front, front)
+
+	def _get(self, entries, key):
+		value = entries.get(key)
+		if value is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		del entries[key]
+		entries[key] = value		#Most recently used go last
+		return value
+
+	def source(self, *keys):
+		"""Returns (version, read) for reading keys from the database: read is the writer's
+			select if one of them was written to and isn't committed yet, the readers' read
+			otherwise. Keys are ('id', _id) or ('front', front).
+		"""
+		with self.lock:
+			pending = False
+			for key in keys + (None,):		#None stands for every key, see clear()
+				ticket = self.dirty.get(key)
+				if ticket is not None:
+					if self.database.is_committed(ticket):
+						del self.dirty[key]
+					else:
+						pending = True
+			return self.version, self.database.select if pending else self.database.read
+
+	def store_cards(self, version, cards):
+		"""Caches the (id, front, back) cards read since version, unless something was written in the meantime.
+		"""
+		with self.lock:
+			if version == self.version:
+				for _id, front, back in cards:
+					self._put(self.by_id, _id, (front, back))
+
+	def store_answer(self, version, front, _id, back):
+		with self.lock:
+			if version == self.version:
+				self._put(self.by_front, front, (_id, back))
+				if _id is not None:
+					self.front_of[_id] = front
+
+	def _put(self, entries, key, value):
+		if key in entries:
+			self._drop(entries, key)
+		entries[key] = value
+		self.bytes += self.size(key, value)
+		while self.bytes > self.max_bytes and (self.by_id or self.by_front):
+			#Evict from whichever is bigger, so neither can starve the other
+			oldest = self.by_id if len(self.by_id) >= len(self.by_front) else self.by_front
+			self._drop(oldest, next(iter(oldest)))
+			self.evictions += 1
+
+	def _drop(self, entries, key):
+		value = entries.pop(key, None)
+		if value is None:
+			return None
+		self.bytes -= self.size(key, value)
+		if entries is self.by_front and value[0] is not None:
+			self.front_of.pop(value[0], None)
+		return value
+
+	def _written(self, ticket, keys):
+		self.version += 1
+		for key in keys:
+			self.dirty[key] = ticket
+		if len(self.dirty) > self.purge_at:
+			for key, ticket in list(self.dirty.items()):
+				if self.database.is_committed(ticket):
+					del self.dirty[key]
+			self.purge_at = max(self.MAX_DIRTY, 2 * len(self.dirty))		#Or a long batch would have us scanning on every write
+
+	def add(self, ticket, _id, front, back):
+		"""Called after queuing the insert of a notecard.
+		"""
+		with self.lock:
+			self._written(ticket, [('id', _id), ('front', front)])
+			self._put(self.by_id, _id, (front, back))
+			self._drop(self.by_front, front)		#It may have said there was no such front, or answered with another card
+
+	def edit(self, ticket, _id, front=None, back=None):
+		"""Called after queuing an update of _id. Empty values are left as they were, as in the UPDATE.
+		"""
+		with self.lock:
+			old = self._drop(self.by_id, _id)
+			fronts = set([self.front_of.get(_id), front, old and old[0]]) - set([None, ''])
+			self._written(ticket, [('id', _id)] + [('front', f) for f in fronts])
+			for f in fronts:
+				self._drop(self.by_front, f)
+			if old:
+				self._put(self.by_id, _id, (front or old[0], back or old[1]))
+
+	def remove(self, ticket, _id):
+		"""Called after queuing the delete of _id.
+		"""
+		with self.lock:
+			old = self._drop(self.by_id, _id)
+			fronts = set([self.front_of.get(_id), old and old[0]]) - set([None])
+			self._written(ticket, [('id', _id)] + [('front', f) for f in fronts])
+			for f in fronts:
+				self._drop(self.by_front, f)
+
+	def clear(self, ticket=None):
+		"""Forgets everything, for writes too big to track key by key. Until ticket is
+			committed every read goes to the writer.
+		"""
+		with self.lock:
+			self.by_id.clear()
+			self.by_front.clear()
+			self.front_of.clear()
+			self.bytes = 0
+			self.version += 1
+			if ticket is not None:
+				self.dirty[None] = ticket
+
+	def stats(self, reset=False):
+		with self.lock:
+			lookups = self.hits + self.misses
+			stats = {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+				'hit_rate': float(self.hits) / lookups if lookups else None,
+				'cards': len(self.by_id), 'fronts': len(self.by_front), 'bytes': self.bytes, 'max_bytes': self.max_bytes}
+			if reset:
+				self.hits = self.misses = self.evictions = 0
+			return stats
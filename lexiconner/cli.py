@@ -0,0 +1,98 @@
+"""The lexiconner command. Without arguments it launches the indicator, otherwise it works on
+the notecards directly and never imports gtk.
+"""
+from __future__ import print_function
+
+import argparse
+import io
+import json
+import mimetypes
+import sys
+
+from lexiconner.config import APP_NAME, DATABASE_FILE, make_config_dir
+from lexiconner.notecards import NotecardsHandler, encode, decode
+
+
+def main(argv=None):
+	"""Launches the indicator, or runs the command given on the command line.
+	"""
+	argv = sys.argv[1:] if argv is None else argv
+	if argv:
+		cli(argv)
+	else:
+		from lexiconner import gui		#Only now: gtk takes a while to start and needs a display
+		gui.main()
+
+def open_csv(name, mode):
+	"""Opens name, - being standard input or output, as the csv module wants it: bytes on
+		Python 2, text with the newlines left alone on Python 3.
+	"""
+	if name == '-':
+		return sys.stdin if mode == 'r' else sys.stdout
+	if str is bytes:
+		return open(name, mode + 'b')
+	return io.open(name, mode, encoding='utf-8', newline='')
+
+def cli(argv=None):
+	"""Command line access to the notecards, no windows involved.
+	"""
+	parser = argparse.ArgumentParser(prog=APP_NAME.lower(), description="Without a command, launches the indicator.")
+	parser.add_argument('--database', default=DATABASE_FILE, help="defaults to %(default)s")
+	parser.add_argument('--slow-query', type=float, metavar='MS', help="log statements that take longer than this")
+	parser.add_argument('--stats', action='store_true', help="print the statement timings as JSON when done")
+	commands = parser.add_subparsers(dest='command')
+	import_parser = commands.add_parser('import', help="add the front|back lines of a file as notecards")
+	import_parser.add_argument('file', help="- reads standard input")
+	import_parser.add_argument('--deck', help="put them in this deck, made if there is none")
+	export_parser = commands.add_parser('export', help="write every notecard as a front|back line")
+	export_parser.add_argument('file', help="- writes to standard output")
+	export_parser.add_argument('--deck', help="only the notecards in this deck")
+	commands.add_parser('decks', help="list the decks and how many notecards they have")
+	attach_parser = commands.add_parser('attach', help="attach an image or sound file to a notecard")
+	attach_parser.add_argument('id', type=int)
+	attach_parser.add_argument('file')
+	attach_parser.add_argument('--type', help="MIME type, guessed from the file name if not given")
+	commands.add_parser('prune-media', help="remove the stored media no notecard has any more")
+	backup_parser = commands.add_parser('backup', help="give back the space deleted notecards left, then back the database up")
+	backup_parser.add_argument('--keep', type=int, default=7, help="backups kept, defaults to %(default)s")
+	args = parser.parse_args(argv)
+
+	if args.database == DATABASE_FILE:
+		make_config_dir()
+
+	slow_query = args.slow_query / 1000.0 if args.slow_query is not None else None
+	notecards = NotecardsHandler(args.database, slow_query=slow_query, backups=getattr(args, 'keep', 7))
+	try:
+		if args.command == 'import':
+			deck_id = notecards.add_deck(decode(args.deck)) if args.deck else 0
+			csvfile = open_csv(args.file, 'r')
+			with csvfile:
+				count = notecards.import_csv(csvfile, deck_id=deck_id)
+			print("Imported %d notecards" % count, file=sys.stderr)
+		elif args.command == 'export':
+			deck_id = notecards.get_deck(decode(args.deck)) if args.deck else None
+			if args.deck and deck_id is None:
+				parser.error("there is no deck called %s" % args.deck)
+			csvfile = open_csv(args.file, 'w')
+			with csvfile:
+				count = notecards.export_csv(csvfile, deck_id)
+			print("Exported %d notecards" % count, file=sys.stderr)
+		elif args.command == 'attach':
+			if not notecards.get_notecards([args.id]):
+				parser.error("there is no notecard %d" % args.id)
+			mime_type = args.type or mimetypes.guess_type(args.file)[0] or 'application/octet-stream'
+			print(notecards.attach_media(args.id, args.file, mime_type))
+		elif args.command == 'prune-media':
+			print("Removed %d files" % notecards.prune_media(), file=sys.stderr)
+		elif args.command == 'backup':
+			print("Freed %d pages" % notecards.maintenance.compact(), file=sys.stderr)
+			print(notecards.maintenance.backup())
+		else:
+			for deck_id, name, count in notecards.get_decks():
+				print(encode(u"%d\t%s\t%d" % (deck_id, name, count)))
+	finally:
+		if args.stats:
+			notecards.flush()
+			json.dump(notecards.stats(), sys.stderr, indent=1, sort_keys=True)
+			print(file=sys.stderr)
+		notecards.close()
@@ -0,0 +1,14 @@
+"""Where Lexiconner keeps its files.
+"""
+import os
+
+APP_NAME = 'Lexiconner'
+HOME_DIR = os.getenv("HOME") 
+CONFIG_DIR = os.path.join(HOME_DIR, '.config', APP_NAME)
+DATABASE_FILE = os.path.join(CONFIG_DIR, APP_NAME + '.db')
+SOCKET_FILE = os.path.join(CONFIG_DIR, APP_NAME + '.sock')		#Where lexiconner.server listens
+
+
+def make_config_dir():
+	if not os.path.isdir(CONFIG_DIR):
+		os.makedirs(CONFIG_DIR)
@@ -0,0 +1,524 @@
+"""safeDatabase, which serializes every statement through one writer thread, and its readers.
+"""
+import re
+import sys
+import time
+import bisect
+import sqlite3
+import threading
+import traceback
+try:
+    from Queue import Queue, Empty
+except ImportError:     #Python 3, for lexiconner.aio
+    from queue import Queue, Empty
+
+#Applied to every connection when safeDatabase runs with readers
+POOL_PRAGMAS = {'synchronous': 'NORMAL', 'cache_size': -8000, 'mmap_size': 64 * 1024 * 1024}
+
+#Statements SQLite won't run inside a transaction, or that shouldn't wait for the write lock
+#one takes; the writer commits first and runs them on their own
+OUTSIDE_TRANSACTION = re.compile(r'\s*(VACUUM\b|PRAGMA\s+(wal_checkpoint|incremental_vacuum|data_version)\b)', re.I)
+#Statements that work a step at a time without returning columns, which Python 3 stops after the
+#first step. executescript() runs them to the end, but commits first and returns no rows
+RUN_TO_END = re.compile(r'\s*PRAGMA\s+incremental_vacuum\b', re.I)
+
+
+def is_busy(error):
+    """True if error is SQLite saying another connection holds the lock, which may go away.
+    """
+    message = str(error)
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+
+class EndOfStream(object):
+    """Put on a result queue by the worker once a statement has sent all of its rows.
+    """
+
+class Many(object):
+    """Wraps the parameter sequences of an executemany() request. rows may be a generator,
+    it is consumed in the worker thread.
+    """
+    def __init__(self, rows):
+        self.rows = rows
+
+class Steps(object):
+    """Statements, as (req, arg) pairs, that the worker runs back to back as one request,
+    inside a savepoint, so nothing gets in between and either all of them go in or none do.
+    arg may be Many. The rows of the last one are sent back. Queue it with execute(Steps(...)).
+    """
+    def __init__(self, *steps):
+        self.steps = steps
+        self.req = '; '.join(req for req, arg in steps)      #What stats() files it under
+
+class WorkerError(object):
+    """Put on a result queue instead of rows when the worker failed to run a statement.
+    The caller re-raises self.error.
+    """
+    def __init__(self, error):
+        self.error = error
+
+
+class QueryStats(object):
+    """Counters for every statement template run by a safeDatabase: how long it waited in
+    its queue, how long SQLite took to run it and how many rows it returned, plus how deep
+    the queues were, how the writer's batches were committed and how long it waited for
+    other processes. Shared by the writer and the readers, so everything goes through
+    self.lock.
+    """
+    BUCKETS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)     #Histogram upper bounds in ms, the last bucket takes the rest
+    MAX_TEMPLATES = 1000        #Beyond that new statements are counted under 'other'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.templates = {}         #Statement as queued -> template
+        self.reset()
+    def reset(self):
+        with self.lock:
+            self.queries = {}
+            self.queues = {}
+            self.commits = {'count': 0, 'statements': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            self.busy = {'waits': 0, 'total_ms': 0.0, 'failures': 0}
+    def template(self, req):
+        """Strips what varies between calls of the same statement: whitespace and the
+        length of (?, ?, ?) lists.
+        """
+        template = self.templates.get(req)
+        if template is None:
+            template = re.sub(r'\?(\s*,\s*\?)+', '?, ...', ' '.join(req.split()))
+            if len(self.templates) < self.MAX_TEMPLATES:
+                self.templates[req] = template
+        return template
+    def dequeued(self, queue, depth):
+        """Records that a statement left queue with depth statements still behind it.
+        """
+        with self.lock:
+            counts = self.queues.setdefault(queue, {'dequeued': 0, 'total_depth': 0, 'max_depth': 0})
+            counts['dequeued'] += 1
+            counts['total_depth'] += depth
+            counts['max_depth'] = max(counts['max_depth'], depth)
+    def record(self, req, wait, elapsed, rows, error=False):
+        """Adds one run of req, wait and elapsed in seconds.
+        """
+        template = self.template(req)
+        wait, elapsed = wait * 1000, elapsed * 1000
+        with self.lock:
+            counts = self.queries.get(template)
+            if counts is None:
+                if len(self.queries) >= self.MAX_TEMPLATES:
+                    template = 'other'
+                    counts = self.queries.get(template)
+                if counts is None:
+                    counts = self.queries[template] = {'calls': 0, 'errors': 0, 'rows': 0, 'wait_total_ms': 0.0, 'wait_max_ms': 0.0,
+                        'exec_total_ms': 0.0, 'exec_max_ms': 0.0, 'histogram': [0] * (len(self.BUCKETS) + 1)}
+            counts['calls'] += 1
+            counts['errors'] += error
+            counts['rows'] += rows
+            counts['wait_total_ms'] += wait
+            counts['wait_max_ms'] = max(counts['wait_max_ms'], wait)
+            counts['exec_total_ms'] += elapsed
+            counts['exec_max_ms'] = max(counts['exec_max_ms'], elapsed)
+            counts['histogram'][bisect.bisect_left(self.BUCKETS, elapsed)] += 1
+    def committed(self, statements, elapsed):
+        elapsed *= 1000
+        with self.lock:
+            self.commits['count'] += 1
+            self.commits['statements'] += statements
+            self.commits['total_ms'] += elapsed
+            self.commits['max_ms'] = max(self.commits['max_ms'], elapsed)
+    def waited(self, elapsed, failed=False):
+        """Records a wait for another process to let go of the database, and whether it never did.
+        """
+        with self.lock:
+            self.busy['waits'] += 1
+            self.busy['total_ms'] += elapsed * 1000
+            self.busy['failures'] += failed
+    def snapshot(self):
+        """Returns a copy of everything, with the histograms as [upper bound, count] pairs.
+        Plain dicts, lists and numbers, ready for json.dump.
+        """
+        labels = ['<=%gms' % bound for bound in self.BUCKETS] + ['>%gms' % self.BUCKETS[-1]]
+        with self.lock:
+            queries = {}
+            for template, counts in self.queries.items():
+                counts = dict(counts)
+                counts['histogram'] = [list(bucket) for bucket in zip(labels, counts['histogram'])]
+                queries[template] = counts
+            queues = dict((name, dict(counts)) for name, counts in self.queues.items())
+            return {'queries': queries, 'queues': queues, 'commits': dict(self.commits), 'busy': dict(self.busy)}
+
+
+class safeDatabase(threading.Thread):
+    """Runs every statement on a single connection owned by its own thread.
+
+    Statements are committed in groups: the worker keeps executing whatever is
+    waiting in self.reqs inside one transaction. For flush_interval seconds after
+    the first statement of the batch it waits for more, even once the queue is
+    empty; after that it commits as soon as the queue runs dry. A flush() cuts the
+    wait short, and a batch of max_batch statements is committed straight away.
+
+    Results travel back in lists of up to chunk_size rows, followed by an
+    EndOfStream, or a WorkerError if the statement failed.
+
+    Databases on disk are switched to WAL, so other processes can read while this one
+    writes. With readers > 0 that many extra connections, each in its own readerThread,
+    answer read(). They only see committed data, so they never wait behind the writer
+    or each other.
+
+    Batches start with BEGIN IMMEDIATE, taking the write lock up front, so a
+    batch never finds another process wrote first once it's under way. While
+    another process holds the lock, SQLite waits up to busy_timeout seconds, then the
+    worker tries again after a pause twice as long as the last, for up to busy_retry
+    seconds in all. A BEGIN IMMEDIATE that takes longer than BUSY_WAIT, SQLite's own
+    waiting included, is counted in stats() as a wait.
+
+    execute() returns a ticket for the statement, is_committed() tells when it has
+    been committed and so is visible to the readers.
+
+    VACUUM, checkpoints and incremental_vacuum can't be part of a transaction, the
+    batch before them is committed and they run by themselves, as does data_version.
+
+    Every statement is timed into self.query_stats, see stats(). Those that run for
+    longer than slow_query seconds are written to slow_log (standard error by default)
+    with their parameters and query plan.
+    """
+    RETRY_DELAY = 0.01      #First pause before trying a busy database again, in seconds
+    MAX_RETRY_DELAY = 1.0
+    BUSY_WAIT = 0.01        #Taking the write lock any slower than that means another process had it
+    def __init__(self, db, flush_interval=0.0, max_batch=1000, chunk_size=256, readers=0, pragmas=None, slow_query=None, slow_log=None,
+                 busy_timeout=5.0, busy_retry=60.0):
+        super(safeDatabase, self).__init__()
+        self.db=db
+        self.flush_interval=flush_interval
+        self.max_batch=max_batch
+        self.chunk_size=chunk_size
+        if db == ':memory:':
+            readers = 0         #Every connection would get its own empty database
+        self.wal=db != ':memory:'
+        self.busy_timeout=busy_timeout
+        self.busy_retry=busy_retry
+        self.pragmas=POOL_PRAGMAS if pragmas is None and readers else pragmas or {}
+        self.reqs=Queue()
+        self.read_reqs=Queue()
+        self.lock=threading.Lock()      #Keeps tickets in the order of self.reqs
+        self.queued=0           #Statements put on self.reqs so far, the last ticket
+        self.dequeued=0         #Statements taken off self.reqs by the worker so far
+        self.committed=0        #Tickets up to this one are committed, or failed
+        self.error=None         #First failure of a statement nobody waited for, reported by flush()
+        self.query_stats=QueryStats()
+        self.slow_query=slow_query
+        self.slow_log=slow_log
+        self.start()
+        self.readers=[readerThread(self) for i in range(readers)]
+    def connect(self):
+        """Opens a connection to self.db with self.pragmas applied.
+        """
+        cnx = sqlite3.connect(self.db, timeout=self.busy_timeout)
+        for name, value in self.pragmas.items():
+            cnx.execute('PRAGMA %s=%s' % (name, value))
+        return cnx
+    def serve(self, cursor, req, arg, res, queued):
+        """Runs one queued statement on cursor, times it and reports it if it was slow.
+        """
+        start = time.time()
+        try:
+            if isinstance(arg, Many):
+                rows, elapsed = self.send_many(cursor, req, arg.rows, res)
+            elif isinstance(arg, Steps):
+                rows, elapsed = self.send_steps(cursor, arg.steps, res)
+            else:
+                rows, elapsed = self.send(cursor, req, arg, res)
+        except Exception:
+            self.query_stats.record(req, start - queued, time.time() - start, 0, error=True)
+            raise
+        self.query_stats.record(req, start - queued, elapsed, rows)
+        if self.slow_query is not None and elapsed > self.slow_query:
+            self.log_slow(cursor, req, arg, start - queued, elapsed, rows)
+    def send(self, cursor, req, arg, res):
+        """Runs req and sends its rows to res in chunks, followed by EndOfStream. Returns
+        the number of rows and the time spent in SQLite, not waiting on res.
+        """
+        start = time.time()
+        if RUN_TO_END.match(req):
+            cursor.executescript(req)
+        else:
+            cursor.execute(req, arg)
+        elapsed = time.time() - start
+        count = 0
+        if res:
+            while True:
+                start = time.time()
+                rows = cursor.fetchmany()
+                elapsed += time.time() - start
+                if not rows:
+                    break
+                count += len(rows)
+                res.put(rows)
+            res.put(EndOfStream)
+        return count, elapsed
+    def send_many(self, cursor, req, rows, res):
+        """Runs req for every item of rows inside a savepoint, so that either all of them
+        go in or none do, then sends EndOfStream. Returns like send.
+        """
+        start = time.time()
+        cursor.execute('SAVEPOINT many')
+        try:
+            cursor.executemany(req, rows)
+        except:
+            cursor.execute('ROLLBACK TO many')
+            raise
+        finally:
+            cursor.execute('RELEASE many')
+        elapsed = time.time() - start
+        if res:
+            res.put(EndOfStream)
+        return 0, elapsed
+    def send_steps(self, cursor, steps, res):
+        """Runs each (req, arg) of steps in turn inside a savepoint, all or nothing, then sends
+        the rows of the last one. Returns like send.
+        """
+        start = time.time()
+        cursor.execute('SAVEPOINT steps')
+        try:
+            for req, arg in steps:
+                if isinstance(arg, Many):
+                    cursor.executemany(req, arg.rows)
+                else:
+                    cursor.execute(req, arg or tuple())
+            rows = cursor.fetchall()        #Before RELEASE resets the cursor
+        except:
+            cursor.execute('ROLLBACK TO steps')
+            raise
+        finally:
+            cursor.execute('RELEASE steps')
+        elapsed = time.time() - start
+        if res:
+            for first in range(0, len(rows), self.chunk_size):
+                res.put(rows[first:first + self.chunk_size])
+            res.put(EndOfStream)
+        return len(rows), elapsed
+    def log_slow(self, cursor, req, arg, wait, elapsed, rows):
+        """Writes a slow statement to slow_log, with the plan SQLite chose for it.
+        """
+        log = self.slow_log or sys.stderr
+        log.write("Slow query: %.1f ms, waited %.1f ms, %d rows\n" % (elapsed * 1000, wait * 1000, rows))
+        log.write("    %s\n" % ' '.join(req.split()))
+        if isinstance(arg, (Many, Steps)):
+            log.write("    parameters: %s\n" % ('executemany' if isinstance(arg, Many) else 'steps'))
+            return
+        log.write("    parameters: %r\n" % (arg,))
+        if req.split(None, 1)[0].upper() not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH'):
+            return          #Nothing to plan
+        try:
+            plan = cursor.connection.execute('EXPLAIN QUERY PLAN ' + req, arg).fetchall()
+        except sqlite3.Error as e:
+            plan = [(None, None, None, "no plan: %s" % e)]
+        for row in plan:
+            log.write("    plan: %s\n" % row[-1])
+    def run(self):
+        cnx = self.connect()
+        #Only takes effect on a new database, so Maintenance can hand back the pages deletes free
+        cnx.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        if self.wal:
+            self.retry(cnx.execute, ['PRAGMA journal_mode=WAL'])
+        cnx.isolation_level = None      #We do our own BEGIN/COMMIT
+        cursor = cnx.cursor()
+        cursor.arraysize = self.chunk_size
+        waiters = []        #Queues of flush() callers waiting for the next commit
+        pending = 0         #Statements run since the last commit
+        deadline = 0
+        while True:
+            if pending or waiters:
+                try:
+                    req, arg, res, queued = self.reqs.get(timeout=max(deadline - time.time(), 0))
+                except Empty:
+                    pending = self._commit(cursor, pending, waiters)
+                    continue
+            else:
+                req, arg, res, queued = self.reqs.get()
+                deadline = time.time() + self.flush_interval
+            self.dequeued += 1
+            if req == '--close--':
+            	break
+            if req == '--flush--':
+                waiters.append(res)
+                deadline = 0        #Somebody is waiting, commit as soon as the queue is empty
+                continue
+            self.query_stats.dequeued('writer', self.reqs.qsize())
+            try:
+                if OUTSIDE_TRANSACTION.match(req):
+                    pending = self._commit(cursor, pending, waiters)
+                    self.retry(self.serve, [cursor, req, arg, res, queued])
+                    continue
+                if not pending:
+                    self.retry(cursor.execute, ['BEGIN IMMEDIATE'], busy_wait=self.BUSY_WAIT)
+                    pending = 1
+                else:
+                    pending += 1
+                self.serve(cursor, req, arg, res, queued)
+            except Exception as e:
+                #Don't let one bad statement kill the thread everybody else is waiting on
+                if res:
+                    res.put(WorkerError(e))
+                else:
+                    traceback.print_exc()
+                    self.error = self.error or e
+            if pending >= self.max_batch:
+                pending = self._commit(cursor, pending, waiters)
+        self._commit(cursor, pending, waiters)          #Don't forget this
+        cnx.close()
+    def retry(self, function, args, busy_wait=None):
+        """Calls function(*args) until the database isn't busy any more, pausing in between,
+        or until busy_retry seconds have gone by; then the error is raised. A call that had
+        to be tried again is counted as a wait, and so is one that took longer than busy_wait
+        seconds, if given: SQLite waits up to busy_timeout inside it before giving up.
+        """
+        start = time.time()
+        delay = self.RETRY_DELAY
+        waited = False
+        while True:
+            try:
+                result = function(*args)
+            except sqlite3.OperationalError as e:
+                if not is_busy(e):
+                    raise
+                if time.time() + delay - start > self.busy_retry:
+                    self.query_stats.waited(time.time() - start, failed=True)
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, self.MAX_RETRY_DELAY)
+                waited = True
+                continue
+            elapsed = time.time() - start
+            if waited or busy_wait is not None and elapsed > busy_wait:
+                self.query_stats.waited(elapsed)
+            return result
+    def _commit(self, cursor, pending, waiters):
+        """Commits the current batch, wakes up everybody waiting on it and returns the new pending count.
+        """
+        if pending:
+            start = time.time()
+            try:
+                cursor.execute('COMMIT')
+                self.query_stats.committed(pending, time.time() - start)
+            except sqlite3.Error as e:
+                traceback.print_exc()
+                self.error = self.error or e
+                try:
+                    cursor.execute('ROLLBACK')
+                except sqlite3.Error:
+                    pass        #SQLite already rolled it back
+        self.committed = self.dequeued
+        if waiters:
+            reply = WorkerError(self.error) if self.error else EndOfStream
+            self.error = None
+            while waiters:
+                waiters.pop().put(reply)
+        return 0
+    def execute(self, req, arg=None, res=None):
+        """Queues req, or Steps, for the worker and returns its ticket, see is_committed().
+        """
+        if isinstance(req, Steps):
+            req, arg = req.req, req
+        with self.lock:
+            self.queued += 1
+            self.reqs.put((req, arg or tuple(), res, time.time()))
+            return self.queued
+    def submit(self, req, arg=None, res=None, reader=False):
+        """Queues req, for the readers if reader and there are any. Its rows, then EndOfStream
+        or a WorkerError, are put on res, which can be anything with a put() that's safe to
+        call from another thread. Returns the ticket if it went to the writer.
+        """
+        if reader and self.readers:
+            self.read_reqs.put((req, arg or tuple(), res, time.time()))
+        else:
+            return self.execute(req, arg, res)
+    def is_committed(self, ticket):
+        """True once the statement execute() returned ticket for has been committed, or
+        has failed. Until then the readers may not see what it did.
+        """
+        return self.committed >= ticket
+    def executemany(self, req, rows):
+        """Runs req for every parameter sequence in rows, all or nothing. Blocks until it is
+        done and re-raises the error if there was one.
+        """
+        for chunk in self.stream(req, Many(rows)):
+            pass
+    def stream(self, req, arg=None, reader=False, maxsize=0):
+        """Like select, but yields the rows in lists of up to chunk_size rows. reader sends
+        it to the readers if there are any, see read(). With maxsize the connection stops
+        once that many chunks are waiting to be picked up.
+        """
+        res=Queue(maxsize)
+        self.submit(req, arg, res, reader)
+        done = False
+        try:
+            while True:
+                chunk=res.get()
+                if chunk is EndOfStream or isinstance(chunk, WorkerError):
+                    done = True
+                    if chunk is EndOfStream: break
+                    raise chunk.error
+                yield chunk
+        finally:
+            #If we are abandoned halfway, the worker must not be left blocked on a full queue
+            while maxsize and not done:
+                chunk=res.get()
+                done = chunk is EndOfStream or isinstance(chunk, WorkerError)
+    def select(self, req, arg=None):
+        for chunk in self.stream(req, arg):
+            for rec in chunk:
+                yield rec
+    def read(self, req, arg=None):
+        """Like select, but answered by one of the readers if there are any. Writes
+        still waiting to be committed are not visible.
+        """
+        for chunk in self.stream(req, arg, reader=True):
+            for rec in chunk:
+                yield rec
+    def flush(self):
+        """Blocks until every statement queued before this call has been committed.
+        Raises the first error of a statement nobody was waiting for, if there was one.
+        """
+        res = Queue()
+        self.execute('--flush--', res=res)
+        reply = res.get()
+        if isinstance(reply, WorkerError): raise reply.error
+    def stats(self, reset=False):
+        """Returns what self.query_stats has counted so far, plus how many statements are
+        waiting right now. reset starts counting afresh.
+        """
+        stats = self.query_stats.snapshot()
+        stats['queues'].setdefault('writer', {})['depth'] = self.reqs.qsize()
+        if self.readers:
+            stats['queues'].setdefault('readers', {})['depth'] = self.read_reqs.qsize()
+        if reset:
+            self.query_stats.reset()
+        return stats
+    def close(self):
+        for reader in self.readers:
+            self.read_reqs.put(('--close--', None, None, None))
+        self.execute('--close--')  
+
+
+class readerThread(threading.Thread):
+    """Serves safeDatabase.read() requests on its own connection.
+    """
+    def __init__(self, database):
+        super(readerThread, self).__init__()
+        self.database=database
+        self.start()
+    def run(self):
+        cnx = self.database.connect()
+        cnx.execute('PRAGMA query_only=1')
+        cursor = cnx.cursor()
+        cursor.arraysize = self.database.chunk_size
+        while True:
+            req, arg, res, queued = self.database.read_reqs.get()
+            if req == '--close--':
+                break
+            self.database.query_stats.dequeued('readers', self.database.read_reqs.qsize())
+            try:
+                self.database.serve(cursor, req, arg, res, queued)
+            except Exception as e:
+                res.put(WorkerError(e))
+        cnx.close()
@@ -0,0 +1,800 @@
+"""The indicator and its windows. Importing this needs gtk, appindicator and pynotify and a display,
+so only main() does it.
+"""
+import os
+import threading
+import collections
+import gtk
+import gobject
+import pango
+import appindicator
+import pynotify
+
+from lexiconner.config import APP_NAME, DATABASE_FILE, make_config_dir
+from lexiconner.mainloop import JobScheduler, WorkerPool
+from lexiconner.notecards import NotecardsHandler
+
+
+class ChoiceButton(gtk.Button):
+	"""Class that inherits from gtk.Button. This class hanldes colors. It takes it's content as a 
+	   parameter.
+	"""
+	def __init__(self, content):
+		gtk.Button.__init__(self)
+		self.setup_colors()
+
+		#We can't directly use button.set_label because we want to prettify the label
+		content_label = gtk.Label()
+		content_label.set_line_wrap(True)
+		content_label.set_markup('<span color="white" size="20000"> %s </span>' %content)
+		content_label.set_alignment(0.5,0.5)
+		content_label.set_width_chars(37)
+		self.add(content_label)
+		self.show_all()
+
+
+	def setup_colors(self):
+		"""Just setting up the colors of the button for different states.
+		"""
+		normal_color = gtk.gdk.color_parse("#2a7b7d")
+		self.modify_bg(gtk.STATE_NORMAL, normal_color)
+		active_color = gtk.gdk.color_parse("#29a0a2")
+		self.modify_bg(gtk.STATE_ACTIVE ,active_color)
+		prelight_color = gtk.gdk.color_parse("#3ba1a2") 
+		self.modify_bg(gtk.STATE_PRELIGHT, prelight_color)
+		insensitive_color = gtk.gdk.color_parse("#143637")
+		self.modify_bg(gtk.STATE_INSENSITIVE, insensitive_color)
+
+class MyWindow(gtk.Window):
+	"""Class that creates inherits form gtk.Window and sets background color.
+	"""
+	def __init__(self):
+		gtk.Window.__init__(self)
+		color = gtk.gdk.color_parse("#0c1021")
+		self.modify_bg(gtk.STATE_NORMAL, color)
+		self.connect("destroy", self.quit)
+		self.show()
+
+	def quit(self, window):
+		self.destroy()
+
+class ImageCache(object):
+	"""Decoded images of notecard media by digest, most recently used last, holding up to
+		max_bytes of pixels. Images are decoded as they're read from the MediaStore, a chunk
+		at a time, and scaled down to fit max_size on the way, so a huge photo is never in
+		memory whole. Safe to use from the workers, it touches no widget.
+	"""
+	def __init__(self, media, max_bytes=32 * 1024 * 1024, max_size=480):
+		self.media = media
+		self.max_bytes = max_bytes
+		self.max_size = max_size
+		self.lock = threading.Lock()
+		self.images = collections.OrderedDict()
+		self.bytes = 0
+
+	def get(self, digest):
+		"""Returns the pixbuf of digest, or None if it can't be read as an image.
+		"""
+		with self.lock:
+			pixbuf = self.images.pop(digest, None)
+			if pixbuf is not None:
+				self.images[digest] = pixbuf
+				return pixbuf
+		pixbuf = self.load(digest)		#Not holding the lock, it may take a while
+		if pixbuf is None:
+			return None
+		with self.lock:
+			if digest not in self.images:
+				self.images[digest] = pixbuf
+				self.bytes += self.size(pixbuf)
+			while self.bytes > self.max_bytes and len(self.images) > 1:
+				self.bytes -= self.size(self.images.popitem(last=False)[1])
+		return pixbuf
+
+	def size(self, pixbuf):
+		return pixbuf.get_rowstride() * pixbuf.get_height()
+
+	def load(self, digest):
+		loader = gtk.gdk.PixbufLoader()
+		loader.connect("size-prepared", self.on_size_prepared)
+		try:
+			for chunk in self.media.chunks(digest):
+				loader.write(chunk)
+			loader.close()
+		except (gobject.GError, IOError, OSError) as e:
+			print "Couldn't load image %s: %s" % (digest, e)
+			return None
+		return loader.get_pixbuf()
+
+	def on_size_prepared(self, loader, width, height):
+		scale = min(1.0, float(self.max_size) / max(width, height, 1))
+		if scale < 1:
+			loader.set_size(max(1, int(width * scale)), max(1, int(height * scale)))
+
+class QuestionWindow(MyWindow):
+	def __init__(self, master, perpetual, card_id, front, answer_index, *choices):
+		"""
+		master:			The master Lexiconner class that launched this window.
+		perpetual:		Whether to ask another question once this one is answered.
+		card_id:		The id of the notecard in question, the answer is reported to the scheduler.
+		front: 	  		The front of the notecard in question, most probably a single word.
+		answer_index:	An integer value indicating which choice is the correct answer.
+		choices:		An arbitrary number of choices, among which is the corect answer.
+		"""
+
+		MyWindow.__init__(self)
+		self.master = master
+		self.perpetual = perpetual
+		self.card_id = card_id
+		self.answer_index = answer_index
+		self.answered = False
+
+		self.vbox = gtk.VBox(homogeneous=True, spacing=0)			#Contains all elements
+		self.add(self.vbox)
+
+		self.front_label = gtk.Label() 							#Self explanatory self.front_label.set_alignment(0.5,0.5)					#Center the question
+		self.front_label.set_markup(
+			'<markup><span color="white" size="100000" face="ubuntu">%s </span></markup>' % front)
+
+		self.front_label.set_line_wrap(True)
+		self.vbox.pack_start(self.front_label, True, True, 0)
+							# child				,expand, fill, padding)
+
+		self.image_box = gtk.HBox(homogeneous=False, spacing=10)		#The notecard's images, if it has any
+		self.vbox.pack_start(self.image_box, True, True, 0)
+
+		self.choice_box = gtk.HBox(homogeneous=True, spacing=10)	#Contains the choices
+		self.vbox.pack_start(self.choice_box, True, True, 0)
+
+		#For each choice we have, create a button
+		for index, content in enumerate(choices):
+			choice_button = ChoiceButton(content)
+			choice_button.index = index 				#This is is the index of the answer
+			connect_id = choice_button.connect("clicked", self.on_choice_clicked)		#We need the id to disconnect later
+			choice_button.id = connect_id
+			self.choice_box.pack_start(choice_button, True, True, 5)
+
+		# I looove graphics in python
+		# Honestly, even I can't tell if that comment(pun intended) was sarcastic or not.
+		self.maximize()
+		self.show_all()
+		self.image_box.hide()
+
+	def show_images(self, pixbufs):
+		for pixbuf in pixbufs:
+			self.image_box.pack_start(gtk.image_new_from_pixbuf(pixbuf), True, False, 0)
+		if pixbufs:
+			self.image_box.show_all()
+
+	def on_choice_clicked(self, button):
+		"""When a choice button is clicked, this function is called and checks if the choice is right.
+			If so, it removes all other choices and makes sure when the button is clicked again, it 
+			destroys the window. If it's the wrong choice, the button is deactivated.
+		"""
+		if not self.answered:		#Only the first try counts
+			self.master.notecards.scheduler.record(self.card_id, button.index == self.answer_index)
+			self.answered = True
+
+		if button.index != self.answer_index:		#  Next time :(
+			button.set_sensitive(False)				
+		else:
+			#Remove all other choices! We have the right one!
+			for b in self.choice_box.get_children():
+				if b.index != self.answer_index:
+					self.choice_box.remove(b) 
+
+			button.disconnect(button.id)
+
+			if self.perpetual:
+				button.connect("clicked", self.master.new_question_window, True)		# self.master will handle launching another window if necessary
+
+			#I suffered for hours because I couldn't figure out the callback above wasn't being called because the window was destroyed before getting to it.
+			button.connect("clicked", self.quit)
+
+class GUIManager(threading.Thread):
+	"""Threading support for gtk
+	"""
+
+	def __init__(self):
+		threading.Thread.__init__(self)
+		self.start()
+
+	def run(self):
+		gtk.main()
+
+class Lexiconner():
+	"""Manages the app indicator and the timely launch.
+	"""
+	SCHEDULE_FLUSH = 60		#Seconds between writing out the reviews the scheduler holds
+	MAINTENANCE_INTERVAL = 60 * 60		#Seconds between compactions
+	BACKUP_INTERVAL = 24 * 60 * 60
+	POLL_INTERVAL = 2		#Seconds between looking for what other processes wrote
+	def __init__(self, database_file):
+		self.database_file = database_file
+		self.notecards = NotecardsHandler(database_file, readers=2, prefetch=3,		#Quizzes don't wait behind the edit window
+										snapshot_file=os.path.splitext(database_file)[0] + '.snapshot',		#Nor on the database at all
+										similar=True)
+		self.jobs = JobScheduler(gobject)		#Everything timed runs off this, on the main loop
+		self.images = ImageCache(self.notecards.media)
+		self.workers = WorkerPool(gobject)		#And anything that could block goes here
+		self.timer = None 		# The quiz Job
+		self.jobs.every(self.SCHEDULE_FLUSH, self.workers.submit, self.notecards.scheduler.flush)
+		self.jobs.every(self.MAINTENANCE_INTERVAL, self.workers.submit, self.notecards.maintenance.run, (self.BACKUP_INTERVAL,))
+		self.polling = False		#A poll() on a worker right now
+		self.jobs.every(self.POLL_INTERVAL, self.poll)
+		self.edit_window = False 		#Haven't launched it yet
+		self.current_interval = 0
+		self.build_indicator()
+		self.notify()
+
+	def poll(self):
+		"""Has a worker catch up with what other processes wrote, unless one still is: after a
+			big import that takes longer than POLL_INTERVAL. It comes back in on_poll().
+		"""
+		if self.polling:
+			return
+		self.polling = True
+		self.workers.submit(self.notecards.poll, (), callback=self.on_poll, errback=self.on_poll_failed)
+
+	def on_poll(self, changes):
+		self.polling = False
+		if changes != {} and self.edit_window:
+			self.edit_window.sync()		#Rather than wait for its own turn
+
+	def on_poll_failed(self, error):
+		self.polling = False
+		print "Couldn't catch up with the other processes: %s" % error
+
+	def notify(self):
+		notification = pynotify.Notification("Lexiconner!", "Lexiconner is ready. Use the icon above on the panel to set a timer or launch a question.")
+		notification.show()
+
+	def build_indicator(self):
+		self.ind = appindicator.Indicator("example-simple-client", "indicator-messages", appindicator.CATEGORY_APPLICATION_STATUS)
+		self.ind.set_status (appindicator.STATUS_ACTIVE)
+		self.ind.set_attention_icon ("indicator-messages-new")
+		self.ind.set_icon("distributor-logo")
+		self.menu = gtk.Menu()
+		self.ind.set_menu(self.menu)
+
+		ask_now_menuitem = gtk.MenuItem("Ask now")
+		ask_now_menuitem.connect("activate", self.new_question_window, True)		#The callback data means it will launch in "perpetual mode"
+
+		set_timer_menuitem = gtk.MenuItem("Set timer")
+		timer_submenu = gtk.Menu()
+		set_timer_menuitem.set_submenu(timer_submenu)
+
+		self.current_timer_menu_item = None
+
+		for minute in [5, 10, 15, 30, 45, 60]:
+			timer_menuitem = gtk.CheckMenuItem("{0} minutes".format(minute))
+			timer_menuitem.connect("toggled", self.on_timer_changed, minute)
+			timer_submenu.append(timer_menuitem)
+
+		decks_menuitem = gtk.MenuItem("Decks")
+		self.decks_submenu = gtk.Menu()
+		decks_menuitem.set_submenu(self.decks_submenu)
+		decks_menuitem.connect("activate", self.build_decks_menu)		#Fresh counts every time it opens
+		self.deck_menuitems = {}
+		self.build_decks_menu()
+
+		edit_menu_item = gtk.MenuItem("Edit notecards")
+		edit_menu_item.connect("activate", self.on_edit_clicked)
+
+    	# Why would anyone want to quit? Anyways,
+		quit_menu_item = gtk.MenuItem("Exit")
+		quit_menu_item.connect("activate", self.quit)
+
+		for item in [ask_now_menuitem, set_timer_menuitem, decks_menuitem, edit_menu_item, quit_menu_item]:
+			self.menu.append(item)
+
+		self.menu.show_all()
+
+	def new_question_window(self, widget = None, perpetual=False):
+		#Usually one is already waiting, but if not the database could take a while
+		self.workers.submit(self.ready_question, callback=lambda question: self.show_question(question, perpetual))
+
+	def ready_question(self):
+		"""Runs on a worker: returns the next question and the images of its notecard, see
+			NotecardsHandler.ready_question().
+		"""
+		question = self.notecards.ready_question()
+		if question is None:
+			return None
+		images = [self.images.get(digest) for digest, mime_type, size in self.notecards.get_media(question[0])
+					if mime_type.startswith('image/')]
+		return question, [image for image in images if image is not None]
+
+	def show_question(self, question, perpetual=False):
+		#Check if we have any notecards
+		if question is None:
+			a = gtk.MessageDialog(flags=gtk.DIALOG_MODAL | gtk.DIALOG_DESTROY_WITH_PARENT, type=gtk.MESSAGE_WARNING, message_format="You have no notecards. Please add some.")
+			a.show()
+			return
+
+		(card_id, question), images = question
+
+		#In perpetual mode the window will call us back once it's answered
+		window = QuestionWindow(self, perpetual, card_id, *question)
+		window.show_images(images)
+
+	def build_decks_menu(self, widget=None):
+		"""Has a worker read the decks, the submenu is filled with them in fill_decks_menu().
+		"""
+		self.workers.submit(self.notecards.get_decks, callback=self.fill_decks_menu, errback=self.on_decks_failed)
+
+	def on_decks_failed(self, error):
+		print "Couldn't read the decks: %s" % error
+
+	def fill_decks_menu(self, decks):
+		"""Fills the decks submenu: "All decks", then a check item for each of decks. The None
+			key of self.deck_menuitems is "All decks".
+		"""
+		for item in self.decks_submenu.get_children():
+			self.decks_submenu.remove(item)
+		self.deck_menuitems = {None: gtk.CheckMenuItem("All decks")}
+		self.decks_submenu.append(self.deck_menuitems[None])
+		self.decks_submenu.append(gtk.SeparatorMenuItem())
+		for deck_id, name, count in decks:
+			self.deck_menuitems[deck_id] = gtk.CheckMenuItem("{0} ({1})".format(name.encode('utf-8'), count))
+			self.decks_submenu.append(self.deck_menuitems[deck_id])
+		self.show_selected_decks()
+		for deck_id, item in self.deck_menuitems.items():
+			item.connect("toggled", self.on_deck_toggled, deck_id)
+		self.decks_submenu.show_all()
+
+	def show_selected_decks(self):
+		"""Sets the check of every deck item to whether it's selected, without reacting to it.
+		"""
+		self.updating_decks = True
+		selected = self.notecards.selected_decks()
+		for deck_id, item in self.deck_menuitems.items():
+			item.set_active(selected is None if deck_id is None else selected is not None and deck_id in selected)
+		self.updating_decks = False
+
+	def on_deck_toggled(self, menuitem, deck_id):
+		"""Switches to the decks checked. Unchecking the last one, or checking "All decks", means all of them.
+		"""
+		if self.updating_decks:
+			return
+		selected = set(self.notecards.selected_decks() or [])
+		if deck_id is None:
+			selected = set()
+		elif menuitem.get_active():
+			selected.add(deck_id)
+		else:
+			selected.discard(deck_id)
+		self.notecards.select_decks(selected or None)
+		self.show_selected_decks()
+		if self.edit_window:
+			self.edit_window.reload()
+
+	def on_edit_clicked(self, widget):
+		if self.edit_window:		#One is already launched
+			self.edit_window.present()	#Just switch to that window
+		else:
+			self.edit_window = EditNotecardsWindow(self)		#Passing self as an argument
+
+	def on_timer_changed(self, menuitem, minutes):
+		if not menuitem.get_active():	#Being turned off
+			if self.timer:
+				self.timer.cancel()
+				self.timer = None
+			self.current_timer_menu_item = None
+			self.current_interval = 0
+			return
+
+		self.current_interval = minutes
+
+		#Delete previous timer and turn off previous CheckMenuitem
+		if self.timer:		#If there is a timer already running
+			self.timer.cancel()
+			self.current_timer_menu_item.set_active(False)
+
+		self.timer = self.jobs.every(minutes*60, self.new_question_window)
+		self.current_timer_menu_item = menuitem
+
+	def quit(self, widget):
+		self.jobs.cancel_all()
+		self.notecards.maintenance.stop()		#A backup could take a while yet
+		self.workers.close()
+		for thread in self.workers.threads:
+			thread.join()		#Don't close the database under a question being made
+
+		self.notecards.close()
+		gtk.main_quit()
+
+class EditNotecardDialog(MyWindow):
+	def __init__(self,callback, _id, front_text="", back_text=""):
+		"""A simple Dialog with two textboxes and a button to add/edit notecards.
+		   It calls the function callback with front, back as arguments.
+		   If front and back are not set to None, it will set respective text entry boxes to their respective values.
+		"""
+		MyWindow.__init__(self)
+
+		self.set_modal = True
+		self.set_destroy_with_parent(True)
+		self.set_size_request(600,300)
+		self.set_position(gtk.WIN_POS_CENTER_ALWAYS)
+
+		self.callback = callback
+		self._id = _id
+
+		#This is needed to make the window look less wierd
+		padding = gtk.Alignment(xscale=1, yscale=1)
+		padding.set_padding(padding_top=20, padding_bottom=20, padding_left=20, padding_right=20)
+		self.add(padding)
+
+		#Blah, blah blah blah, blah blah, arrange the text entries and the buttonbox blah, blah blah . . . 
+		vbox = gtk.VBox(homogeneous=False, spacing=5)
+		padding.add(vbox)
+
+		self.front = gtk.Entry(max=20)	#A simple text entry for the front of the notecard
+		vbox.pack_start(self.front, expand=False, padding=5)
+		self.front.set_text(front_text)
+
+		self.back_textbuffer = gtk.TextBuffer()
+		self.back_textbuffer.set_text(back_text)
+
+		back = gtk.TextView(self.back_textbuffer)		#A more complicated widget, a text view for the back of the notecard
+		back.set_wrap_mode(gtk.WRAP_WORD)
+		back.set_left_margin(2)
+		back.set_right_margin(2)
+		vbox.pack_start(back, expand=True, fill=True, padding=5)
+
+		#Now for the button
+		done_button = gtk.Button("Done")
+		done_button.connect("clicked", self.on_done_clicked)
+
+		buttonbox = gtk.HButtonBox()		#Needed to align the button to the right
+		buttonbox.set_layout(gtk.BUTTONBOX_END)
+		buttonbox.add(done_button)
+		vbox.pack_start(buttonbox, expand=False)
+
+		self.show_all()
+
+	def on_done_clicked(self, widget):
+		"""Will check if there are valid values for front and back, and then ca boom.
+		"""
+		front_text = self.front.get_text()
+
+		#This is why I hate pygtk.
+		startiter = self.back_textbuffer.get_start_iter()
+		enditer = self.back_textbuffer.get_end_iter()
+		back_text = self.back_textbuffer.get_text(startiter, enditer)
+
+		if front_text and back_text:		#And this is why I love python. :)
+			self.callback(self._id, front_text, back_text)
+			self.destroy()
+		else:
+			a = gtk.MessageDialog(flags=gtk.DIALOG_MODAL | gtk.DIALOG_DESTROY_WITH_PARENT, type=gtk.MESSAGE_WARNING, message_format="Please fill out both boxes.")
+			a.show()
+
+class NotecardsModel(gtk.GenericTreeModel):
+	"""A flat tree model of (id, front, back) rows that reads them from the database a page at
+		a time, as the treeview asks for them, keeping the most recently used pages around.
+		Rows are referenced by their position. Sorting and searching happen in SQL.
+
+		self.seq is the last change in the database's change log the rows reflect. Changes
+		since then are read with fetch_changes() and applied with apply().
+	"""
+	column_types = (int, str, str)
+
+	def __init__(self, notecards, page_size=100, pages=20):
+		gtk.GenericTreeModel.__init__(self)
+		self.notecards = notecards
+		self.page_size = page_size
+		self.pages = pages
+		self.order_by = 'id'
+		self.descending = False
+		self.ids = None			#Only show these, if set
+		self.refresh()
+
+	def refresh(self):
+		"""Forgets everything read so far. Detach the model from its treeview first.
+		"""
+		self.seq = self.notecards.last_change()		#First, so no change can slip in between
+		self.cache = collections.OrderedDict()
+		self.count = len(self.ids) if self.ids is not None else self.notecards.count_notecards()
+
+	def sort(self, order_by, descending):
+		self.order_by = order_by
+		self.descending = descending
+		self.refresh()
+
+	def only(self, ids):
+		"""Shows only the notecards in ids, or all of them if ids is None.
+		"""
+		self.ids = ids
+		self.refresh()
+
+	def row(self, index):
+		number = index // self.page_size
+		page = self.cache.pop(number, None)
+		if page is None:
+			page = self.notecards.get_page(number * self.page_size, self.page_size, self.order_by, self.descending, self.ids)
+			if len(self.cache) >= self.pages:
+				self.cache.popitem(last=False)		#Least recently used
+		self.cache[number] = page
+		offset = index % self.page_size
+		return page[offset] if offset < len(page) else (-1, '', '')		#Deleted behind our back
+
+	def fetch_changes(self, seq):
+		"""Returns what apply() needs to bring the model from seq up to date. Reads the
+			database, so it's for a worker thread.
+		"""
+		last, changes = self.notecards.changes_since(seq)
+		updated = [_id for _id, change in (changes or {}).items() if change == 'u']
+		rows = self.notecards.get_page(0, len(updated), 'id', False, updated) if updated else []
+		return seq, last, changes, rows
+
+	def apply(self, seq, last, changes, rows):
+		"""Patches the rows read so far that were edited, row by row. Returns False if that's
+			not enough: rows were added or deleted, or might have moved in the sort order, and
+			the model needs refresh(). Changes to rows not read yet need nothing.
+		"""
+		if seq != self.seq:
+			return True		#Refreshed since they were asked for
+		if changes is None or 'i' in changes.values() or 'd' in changes.values():
+			return False
+		rows = dict((row[0], row) for row in rows)		#Only those still showing
+		key = ('id', 'front', 'back').index(self.order_by)
+		for number, page in self.cache.items():
+			for offset, row in enumerate(page):
+				new = rows.pop(row[0], None)
+				if new is None:
+					continue
+				if new[key] != row[key]:
+					return False
+				page[offset] = new
+				path = (number * self.page_size + offset,)
+				self.row_changed(path, self.get_iter(path))
+		if rows and key:
+			return False		#Rows not read yet may have moved onto the pages we have
+		self.seq = last
+		return True
+
+	def on_get_flags(self):
+		return gtk.TREE_MODEL_LIST_ONLY | gtk.TREE_MODEL_ITERS_PERSIST
+
+	def on_get_n_columns(self):
+		return len(self.column_types)
+
+	def on_get_column_type(self, column):
+		return self.column_types[column]
+
+	def on_get_iter(self, path):
+		return path[0] if path[0] < self.count else None
+
+	def on_get_path(self, index):
+		return (index,)
+
+	def on_get_value(self, index, column):
+		return self.row(index)[column]
+
+	def on_iter_next(self, index):
+		return index + 1 if index + 1 < self.count else None
+
+	def on_iter_children(self, parent):
+		return 0 if parent is None and self.count else None
+
+	def on_iter_has_child(self, index):
+		return False
+
+	def on_iter_n_children(self, index):
+		return self.count if index is None else 0
+
+	def on_iter_nth_child(self, parent, n):
+		return n if parent is None and n < self.count else None
+
+	def on_iter_parent(self, index):
+		return None
+
+
+class EditNotecardsWindow(MyWindow):
+	SYNC_INTERVAL = 2		#Seconds between looking for changes made elsewhere
+	def __init__(self, master):
+		"""Master is of course, the master Lexiconner class, through which we acesss the database and everything.
+		"""
+		super(EditNotecardsWindow, self).__init__()
+
+		self.master = master
+		self.build()
+		self.syncing = False		#Asking for changes right now
+		self.sync_job = master.jobs.every(self.SYNC_INTERVAL, self.sync)
+		self.set_size_request( 800, 500)
+		self.set_position(gtk.WIN_POS_CENTER_ALWAYS)
+		self.show_all()
+
+	def build(self):
+		#I need this to make the window less ugly/more beautilful
+		padding = gtk.Alignment(xscale=1, yscale=1)
+		padding.set_padding(padding_top = 20, padding_bottom=20, padding_right=30, padding_left=30)
+		self.add(padding)
+
+		vbox = gtk.VBox(homogeneous=False, spacing=20)
+		padding.add(vbox)
+
+		toolbar = gtk.Toolbar()
+		toolbar.set_style(gtk.TOOLBAR_ICONS)	#Icons only
+		toolbar.set_tooltips(True)
+		vbox.pack_start(toolbar, expand=False, padding=5)
+
+		#Add notecard toolitem
+		add_icon = gtk.Image()
+		add_icon.set_from_stock(stock_id=gtk.STOCK_ADD, size=gtk.ICON_SIZE_DIALOG)
+		toolbar.append_item(text="", tooltip_text="Add notecard", tooltip_private_text="", icon=add_icon, callback=self.on_add_clicked)
+
+		#Delete notecard toolitem
+		delete_icon = gtk.Image()
+		delete_icon.set_from_stock(stock_id=gtk.STOCK_REMOVE, size=gtk.ICON_SIZE_DIALOG)
+		toolbar.append_item(text="", tooltip_text="Delete notecard(s)", tooltip_private_text="", icon=delete_icon, callback=self.on_delete_clicked)
+
+		#Scrollable window is needed before the treeview
+		self.scrolled_window = scrolled_window = gtk.ScrolledWindow()
+		scrolled_window.set_policy(hscrollbar_policy=gtk.POLICY_AUTOMATIC, vscrollbar_policy=gtk.POLICY_AUTOMATIC)	#Automatically decide if we need scrollbars
+		vbox.pack_start(scrolled_window, expand=True, fill=True, padding=5)
+
+		#Rows are only read from the database once they scroll into view
+		self.model = NotecardsModel(self.master.notecards)
+
+		#Searching asks the database, whose indexes beat the treeview's row by row search
+		search_entry = gtk.Entry()
+		search_entry.connect("activate", self.on_search_activated)
+		toolbar.append_widget(search_entry, "Search notecards", "")
+
+		#The treeview
+		self.treeview = treeview = gtk.TreeView(model=self.model)
+		treeview.set_enable_search(False)
+		treeview.set_headers_clickable(True)			#So users can sort by header
+		treeview.set_fixed_height_mode(True)			#Otherwise it reads every row to measure it
+		scrolled_window.add(treeview)
+
+		treeview.connect("row-activated", self.on_row_clicked)		#When a row is double clicked
+
+		#Tree selection
+		self.selection = treeview.get_selection()
+		self.selection.set_mode(gtk.SELECTION_MULTIPLE)	#Make multiple items selectable
+
+		#We need the renderers 
+		text_renderer = gtk.CellRendererText()
+		text_renderer.set_property("ellipsize", pango.ELLIPSIZE_END)	#Rows all have the same height in fixed height mode
+		text_renderer.set_padding(5, 0)
+
+		#Columns
+		front_column = gtk.TreeViewColumn("Front", text_renderer, text=1)	#text=1 means fetch from second row(which is front row) of the model
+										#  header, CellRenderer,  column reference
+		back_column = gtk.TreeViewColumn("Back", text_renderer, text=2)
+
+		for column, order_by, width in [(front_column, 'front', 200), (back_column, 'back', 540)]:
+			column.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
+			column.set_fixed_width(width)
+			column.set_resizable(True)
+			column.set_clickable(True)
+			column.connect("clicked", self.on_column_clicked, order_by)		#The database does the sorting
+			treeview.append_column(column)
+
+	def reload(self, position=None):
+		"""Shows what the database holds now, after the model was changed, keeping the scroll
+			position, or going to position if the model was already taken off the treeview.
+		"""
+		if position is None:
+			position = self.scrolled_window.get_vadjustment().get_value()
+		self.write(lambda: None, on_done=lambda: self.refresh(position))
+
+	def write(self, function, args=(), on_done=None):
+		"""Has a worker run function(*args), then wait for everything written so far to be
+			committed, so the readers see our own changes. on_done() is then called on the
+			main loop, unless the window was closed meanwhile.
+		"""
+		def writing():
+			function(*args)
+			self.master.notecards.flush()
+		def done(result=None):
+			if on_done and self.master.edit_window is self:
+				on_done()
+		def failed(error):
+			print "Couldn't save the notecards: %s" % error
+			done()		#Still shows what the database holds
+		self.master.workers.submit(writing, callback=done, errback=failed)
+
+	def refresh(self, position):
+		"""Reads the model afresh and scrolls to position.
+		"""
+		self.treeview.set_model(None)
+		self.model.refresh()
+		self.treeview.set_model(self.model)
+		self.scrolled_window.get_vadjustment().set_value(position)
+
+	def sync(self):
+		"""Asks for the changes since the model was last up to date, on a worker thread.
+			They come back in on_changes().
+		"""
+		if self.syncing:
+			return
+		self.syncing = True
+		self.master.workers.submit(self.model.fetch_changes, (self.model.seq,), callback=self.on_changes, errback=self.on_sync_failed)
+
+	def on_changes(self, changes):
+		self.syncing = False
+		if self.master.edit_window is not self:
+			return		#Closed in the meantime
+		if not self.model.apply(*changes):
+			self.reload()
+
+	def on_sync_failed(self, error):
+		self.syncing = False
+		print "Couldn't read the changes: %s" % error
+
+	def on_column_clicked(self, column, order_by):
+		"""Sorts by the column, or reverses the order if it already was.
+		"""
+		descending = self.model.order_by == order_by and not self.model.descending
+		for other in self.treeview.get_columns():
+			other.set_sort_indicator(other is column)
+		column.set_sort_order(gtk.SORT_DESCENDING if descending else gtk.SORT_ASCENDING)
+
+		self.treeview.set_model(None)
+		self.model.sort(order_by, descending)
+		self.treeview.set_model(self.model)
+
+	def on_add_clicked(self, widget):
+		_id = self.master.notecards.get_smallest_avialable_id()
+		EditNotecardDialog(self.add_notecard, _id) 
+
+	def on_search_activated(self, entry):
+		"""Shows only the notecards matching the search, or all of them if it's empty.
+		"""
+		query = entry.get_text().decode('utf-8').strip()
+		ids = [notecard[0] for notecard in self.master.notecards.search(query)] if query else None
+		self.treeview.set_model(None)
+		self.model.only(ids)
+		self.treeview.set_model(self.model)
+
+	def on_delete_clicked(self, widget):
+		"""Deletes the notecards in the selection off the database, then reloads the model
+		"""
+		store, paths = self.selection.get_selected_rows()
+		ids = set(self.model.row(path[0])[0] for path in paths)		#Positions change as soon as one is deleted
+		ids.discard(-1)
+		#Detached, the treeview hears nothing of the batch, only of the reload
+		position = self.scrolled_window.get_vadjustment().get_value()
+		self.treeview.set_model(None)
+		if self.model.ids is not None:
+			self.model.ids = [_id for _id in self.model.ids if _id not in ids]
+		#Delete off the database, in one go
+		self.write(self.master.notecards.delete_notecards, (ids,), on_done=lambda: self.refresh(position))
+
+	def on_row_clicked(self, treeview, path, column):
+		"""Activated when a row is double clicked, launches the edit window
+		"""
+		[_id, front, back] = self.model[path]
+		EditNotecardDialog(self.edit_notecard, _id, front, back)
+
+	def add_notecard(self, _id, front_text, back_text):
+		"""adds notecard to database and reloads the model, the writing done by a worker
+		"""
+		position = self.scrolled_window.get_vadjustment().get_value()
+		self.write(self.master.notecards.add_notecard, (_id, front_text, back_text), on_done=lambda: self.refresh(position))
+
+	def edit_notecard(self, _id, front, back):
+		self.write(self.master.notecards.edit_notecard, (_id, front, back), on_done=self.sync)		#Usually only this row needs redrawing
+
+	def quit(self, widget):
+		self.sync_job.cancel()
+		self.master.edit_window = False
+		self.destroy()
+
+def main():
+	pynotify.init(APP_NAME)
+	gtk.gdk.threads_init()
+
+	make_config_dir()
+
+	if not os.path.isfile(DATABASE_FILE):
+		open(DATABASE_FILE, 'w').close()
+
+	#All is well, let's go!
+	a = Lexiconner(database_file=DATABASE_FILE)
+
+	gtk.main()
@@ -0,0 +1,153 @@
+"""Running things from the GTK main loop: recurring jobs off one timer, and blocking work on a
+fixed pool of threads whose results come back through the main loop.
+
+Neither imports gobject, they are handed it (or anything with the same timeout_add,
+timeout_add_seconds, idle_add and source_remove) so the core stays importable without gtk.
+"""
+import math
+import time
+import heapq
+import itertools
+import threading
+import traceback
+try:
+	from Queue import Queue
+except ImportError:
+	from queue import Queue
+
+
+def call_once(function, *args):
+	"""For idle_add and friends, which call again as long as the callback returns True.
+	"""
+	function(*args)
+	return False
+
+
+class Job(object):
+	"""A recurring job of a JobScheduler. cancel() stops it, even from inside function.
+	"""
+	def __init__(self, scheduler, interval, function, args):
+		self.scheduler = scheduler
+		self.interval = interval
+		self.function = function
+		self.args = args
+		self.due = None
+		self.cancelled = False
+
+	def cancel(self):
+		self.cancelled = True
+		self.scheduler.arm()
+
+
+class JobScheduler(object):
+	"""Keeps every recurring job in one heap of (due, seq, job) and a single main loop timeout
+		for whichever is due first, so jobs run on the main loop and no thread is ever made
+		for them. Cancelled jobs are left in the heap and skipped once they reach the top.
+
+		Jobs must not block, hand database work to a WorkerPool.
+	"""
+	def __init__(self, loop, clock=time.time):
+		self.loop = loop
+		self.clock = clock
+		self.heap = []
+		self.seq = itertools.count()		#Keeps jobs due at the same time in the order they were added
+		self.source = None		#Id of the pending timeout
+		self.armed_for = None		#When it fires
+
+	def every(self, interval, function, *args):
+		"""Calls function(*args) every interval seconds, the first time interval seconds from now.
+			Returns the Job.
+		"""
+		job = Job(self, interval, function, args)
+		self.push(job, self.clock() + interval)
+		return job
+
+	def push(self, job, due):
+		job.due = due
+		heapq.heappush(self.heap, (due, next(self.seq), job))
+		self.arm()
+
+	def arm(self):
+		"""Makes sure the timeout fires when the first job is due, and not at all if there is none.
+		"""
+		while self.heap and self.heap[0][2].cancelled:
+			heapq.heappop(self.heap)
+		due = self.heap[0][0] if self.heap else None
+		if due == self.armed_for:
+			return
+		if self.source is not None:
+			self.loop.source_remove(self.source)
+			self.source = None
+		self.armed_for = due
+		if due is None:
+			return
+		delay = max(due - self.clock(), 0)
+		if delay >= 1:
+			#Whole seconds let the main loop wake up for several sources at once
+			self.source = self.loop.timeout_add_seconds(int(math.ceil(delay)), self.fire)
+		else:
+			self.source = self.loop.timeout_add(int(delay * 1000), self.fire)
+
+	def fire(self):
+		"""Runs every job that is due, then sets the timeout for the next one.
+		"""
+		self.source = self.armed_for = None
+		now = self.clock()
+		while self.heap and self.heap[0][0] <= now:
+			due, seq, job = heapq.heappop(self.heap)
+			if job.cancelled:
+				continue
+			try:
+				job.function(*job.args)
+			except Exception:
+				traceback.print_exc()		#One broken job shouldn't stop the others
+			if not job.cancelled:
+				#Runs missed while the machine slept are dropped, not caught up on
+				job.due = max(due + job.interval, now)
+				heapq.heappush(self.heap, (job.due, next(self.seq), job))
+		self.arm()
+		return False		#arm() made a new timeout if one is needed
+
+	def cancel_all(self):
+		for due, seq, job in self.heap:
+			job.cancelled = True
+		self.arm()
+
+
+class WorkerPool(object):
+	"""size daemon threads running whatever blocking work is submitted. callback(result), or
+		errback(error), is then called on the main loop through idle_add, so it may touch gtk.
+	"""
+	def __init__(self, loop, size=2):
+		self.loop = loop
+		self.tasks = Queue()
+		self.threads = [threading.Thread(target=self.run) for i in range(size)]
+		for thread in self.threads:
+			thread.daemon = True
+			thread.start()
+
+	def submit(self, function, args=(), callback=None, errback=None):
+		self.tasks.put((function, args, callback, errback))
+
+	def run(self):
+		while True:
+			task = self.tasks.get()
+			if task is None:
+				return
+			function, args, callback, errback = task
+			try:
+				result = function(*args)
+			except Exception as e:
+				if errback:
+					self.loop.idle_add(call_once, errback, e)
+				else:
+					traceback.print_exc()
+				continue
+			if callback:
+				self.loop.idle_add(call_once, callback, result)
+
+	def close(self):
+		"""Lets the threads finish what was submitted so far, then stop.
+		"""
+		for thread in self.threads:
+			self.tasks.put(None)
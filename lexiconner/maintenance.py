@@ -0,0 +1,174 @@
+"""Maintenance, which keeps the database small and backed up while it's in use.
+"""
+import os
+import time
+import sqlite3
+import threading
+
+
+class MaintenanceStopped(Exception):
+	"""Raised by a backup or compaction that stop() cut short.
+	"""
+
+class BackupRestarting(Exception):
+	"""Raised between backup steps once the writer made it start over too often.
+	"""
+
+
+class Maintenance(object):
+	"""Backs up a safeDatabase into directory, keeping the newest keep backups, and gives back
+		the space deleted notecards leave. Everything here blocks and is meant for a WorkerPool
+		thread, run() being what a JobScheduler job calls.
+
+		Backups are taken from a connection of their own, so in WAL mode the writer and the
+		readers never wait for them. On Python 3 the backup API copies BACKUP_PAGES pages at a
+		time, pausing in between. SQLite starts it over whenever the writer commits meanwhile;
+		after MAX_RESTARTS of those the rest is copied in one step, which in WAL mode only holds
+		a read transaction. Python 2's sqlite3 has no backup API, there VACUUM INTO copies it
+		in one read transaction too.
+
+		Freed pages are handed back VACUUM_PAGES at a time, each step a statement of its own on
+		the writer, so other statements get in between. That takes auto_vacuum=INCREMENTAL,
+		which safeDatabase sets on new databases; older ones are VACUUMed once to switch, but
+		only when there is enough to gain. Before that compact() calls each of cleanup, which
+		delete what's no longer needed, so their pages are given back straight away.
+	"""
+	BACKUP_PAGES = 256
+	BACKUP_SLEEP = 0.05		#Seconds between backup steps
+	MAX_RESTARTS = 3
+	VACUUM_PAGES = 256
+	CONVERT_FREE = 0.25		#Part of the file that must be free before a full VACUUM is worth it
+
+	def __init__(self, database, directory, keep=7, cleanup=()):
+		self.database = database
+		self.directory = directory
+		self.keep = keep
+		self.cleanup = list(cleanup)
+		self.prefix = os.path.splitext(os.path.basename(database.db))[0] + '-'
+		self.lock = threading.Lock()		#One backup or compaction at a time
+		self.connection = None		#The backup's, for stop() to interrupt
+		self.remaining = None		#Pages the backup had left at the last step
+		self.restarts = 0
+		self.stopping = False
+
+	def backups(self):
+		"""Returns the paths of the backups, oldest first.
+		"""
+		if not os.path.isdir(self.directory):
+			return []
+		names = [name for name in os.listdir(self.directory) if name.startswith(self.prefix) and name.endswith('.db')]
+		return [os.path.join(self.directory, name) for name in sorted(names)]		#Their names sort by time
+
+	def run(self, backup_interval=24 * 60 * 60):
+		"""Compacts the database, then backs it up if the last backup is older than backup_interval seconds.
+		"""
+		try:
+			self.compact()
+			backups = self.backups()
+			if not backups or os.path.getmtime(backups[-1]) < time.time() - backup_interval:
+				self.backup()
+		except MaintenanceStopped:
+			pass
+
+	def backup(self):
+		"""Writes a backup of the database, drops the oldest beyond self.keep and returns its path.
+		"""
+		with self.lock:
+			if not os.path.isdir(self.directory):
+				os.makedirs(self.directory)
+			path = os.path.join(self.directory, self.prefix + time.strftime('%Y%m%d-%H%M%S') + '.db')
+			partial = path + '.part'		#Only renamed once it's whole
+			if os.path.exists(partial):
+				os.remove(partial)
+			try:
+				self._copy(partial)
+				os.rename(partial, path)
+			except:
+				if os.path.exists(partial):
+					os.remove(partial)
+				raise
+			for old in self.backups()[:-max(self.keep, 1)]:
+				os.remove(old)
+			return path
+
+	def _copy(self, path):
+		source = self.database.connect()
+		self.connection = source
+		try:
+			if self.stopping:
+				raise MaintenanceStopped()
+			if hasattr(source, 'backup'):
+				target = sqlite3.connect(path)
+				self.remaining, self.restarts = None, 0
+				try:
+					try:
+						source.backup(target, pages=self.BACKUP_PAGES, progress=self.on_progress)
+					except BackupRestarting:
+						source.backup(target)		#All at once
+					target.execute('PRAGMA journal_mode=DELETE')		#Stands on its own, no -wal beside it
+				finally:
+					target.close()
+			else:
+				try:
+					source.execute('VACUUM INTO ?', [path])
+				except sqlite3.OperationalError:
+					if self.stopping:
+						raise MaintenanceStopped()
+					raise
+		finally:
+			self.connection = None
+			source.close()
+
+	def on_progress(self, status, remaining, total):
+		#Called between steps, the pause is up to us: backup()'s sleep is only for when it's busy
+		if self.stopping:
+			raise MaintenanceStopped()
+		if self.remaining is not None and remaining >= self.remaining:		#Started over
+			self.restarts += 1
+			if self.restarts > self.MAX_RESTARTS:
+				raise BackupRestarting()
+		self.remaining = remaining
+		if remaining:
+			time.sleep(self.BACKUP_SLEEP)
+
+	def compact(self):
+		"""Runs the cleanup, gives the free pages back to the file system, lets SQLite refresh
+			its statistics, and returns how many pages were freed.
+		"""
+		with self.lock:
+			for cleanup in self.cleanup:
+				cleanup()
+			select = self.database.select
+			free = freelist = next(select("PRAGMA freelist_count"))[0]
+			if next(select("PRAGMA auto_vacuum"))[0] != 2:
+				if free <= next(select("PRAGMA page_count"))[0] * self.CONVERT_FREE:
+					freelist = free = 0		#Not worth rewriting the whole file for
+				else:
+					#Blocks the writer while it copies the file, but only this once
+					self.database.execute("PRAGMA auto_vacuum=INCREMENTAL")
+					list(select("VACUUM"))
+					free = next(select("PRAGMA freelist_count"))[0]
+			while free:
+				if self.stopping:
+					raise MaintenanceStopped()
+				list(select("PRAGMA incremental_vacuum(%d)" % self.VACUUM_PAGES))
+				left = next(select("PRAGMA freelist_count"))[0]
+				if left >= free:
+					break		#Deletes meanwhile, those are for next time
+				free = left
+			freed = freelist - free
+			list(select("PRAGMA optimize"))
+			if self.database.wal:
+				list(select("PRAGMA wal_checkpoint(PASSIVE)"))		#Which is when the file shrinks
+			return freed
+
+	def stop(self):
+		"""Cuts short whatever runs now, and keeps anything from running from now on.
+		"""
+		self.stopping = True
+		connection = self.connection
+		if connection is not None:
+			try:
+				connection.interrupt()
+			except sqlite3.ProgrammingError:
+				pass		#Closed just now
@@ -0,0 +1,102 @@
+"""MediaStore, where the images and sounds of notecards are kept, out of the database.
+"""
+import os
+import time
+import hashlib
+import tempfile
+
+
+class MediaStore(object):
+	"""Files named after the SHA-256 of what's in them, as directory/ab/cdef..., so the same
+		picture attached to a thousand notecards is stored once and a file never changes once
+		written. Notecards refer to them by that digest, see NotecardsHandler.attach_media().
+		Everything is read and written a chunk at a time; the directory is made on the first put().
+	"""
+	CHUNK = 64 * 1024
+
+	def __init__(self, directory):
+		self.directory = directory
+
+	def path(self, digest):
+		return os.path.join(self.directory, digest[:2], digest[2:])
+
+	def exists(self, digest):
+		return os.path.isfile(self.path(digest))
+
+	def put(self, source):
+		"""Stores what the file object, or file name, source holds and returns (digest, size).
+			Nothing is written if the store already has it.
+		"""
+		if not hasattr(source, 'read'):
+			with open(source, 'rb') as source:
+				return self.put(source)
+		if not os.path.isdir(self.directory):
+			os.makedirs(self.directory)
+		sha = hashlib.sha256()
+		size = 0
+		#Into a temporary file first, its name is only known at the end
+		handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.part')
+		try:
+			with os.fdopen(handle, 'wb') as output:
+				while True:
+					chunk = source.read(self.CHUNK)
+					if not chunk:
+						break
+					sha.update(chunk)
+					output.write(chunk)
+					size += len(chunk)
+			digest = sha.hexdigest()
+			path = self.path(digest)
+			if os.path.isfile(path):
+				os.remove(temporary)		#Got it already
+				os.utime(path, None)		#Keeps prune() off it until it's attached
+			else:
+				if not os.path.isdir(os.path.dirname(path)):
+					os.makedirs(os.path.dirname(path))
+				os.rename(temporary, path)
+		except:
+			if os.path.exists(temporary):
+				os.remove(temporary)
+			raise
+		return digest, size
+
+	def open(self, digest):
+		return open(self.path(digest), 'rb')
+
+	def chunks(self, digest, size=None):
+		"""Yields what's stored under digest a chunk at a time, to decode or send as it's read.
+		"""
+		with self.open(digest) as stored:
+			while True:
+				chunk = stored.read(size or self.CHUNK)
+				if not chunk:
+					return
+				yield chunk
+
+	def digests(self):
+		"""Yields (digest, modified) for everything stored.
+		"""
+		if not os.path.isdir(self.directory):
+			return
+		for prefix in os.listdir(self.directory):
+			folder = os.path.join(self.directory, prefix)
+			if len(prefix) != 2 or not os.path.isdir(folder):
+				continue
+			for rest in os.listdir(folder):
+				yield prefix + rest, os.path.getmtime(os.path.join(folder, rest))
+
+	def prune(self, used, grace=60 * 60):
+		"""Removes what isn't in the set used and hasn't been stored within grace seconds,
+			which may be about to be attached. Returns how many files went.
+		"""
+		removed = 0
+		since = time.time() - grace
+		for digest, modified in list(self.digests()):
+			if digest not in used and modified < since:
+				os.remove(self.path(digest))
+				removed += 1
+		for name in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+			path = os.path.join(self.directory, name)
+			if name.endswith('.part') and os.path.getmtime(path) < since:
+				os.remove(path)		#Left by a put() that never finished
+		return removed
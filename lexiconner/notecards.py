@@ -0,0 +1,1259 @@
+"""NotecardsHandler, everything the app does with notecards, and the indexes it keeps in memory.
+"""
+import os
+import csv
+import bisect
+import itertools
+import sqlite3
+import threading
+import random
+import numbers
+import heapq
+import array
+
+from lexiconner.cache import NotecardCache
+from lexiconner.database import safeDatabase, Many, Steps
+from lexiconner.scheduler import Scheduler, QuestionPrefetcher
+from lexiconner.snapshot import DeckSnapshot
+from lexiconner.similarity import SimilarityIndex
+from lexiconner.media import MediaStore
+from lexiconner.maintenance import Maintenance
+
+if str is bytes:		#Python 2, whose csv module only does bytes
+	encode = lambda text: text.encode('utf-8')
+	decode = lambda data: data.decode('utf-8')
+else:
+	encode = decode = lambda text: text
+
+try:
+	string_types = basestring
+except NameError:		#Python 3
+	string_types = str
+
+
+class IdAllocator(object):
+	"""Keeps track of which notecard ids are free, so the smallest one can be found without
+		looking at the table. Ids from self.next upwards are all free; the free ones below it
+		are kept as ranges, from self.starts[i] up to self.ends[i], in order and never
+		touching. So a deck takes a few numbers for each hole in its ids, however wide.
+	"""
+	def __init__(self, ids=()):
+		"""ids are the ids already in use, in ascending order.
+		"""
+		self.lock = threading.Lock()
+		self.next = 0
+		self.starts = []
+		self.ends = []
+		for _id in ids:
+			if _id > self.next:
+				self.starts.append(self.next)
+				self.ends.append(_id)
+			self.next = _id + 1
+
+	def smallest(self):
+		"""Returns the smallest free id without taking it.
+		"""
+		with self.lock:
+			return self.starts[0] if self.starts else self.next
+
+	def take(self, _id):
+		"""Marks _id as used.
+		"""
+		with self.lock:
+			if _id >= self.next:
+				if _id > self.next:
+					if self.ends and self.ends[-1] == self.next:
+						self.ends[-1] = _id
+					else:
+						self.starts.append(self.next)
+						self.ends.append(_id)
+				self.next = _id + 1
+				return
+			i = bisect.bisect_right(self.starts, _id) - 1
+			if i < 0 or _id >= self.ends[i]:
+				return		#Not free
+			if self.starts[i] == _id and self.ends[i] == _id + 1:
+				del self.starts[i], self.ends[i]
+			elif self.starts[i] == _id:
+				self.starts[i] = _id + 1
+			elif self.ends[i] == _id + 1:
+				self.ends[i] = _id
+			else:
+				self.starts.insert(i + 1, _id + 1)
+				self.ends.insert(i + 1, self.ends[i])
+				self.ends[i] = _id
+
+	def take_many(self, count):
+		"""Takes the count smallest free ids and returns them in ascending order.
+		"""
+		with self.lock:
+			ids = []
+			used = 0		#Ranges taken whole
+			while used < len(self.starts) and len(ids) < count:
+				start, end = self.starts[used], min(self.ends[used], self.starts[used] + count - len(ids))
+				ids.extend(range(start, end))
+				if end == self.ends[used]:
+					used += 1
+				else:
+					self.starts[used] = end
+			del self.starts[:used], self.ends[:used]
+			ids.extend(range(self.next, self.next + count - len(ids)))
+			self.next = max(self.next, ids[-1] + 1) if ids else self.next
+			return ids
+
+	def release(self, _id):
+		"""Marks _id as free again.
+		"""
+		self.release_many([_id])
+
+	def release_many(self, ids):
+		with self.lock:
+			ids = sorted(set(_id for _id in ids if 0 <= _id < self.next))
+			if len(ids) * 8 > len(self.starts):
+				#Many at once, merged in one pass over the ranges rather than one insert each
+				ranges = []
+				for _id in ids:
+					if ranges and ranges[-1][1] == _id:
+						ranges[-1][1] = _id + 1
+					else:
+						ranges.append([_id, _id + 1])
+				starts, ends = [], []
+				for start, end in heapq.merge(zip(self.starts, self.ends), [tuple(r) for r in ranges]):
+					if ends and start <= ends[-1]:
+						ends[-1] = max(ends[-1], end)
+					else:
+						starts.append(start)
+						ends.append(end)
+				self.starts, self.ends = starts, ends
+			else:
+				for _id in ids:
+					self._release(_id)
+			if self.ends and self.ends[-1] == self.next:
+				self.next = self.starts.pop()		#Free all the way up
+				self.ends.pop()
+
+	def _release(self, _id):
+		i = bisect.bisect_right(self.starts, _id)		#The ranges before i start at or below _id
+		if i and self.ends[i - 1] > _id:
+			return		#Free already
+		after = i < len(self.starts) and self.starts[i] == _id + 1
+		if i and self.ends[i - 1] == _id:
+			if after:
+				self.ends[i - 1] = self.ends[i]
+				del self.starts[i], self.ends[i]
+			else:
+				self.ends[i - 1] = _id + 1
+		elif after:
+			self.starts[i] = _id
+		else:
+			self.starts.insert(i, _id)
+			self.ends.insert(i, _id + 1)
+
+
+class IdSampler(object):
+	"""Hands out random notecard ids without asking the database. The ids sit in an array;
+		deleted ones are only remembered in self.removed and skipped when drawn, until
+		they make up half of the array and it gets compacted.
+	"""
+	def __init__(self, ids=()):
+		self.lock = threading.Lock()
+		self.ids = array.array('l', ids)
+		self.removed = set()
+
+	def __len__(self):
+		return len(self.ids) - len(self.removed)
+
+	def add(self, _id):
+		with self.lock:
+			if _id in self.removed:
+				self.removed.remove(_id)		#Still in the array
+			else:
+				self.ids.append(_id)
+
+	def extend(self, ids):
+		with self.lock:
+			if self.removed:
+				back = self.removed.intersection(ids)		#Still in the array
+				self.removed -= back
+				ids = [_id for _id in ids if _id not in back]
+			self.ids.extend(ids)
+
+	def remove(self, _id):
+		self.remove_many([_id])
+
+	def remove_many(self, ids):
+		with self.lock:
+			self.removed.update(ids)
+			if len(self.removed) * 2 > len(self.ids):
+				self.ids = array.array('l', (i for i in self.ids if i not in self.removed))
+				self.removed.clear()
+
+	def all(self):
+		with self.lock:
+			return [i for i in self.ids if i not in self.removed]
+
+	def sample(self, count):
+		"""Returns up to count distinct ids in random order.
+		"""
+		with self.lock:
+			if count >= len(self.ids) - len(self.removed):
+				ids = [i for i in self.ids if i not in self.removed]
+				random.shuffle(ids)
+				return ids
+			ids = []
+			while len(ids) < count:
+				_id = self.ids[random.randrange(len(self.ids))]
+				if _id not in self.removed and _id not in ids:
+					ids.append(_id)
+			return ids
+
+
+class DeckSampler(object):
+	"""An IdSampler for each deck, drawing only from the selected decks, or from all of them
+		if self.selected is None. Which deck each id is in sits in the array self.deck_ids,
+		indexed by id, as NotecardsHandler keeps ids below MAX_ID; -1 means there is no such
+		card.
+	"""
+	def __init__(self, decks=()):
+		"""decks are (deck_id, ids) pairs, the ids in ascending order.
+		"""
+		self.lock = threading.Lock()
+		self.decks = {}
+		self.deck_ids = array.array('l')
+		self.selected = None
+		for deck, ids in decks:
+			self.decks[deck] = IdSampler(ids)
+			if not ids:
+				continue
+			self.grow(ids[-1])
+			if ids[-1] - ids[0] + 1 == len(ids):		#No gaps, as is usual with one deck
+				self.deck_ids[ids[0]:ids[-1] + 1] = array.array('l', [deck]) * len(ids)
+			else:
+				for _id in ids:
+					self.deck_ids[_id] = deck
+
+	def grow(self, _id):
+		if _id >= len(self.deck_ids):
+			self.deck_ids.extend(array.array('l', [-1]) * (_id + 1 - len(self.deck_ids)))
+
+	def deck_of(self, _id):
+		"""Returns the deck of notecard _id, or None.
+		"""
+		deck = self.deck_ids[_id] if 0 <= _id < len(self.deck_ids) else -1
+		return deck if deck != -1 else None
+
+	def sampler(self, deck):
+		with self.lock:
+			if deck not in self.decks:
+				self.decks[deck] = IdSampler()
+			return self.decks[deck]
+
+	def add(self, _id, deck=0):
+		with self.lock:
+			self.grow(_id)
+			self.deck_ids[_id] = deck
+		self.sampler(deck).add(_id)
+
+	def extend(self, ids, deck=0):
+		ids = list(ids)
+		if not ids:
+			return
+		with self.lock:
+			self.grow(max(ids))
+			first, last = min(ids), max(ids)
+			if last - first + 1 == len(ids):		#No gaps, as after an import into an empty deck
+				self.deck_ids[first:last + 1] = array.array('l', [deck]) * len(ids)
+			else:
+				for _id in ids:
+					self.deck_ids[_id] = deck
+		self.sampler(deck).extend(ids)
+
+	def remove(self, _id):
+		self.remove_many([_id])
+
+	def remove_many(self, ids):
+		removed = {}		#Deck -> its ids among them
+		with self.lock:
+			for _id in ids:
+				deck = self.deck_of(_id)
+				if deck is not None:
+					self.deck_ids[_id] = -1
+					removed.setdefault(deck, []).append(_id)
+		for deck, deck_ids in removed.items():
+			self.decks[deck].remove_many(deck_ids)
+
+	def select(self, decks):
+		"""Draws only from decks from now on, or from every deck if it's None.
+		"""
+		self.selected = None if decks is None else frozenset(decks)
+
+	def is_selected(self, deck):
+		return self.selected is None or deck in self.selected
+
+	def samplers(self):
+		with self.lock:
+			return [sampler for deck, sampler in self.decks.items() if self.is_selected(deck)]
+
+	def __len__(self):
+		return sum(len(sampler) for sampler in self.samplers())
+
+	def size(self, deck):
+		return len(self.decks[deck]) if deck in self.decks else 0
+
+	def sample(self, count):
+		"""Returns up to count distinct ids from the selected decks, in random order. Each id
+			is drawn from a deck picked in proportion to its size, so every card is as likely.
+		"""
+		samplers = [sampler for sampler in self.samplers() if len(sampler)]
+		if len(samplers) == 1:
+			return samplers[0].sample(count)
+		totals = []		#Running total of the sizes
+		for sampler in samplers:
+			totals.append(len(sampler) + (totals[-1] if totals else 0))
+		if not totals or count >= totals[-1]:
+			ids = [_id for sampler in samplers for _id in sampler.sample(len(sampler))]
+			random.shuffle(ids)
+			return ids[:count]
+		ids = []
+		while len(ids) < count:
+			sampler = samplers[bisect.bisect_right(totals, random.randrange(totals[-1]))]
+			for _id in sampler.sample(1):
+				if _id not in ids:
+					ids.append(_id)
+		return ids
+
+
+class NotecardsHandler():
+	"""Handles a notecard database.
+	"""
+	CHANGE_LOG_KEEP = 10000		#Changes kept once they are old, views further behind than that reload
+	CHANGE_LOG_LIMIT = 1000		#Most changes changes_since() hands out, beyond that reloading is cheaper
+	IN_CHUNK = 500		#Ids to an IN (...), well within what any SQLite takes
+	MAX_ID = (1 << 24) - 1		#Ids index arrays kept in memory, beyond that they would take too much
+
+	def __init__(self, database_file, flush_interval=0.0, max_batch=1000, readers=0, prefetch=0, slow_query=None,
+			cache_bytes=4 * 1024 * 1024, snapshot=False, snapshot_file=None, similar=False, media_dir=None,
+			backup_dir=None, backups=7):
+		"""Sets up a sqlite datbase object. flush_interval and max_batch control how
+			statements are grouped into transactions, readers how many connections
+			answer the read-only methods, slow_query after how many seconds a
+			statement gets logged, see safeDatabase. prefetch is how many
+			questions ready_question() keeps at hand. cache_bytes caps the
+			notecards kept in memory by get_notecards() and lookup().
+
+			With snapshot every front and back is kept in a DeckSnapshot, and questions
+			never wait on the database. snapshot_file implies it, the snapshot is then
+			mapped from that file and saved back to it on close(), so it only gets read
+			from the database the first time.
+
+			With similar the other choices of a question are taken from the notecards whose
+			backs look most like its answer, see SimilarityIndex, as far as there are any.
+			The index is built in a thread of its own, questions are random until it's done.
+			With snapshot_file too it's saved beside it on close(), named like it with
+			.similar, and caught up from the change log next time like the snapshot.
+
+			Media attached to notecards is kept in media_dir, by default the database's
+			name with .media instead of its extension, see MediaStore.
+
+			self.maintenance backs the database up into backup_dir, by default named like
+			it with .backups, keeping the last backups of them, and prunes the change log
+			when it compacts, see Maintenance.
+
+			Other processes may use the database at the same time, poll() brings what's
+			kept in memory up to date with what they wrote.
+		"""
+		self.database = safeDatabase(database_file, flush_interval, max_batch, readers=readers, slow_query=slow_query)
+		self.cache = NotecardCache(self.database, cache_bytes)
+		self.deck_ticket = None		#Of the last write to deck_table, see get_decks()
+		#Held while reload() swaps what's kept in memory for new ones, and while cards are taken into them
+		self.lock = threading.RLock()
+		self.media = MediaStore(media_dir or os.path.splitext(database_file)[0] + '.media')
+		self.maintenance = Maintenance(self.database, backup_dir or os.path.splitext(database_file)[0] + '.backups', backups,
+										cleanup=[self.prune_changes])
+		#Check if we have the table
+		self.create_table()
+		#Where poll() takes off from, before anything is read so no change can slip in between
+		self.data_version = self.get_data_version()
+		self.seen = self.last_change()
+		try:
+			decks, ids = self.load_ids()
+		except ValueError:
+			self.database.close()		#Or its thread would keep the process from ending
+			raise
+		self.ids = IdAllocator(ids)
+		self.sampler = DeckSampler(decks)
+		self.scheduler = Scheduler(self.database, self.sampler)
+		self.snapshot_file = snapshot_file
+		self.snapshot = self.open_snapshot(snapshot_file) if snapshot or snapshot_file else None
+		self.similar_file = os.path.splitext(snapshot_file)[0] + '.similar' if snapshot_file else None
+		self.indexing = []		#Threads of index_similar(), the index is only saved once they're done
+		self.similarity = self.open_similar(self.similar_file) if similar else None
+		if similar and self.similarity is None:
+			self.rebuild_similar()
+		self.prefetcher = QuestionPrefetcher(self, prefetch) if prefetch else None
+
+	def load_ids(self):
+		"""Returns ([(deck_id, ids), ...], ids), every notecard's id by deck and all of them, in ascending order.
+		"""
+		decks = [(deck, array.array('l', (row[0] for row in self.database.select("SELECT id FROM notecard_table WHERE deck_id=? ORDER BY id", [deck]))))
+					for deck, in list(self.database.select("SELECT DISTINCT deck_id FROM notecard_table"))]
+		ids = decks[0][1] if len(decks) == 1 else sorted(itertools.chain(*[deck_ids for deck, deck_ids in decks]))
+		if len(ids) and not (0 <= ids[0] and ids[-1] <= self.MAX_ID):
+			raise ValueError("%s has notecard ids beyond 0 to %d, which can't be kept in memory"
+								% (self.database.db, self.MAX_ID))
+		return decks, ids
+
+	def check_id(self, _id):
+		"""Raises ValueError unless _id can be a notecard's, see MAX_ID.
+		"""
+		if not isinstance(_id, numbers.Integral) or not 0 <= _id <= self.MAX_ID:
+			raise ValueError("A notecard id is a whole number from 0 to %d, not %r" % (self.MAX_ID, _id))
+
+	def create_table(self):
+		"""Creates a table called notecard_table in the database with the appropriate columns,
+			plus the index and full text table search() uses, if they aren't there yet. Same
+			for deck_table, which names the decks; every database has deck 0.
+		"""
+		self.database.execute("""CREATE TABLE IF NOT EXISTS notecard_table 
+								(id 	INT 		PRIMARY KEY 	NOT NULL,
+								front 	CHAR(50)					NOT NULL,
+								back 	TEXT						NOT NULL,
+								deck_id	INT							NOT NULL	DEFAULT 0);""")
+		if 'deck_id' not in [column[1] for column in self.database.select("PRAGMA table_info(notecard_table)")]:
+			#From before there were decks, everything goes in the default one
+			self.database.execute("ALTER TABLE notecard_table ADD COLUMN deck_id INT NOT NULL DEFAULT 0")
+		self.database.execute("""CREATE TABLE IF NOT EXISTS deck_table
+								(id 	INT 		PRIMARY KEY 	NOT NULL,
+								name 	TEXT		UNIQUE			NOT NULL);""")
+		self.database.execute("INSERT OR IGNORE INTO deck_table (id, name) VALUES (0, 'Default')")
+		self.database.execute("CREATE INDEX IF NOT EXISTS notecard_front ON notecard_table (front)")
+		self.database.execute("CREATE INDEX IF NOT EXISTS notecard_back ON notecard_table (back)")		#For sorting in the edit window
+		self.database.execute("CREATE INDEX IF NOT EXISTS notecard_deck ON notecard_table (deck_id, id)")
+		self.database.execute("CREATE INDEX IF NOT EXISTS notecard_deck_front ON notecard_table (deck_id, front)")
+
+		#Where update_notecards() puts the new values, import_csv() the new cards and delete_notecards()
+		#the ids of many, on the writer's connection only
+		self.database.execute("CREATE TEMP TABLE IF NOT EXISTS notecard_edits (id INTEGER PRIMARY KEY, front TEXT, back TEXT)")
+		self.database.execute("CREATE TEMP TABLE IF NOT EXISTS notecard_imports (id INTEGER PRIMARY KEY, front TEXT, back TEXT, deck_id INT, staged INT)")
+		self.database.execute("CREATE TEMP TABLE IF NOT EXISTS notecard_deletes (id INTEGER PRIMARY KEY)")
+
+		self.fts = self.create_fts()
+		self.create_media_table()
+		self.create_change_log()
+		self.prune_changes()
+		self.database.flush()		#The readers can't see tables that aren't committed
+
+	def create_media_table(self):
+		"""Creates media_table, which says what's attached to each notecard: the digest it's
+			stored under in self.media, its MIME type and size. Deleting a card detaches its media.
+		"""
+		self.database.execute("""CREATE TABLE IF NOT EXISTS media_table
+								(card_id	INT 		NOT NULL,
+								digest 		CHAR(64)	NOT NULL,
+								mime_type	TEXT		NOT NULL,
+								size		INT			NOT NULL,
+								PRIMARY KEY (card_id, digest));""")
+		self.database.execute("CREATE INDEX IF NOT EXISTS media_digest ON media_table (digest)")		#For prune_media()
+		self.database.execute("""CREATE TRIGGER IF NOT EXISTS media_delete AFTER DELETE ON notecard_table BEGIN
+									DELETE FROM media_table WHERE card_id = old.id;
+								END""")
+
+	def create_change_log(self):
+		"""Creates change_log, where triggers note every change to notecard_table, whoever makes it:
+			'i', 'u' or 'd' for the card_id. seq never goes back, see changes_since(). A bulk write
+			that leaves the triggers out notes 'r' for card_id -1 instead, see import_csv().
+		"""
+		self.database.execute("""CREATE TABLE IF NOT EXISTS change_log
+								(seq 		INTEGER 	PRIMARY KEY 	AUTOINCREMENT,
+								card_id		INT 						NOT NULL,
+								change 		CHAR(1)						NOT NULL);""")
+		for event, change, row in [('INSERT', 'i', 'new'), ('UPDATE', 'u', 'new'), ('DELETE', 'd', 'old')]:
+			self.database.execute("""CREATE TRIGGER IF NOT EXISTS change_log_%s AFTER %s ON notecard_table BEGIN
+										INSERT INTO change_log (card_id, change) VALUES (%s.id, '%s');
+									END""" % (event.lower(), event, row, change))
+
+	def prune_changes(self):
+		"""Forgets all but the last CHANGE_LOG_KEEP changes.
+		"""
+		self.database.execute("DELETE FROM change_log WHERE seq <= (SELECT MAX(seq) FROM change_log) - ?", [self.CHANGE_LOG_KEEP])
+
+	def last_change(self):
+		"""Returns the seq of the last committed change, to pass to changes_since() later.
+		"""
+		return next(self.database.read("SELECT COALESCE(MAX(seq), 0) FROM change_log"))[0]
+
+	def changes_since(self, seq, limit=None, deletes=False):
+		"""Returns (last, changes), changes mapping the id of each notecard changed after seq
+			to its net change: 'i' if it's new, 'd' if it's gone, 'u' otherwise. Cards added
+			and deleted in between are left out, unless deletes: then they're 'd', for callers
+			that may have added them themselves. Pass last next time.
+
+			changes is None when they can't be told any more, there are more than limit
+			(CHANGE_LOG_LIMIT by default) or there was a bulk write: everything should be read again.
+		"""
+		limit = limit or self.CHANGE_LOG_LIMIT
+		rows = list(self.database.read("SELECT seq, card_id, change FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?", [seq, limit + 1]))
+		if not rows:
+			return seq, {}
+		if rows[0][0] != seq + 1 or len(rows) > limit:		#Pruned since, or too many
+			return self.last_change(), None
+		if any(change == 'r' for row_seq, _id, change in rows):
+			return self.last_change(), None
+		first = {}
+		changes = {}
+		for row_seq, _id, change in rows:
+			first.setdefault(_id, change)
+			if first[_id] == 'i':
+				changes[_id] = 'i' if change != 'd' else 'd' if deletes else None
+			elif change == 'd':
+				changes[_id] = 'd'
+			else:
+				changes[_id] = 'u'		#Even if it was deleted first, its id was reused
+		return rows[-1][0], dict((_id, change) for _id, change in changes.items() if change)
+
+	def get_data_version(self):
+		"""Returns a number that changes whenever another connection, so another process, commits.
+		"""
+		return next(self.database.select("PRAGMA data_version"))[0]		#The writer's, nothing else here writes
+
+	def poll(self):
+		"""Catches up with what other processes wrote since the last call: the ids, samplers,
+			cache, snapshot and similarity index take in their changes from the change log.
+			Returns the changes, as changes_since() does, None meaning everything was read
+			again. Cheap when nothing happened, so it can be called every few seconds; it
+			blocks though, so it's for a worker thread.
+		"""
+		last = self.last_change()
+		version = self.get_data_version()
+		if version == self.data_version:
+			#Nobody else committed, so up to last the changes are all our own
+			self.seen = max(self.seen, last)
+			return {}
+		self.data_version = version
+		#Our own writes go first, so the change log has them in their place among the others
+		self.database.flush()
+		#Cards we added that another process deleted are among what we hold, so they count
+		last, changes = self.changes_since(self.seen, self.CHANGE_LOG_KEEP, deletes=True)
+		if changes is None:
+			self.reload()
+		else:
+			self.apply_changes(changes)
+		self.seen = last
+		return changes
+
+	def apply_changes(self, changes):
+		"""Brings what's kept in memory up to date with changes, from changes_since(). Our own
+			changes among them are taken in again, which does no harm.
+		"""
+		if not changes:
+			return
+		rows = []
+		changed = [_id for _id, change in changes.items() if change != 'd']
+		for start in range(0, len(changed), self.IN_CHUNK):
+			chunk = changed[start:start + self.IN_CHUNK]
+			rows += self.database.select("SELECT id, front, back, deck_id FROM notecard_table WHERE id IN (%s)"
+											% ','.join('?' * len(chunk)), chunk)
+		found = set(row[0] for row in rows)
+		deleted = [_id for _id in changes if _id not in found]		#Including those deleted again since
+		if len(changes) > self.cache.MAX_DIRTY:
+			self.cache.clear()
+		else:
+			#Ticket 0 is committed already, nothing needs to wait for it
+			for _id in changes:
+				self.cache.remove(0, _id)
+			for _id, front, back, deck_id in rows:
+				self.cache.add(0, _id, front, back)
+		with self.lock:
+			self.forget(deleted)
+			for _id, front, back, deck_id in rows:
+				self.ids.take(_id)
+				if self.sampler.deck_of(_id) != deck_id:
+					self.sampler.remove(_id)
+					self.sampler.add(_id, deck_id)
+				if self.similarity is not None:
+					self.similarity.add(_id, back)
+			if self.snapshot is not None:
+				self.snapshot.add_many((_id, front, back) for _id, front, back, deck_id in rows)
+		self.changed()
+
+	def reload(self):
+		"""Reads everything kept in memory from the database again, for when too much changed
+			elsewhere to catch up on change by change. Cards added meanwhile wait in added()
+			until it's done, so they go into the new ids and samplers, not the old ones.
+		"""
+		with self.lock:
+			self.database.flush()		#The snapshot is read on a reader, which only sees what's committed
+			self.cache.clear()
+			decks, ids = self.load_ids()
+			sampler = DeckSampler(decks)
+			sampler.select(self.sampler.selected)
+			self.ids = IdAllocator(ids)
+			self.sampler = self.scheduler.sampler = sampler
+			self.scheduler.remove_many([_id for _id in list(self.scheduler.cards) if sampler.deck_of(_id) is None])
+			if self.snapshot is not None:
+				self.snapshot = DeckSnapshot().build(self.database.stream("SELECT id, front, back FROM notecard_table",
+													reader=True, maxsize=4), self.last_change())
+			if self.similarity is not None:
+				self.rebuild_similar()
+		self.changed()
+
+	def open_snapshot(self, path=None):
+		"""Returns a DeckSnapshot of every notecard: the one saved at path if there is one, with
+			the changes since read in, otherwise one read from the database.
+		"""
+		snapshot = DeckSnapshot.load(path) if path else None
+		if snapshot is not None and snapshot.seq > self.last_change():
+			snapshot = None		#From another database
+		if snapshot is not None:
+			last, changes = self.changes_since(snapshot.seq, self.CHANGE_LOG_KEEP)
+			if changes is None:		#Too far behind
+				snapshot = None
+		if snapshot is not None:
+			changed = [_id for _id, change in changes.items() if change != 'd']
+			for _id, change in changes.items():
+				if change == 'd':
+					snapshot.remove(_id)
+			for start in range(0, len(changed), 500):
+				chunk = changed[start:start + 500]
+				snapshot.add_many(self.database.read("SELECT id, front, back FROM notecard_table WHERE id IN (%s)"
+														% ','.join('?' * len(chunk)), chunk))
+			snapshot.seq = last
+			if len(snapshot) != len(self.sampler.deck_ids) - self.sampler.deck_ids.count(-1):
+				snapshot = None		#Doesn't match after all
+		if snapshot is None:
+			seq = self.last_change()
+			snapshot = DeckSnapshot().build(self.database.stream("SELECT id, front, back FROM notecard_table",
+												reader=True, maxsize=4), seq)
+		return snapshot
+
+	def open_similar(self, path=None):
+		"""Returns the SimilarityIndex saved at path with the changes since taken in, or None
+			if there is none that can be used, see open_snapshot().
+		"""
+		similarity = SimilarityIndex.load(path) if path else None
+		if similarity is not None and similarity.seq > self.last_change():
+			similarity = None		#From another database
+		if similarity is not None:
+			last, changes = self.changes_since(similarity.seq, self.CHANGE_LOG_KEEP)
+			if changes is None:		#Too far behind
+				similarity = None
+		if similarity is not None:
+			similarity.remove_many([_id for _id, change in changes.items() if change == 'd'])
+			changed = [_id for _id, change in changes.items() if change != 'd']
+			for start in range(0, len(changed), self.IN_CHUNK):
+				chunk = changed[start:start + self.IN_CHUNK]
+				for _id, back in self.database.read("SELECT id, back FROM notecard_table WHERE id IN (%s)"
+													% ','.join('?' * len(chunk)), chunk):
+					similarity.add(_id, back)
+			similarity.seq = last
+			if len(similarity) != len(self.sampler.deck_ids) - self.sampler.deck_ids.count(-1):
+				similarity = None		#Doesn't match after all
+		return similarity
+
+	def rebuild_similar(self):
+		"""Starts self.similarity afresh, and fills it from a thread.
+		"""
+		self.similarity = SimilarityIndex(1 << max(10, len(self.sampler.deck_ids).bit_length()))
+		self.index_similar()
+
+	def index_similar(self, where='1', params=[]):
+		"""Adds the backs of the notecards matching where to self.similarity, from a thread of
+			its own, which is returned.
+		"""
+		similarity = self.similarity		#Not whichever a reload() puts in its place meanwhile
+		def build():
+			self.database.flush()		#The readers only see what's committed
+			similarity.build(self.database.stream("SELECT id, back FROM notecard_table WHERE " + where, params,
+													reader=True, maxsize=4))
+		thread = threading.Thread(target=build)
+		thread.daemon = True
+		thread.start()
+		self.indexing = [other for other in self.indexing if other.is_alive()] + [thread]
+		return thread
+
+	def create_fts(self):
+		"""Creates the full text table for search(), unless it's there already. Returns False if
+			this SQLite has no FTS5, search() then sticks to fronts.
+		"""
+		if list(self.database.select("SELECT 1 FROM sqlite_master WHERE name='notecard_fts'")):
+			return True
+		try:
+			list(self.database.select("""CREATE VIRTUAL TABLE notecard_fts USING fts5(front, back,
+										content='notecard_table', content_rowid='id')"""))
+		except sqlite3.OperationalError:
+			return False
+		#Triggers keep the full text index in step with the table
+		self.database.execute("""CREATE TRIGGER notecard_fts_insert AFTER INSERT ON notecard_table BEGIN
+									INSERT INTO notecard_fts (rowid, front, back) VALUES (new.id, new.front, new.back);
+								END""")
+		self.database.execute("""CREATE TRIGGER notecard_fts_delete AFTER DELETE ON notecard_table BEGIN
+									INSERT INTO notecard_fts (notecard_fts, rowid, front, back) VALUES ('delete', old.id, old.front, old.back);
+								END""")
+		self.database.execute("""CREATE TRIGGER notecard_fts_update AFTER UPDATE ON notecard_table BEGIN
+									INSERT INTO notecard_fts (notecard_fts, rowid, front, back) VALUES ('delete', old.id, old.front, old.back);
+									INSERT INTO notecard_fts (rowid, front, back) VALUES (new.id, new.front, new.back);
+								END""")
+		self.database.execute("INSERT INTO notecard_fts (notecard_fts) VALUES ('rebuild')")		#Index what's already there
+		return True
+
+	def get_smallest_avialable_id(self):
+		"""This function starts at 0 and returns the smallest possible id no.
+		"""
+		return self.ids.smallest()
+
+	def add_notecard(self, _id, front, back, deck_id=None):
+		"""This function adds a note card to the database and returns the value of the id column:
+			_id, unless another process took it meanwhile, then the next free id after it.
+			It goes in deck_id, or in the first selected deck if that's None. Waits for the
+			writer to run the INSERT, not for it to be committed.
+		"""
+		deck_id = self.check_new_notecard(_id, front, back, deck_id)
+		rows = list(self.database.select(self.inserting(_id, front, back, deck_id)))
+		return self.added(rows[0][0], front, back, deck_id, self.database.queued)
+
+	def check_new_notecard(self, _id, front, back, deck_id=None):
+		"""Raises ValueError if add_notecard() can't take these, otherwise returns the deck it goes in.
+		"""
+		self.check_id(_id)
+		for text in (front, back):
+			if not isinstance(text, string_types) or not text:
+				raise ValueError("A notecard's front and back are text, and not empty: %r" % (text,))
+		if deck_id is None:
+			deck_id = min(self.sampler.selected) if self.sampler.selected else 0
+		return deck_id
+
+	def inserting(self, _id, front, back, deck_id):
+		"""Returns the Steps that insert a notecard and send back the id it got. The id is
+			settled by the writer, which holds the write lock, so a card another process put at
+			_id since poll() last looked only moves this one along.
+		"""
+		return Steps(("""INSERT INTO notecard_table (id, front, back, deck_id)
+						SELECT CASE WHEN EXISTS (SELECT 1 FROM notecard_table WHERE id=?)
+							THEN (SELECT id + 1 FROM notecard_table AS taken WHERE id >= ?
+									AND NOT EXISTS (SELECT 1 FROM notecard_table WHERE id = taken.id + 1) ORDER BY id LIMIT 1)
+							ELSE ? END, ?, ?, ?""", [_id, _id, _id, front, back, deck_id]),
+					#Triggers don't change last_insert_rowid() once they're done
+					("SELECT id FROM notecard_table WHERE rowid = last_insert_rowid()", None))
+
+	def added(self, _id, front, back, deck_id, ticket):
+		"""Takes in notecard _id, whose INSERT has run and will be committed with ticket, and returns _id.
+			If that fails halfway, the card is deleted again rather than be known to some of them only.
+		"""
+		try:
+			with self.lock:
+				self.ids.take(_id)
+				self.sampler.add(_id, deck_id)
+				self.cache.add(ticket, _id, front, back)
+				if self.snapshot is not None:
+					self.snapshot.add(_id, front, back)
+				if self.similarity is not None:
+					self.similarity.add(_id, back)
+		except:
+			self.cache.remove(self.database.execute("DELETE FROM notecard_table WHERE id=?", [_id]), _id)
+			self.forget([_id])
+			raise
+		finally:
+			self.changed()
+		return _id
+
+	def import_csv(self, csvfile, batch_size=10000, deck_id=0):
+		"""Adds a notecard to deck_id for every front|back line of csvfile and returns how many there were.
+			The lines are read lazily in the worker thread into notecard_imports, and from there
+			go into notecard_table and the full text index with a statement each, in one writer
+			request, so either the whole file goes in or nothing does. Ids are taken batch_size
+			at a time; those another process took in the meantime are swapped for new ones
+			under the write lock, see importing().
+
+			The insert triggers are dropped for that request and made again at its end, so
+			other connections never see them missing: rather than a change_log row per card,
+			there's one 'r' that has views reload, see changes_since(). When there are at least
+			as many new cards as old ones, the indexes are made again afterwards as well, which
+			beats filling them a row at a time.
+		"""
+		taken = []
+		def notecards():
+			reader = enumerate(csv.reader(csvfile, MyDialect()), 1)
+			while True:
+				batch = list(itertools.islice(reader, batch_size))
+				if not batch:
+					return
+				ids = self.ids.take_many(len(batch))
+				taken.extend(ids)
+				rows = []
+				for _id, (line, row) in zip(ids, batch):
+					if len(row) < 2 or not row[0] or not row[1]:
+						raise ValueError("Line %d needs a front and a back" % line)
+					rows.append((_id, decode(row[0]), decode(row[1])))
+				if self.snapshot is not None:
+					self.snapshot.add_many(rows)
+				for _id, front, back in rows:
+					yield _id, front, back, deck_id
+		old = next(self.database.select("SELECT COUNT(*) FROM notecard_table"))[0]
+		try:
+			list(self.database.select(Steps(("DELETE FROM notecard_imports", ()),
+				("INSERT INTO notecard_imports (id, front, back, deck_id) VALUES (?,?,?,?)", Many(notecards())))))
+			moved = list(self.database.select(self.importing(len(taken) >= old)))
+		except:
+			for _id in taken:
+				self.ids.release(_id)
+				if self.snapshot is not None:
+					self.snapshot.remove(_id)
+			raise
+		#What was at the old ids is another process's, poll() will read it in
+		moves = dict((staged, _id) for staged, _id, front, back in moved)
+		used = [moves.get(_id, _id) for _id in taken]
+		with self.lock:
+			for _id in used:		#Again, in case reload() made new ones meanwhile
+				self.ids.take(_id)
+			if self.snapshot is not None:
+				self.snapshot.remove_many(moves)
+				self.snapshot.add_many((_id, front, back) for staged, _id, front, back in moved)
+			self.sampler.extend(used, deck_id)
+		self.cache.clear(self.database.queued)		#Any front may have turned up
+		if self.similarity is not None and used:
+			self.index_similar('deck_id=? AND id BETWEEN ? AND ?', [deck_id, min(used), max(used)])
+		self.changed()
+		return len(used)
+
+	def importing(self, rebuild):
+		"""Returns the Steps that move notecard_imports into notecard_table, see import_csv().
+			rebuild drops the indexes and makes them again after, the full text one included.
+
+			The ids were taken from self.ids, which doesn't know what other processes added
+			since we last polled. So first the rows whose id is in notecard_table by now are
+			inserted again past the highest id of either table, with the one they had in staged.
+			The rows sent back are (staged, id, front, back) for each of them.
+		"""
+		schema = list(self.database.select("""SELECT type, name, sql FROM sqlite_master WHERE tbl_name='notecard_table'
+												AND (type='trigger' AND name IN ('change_log_insert', 'notecard_fts_insert')
+												OR type='index' AND sql IS NOT NULL)"""))		#Not the primary key's
+		dropped = [(kind, name, sql) for kind, name, sql in schema if kind == 'trigger' or rebuild]
+		steps = [
+			#A row with no front holds the highest id in notecard_table, so new ones go past it
+			("""INSERT OR IGNORE INTO notecard_imports (id) SELECT id FROM (SELECT MAX(id) AS id FROM notecard_table)
+				WHERE id IS NOT NULL""", ()),
+			("""INSERT INTO notecard_imports (front, back, deck_id, staged) SELECT front, back, deck_id, id
+				FROM notecard_imports WHERE front IS NOT NULL AND id IN (SELECT id FROM notecard_table) ORDER BY id""", ()),
+			("""DELETE FROM notecard_imports WHERE front IS NULL
+				OR staged IS NULL AND id IN (SELECT id FROM notecard_table)""", ())]
+		steps += [("DROP %s %s" % (kind.upper(), name), ()) for kind, name, sql in dropped]
+		steps.append(("INSERT INTO notecard_table (id, front, back, deck_id) SELECT id, front, back, deck_id FROM notecard_imports", ()))
+		if self.fts and rebuild:
+			steps.append(("INSERT INTO notecard_fts (notecard_fts) VALUES ('rebuild')", ()))
+		elif self.fts:
+			steps.append(("INSERT INTO notecard_fts (rowid, front, back) SELECT id, front, back FROM notecard_imports", ()))
+		steps.append(("INSERT INTO change_log (card_id, change) VALUES (-1, 'r')", ()))
+		steps += [(sql, ()) for kind, name, sql in dropped]
+		steps.append(("DELETE FROM notecard_imports WHERE staged IS NULL", ()))
+		steps.append(("SELECT staged, id, front, back FROM notecard_imports", ()))		#The next import clears them
+		return Steps(*steps)
+
+	def export_csv(self, csvfile, deck_id=None):
+		"""Writes every notecard, or those in deck_id, to csvfile as a front|back line and returns
+			how many there were. Rows are streamed from the cursor a chunk at a time.
+		"""
+		writer = csv.writer(csvfile, MyDialect())
+		count = 0
+		where, decks = ('WHERE deck_id=?', [deck_id]) if deck_id is not None else ('', [])
+		for chunk in self.database.stream("SELECT front, back FROM notecard_table %s ORDER BY id" % where, decks, reader=True, maxsize=4):
+			writer.writerows([(encode(front), encode(back)) for front, back in chunk])
+			count += len(chunk)
+		return count
+
+	def delete_notecard(self, _id):
+		"""Deletes a notecard by id.
+		"""
+		self.delete_notecards([_id])
+
+	def delete_notecards(self, ids):
+		"""Deletes the notecards in ids, with one writer request, so in one transaction. More
+			than CHANGE_LOG_LIMIT of them would have views reload anyway, those are deleted
+			by set, see deleting().
+		"""
+		ids = list(ids)
+		if not ids:
+			return
+		if len(ids) > self.CHANGE_LOG_LIMIT:
+			cards = len(self.sampler.deck_ids) - self.sampler.deck_ids.count(-1)
+			ticket = self.database.execute(self.deleting(ids, 2 * len(ids) >= cards))
+		else:
+			#An executemany of id IN (...) rather than id=?, as every statement has the full text
+			#index write out what it holds
+			size, chunks = self.in_chunks(ids)
+			ticket = self.database.execute("DELETE FROM notecard_table WHERE id IN (%s)" % ','.join('?' * size), Many(chunks))
+		if len(ids) > self.cache.MAX_DIRTY:
+			self.cache.clear(ticket)		#Cheaper than tracking them one by one
+		else:
+			for _id in ids:
+				self.cache.remove(ticket, _id)
+		self.forget(ids)
+		self.changed()
+
+	def in_chunks(self, ids):
+		"""Returns (size, chunks): ids cut into chunks of size for an IN (...) or VALUES list
+			of that many, the last one padded with its last id.
+		"""
+		size = min(len(ids), self.IN_CHUNK)
+		chunks = [ids[start:start + size] for start in range(0, len(ids), size)]
+		chunks[-1] = chunks[-1] + chunks[-1][-1:] * (size - len(chunks[-1]))
+		return size, chunks
+
+	def deleting(self, ids, rebuild):
+		"""Returns the Steps that delete the notecards in ids by set, rather than have the
+			delete triggers run for each row: they're dropped for that request and made again
+			at its end, as in importing(). Meanwhile the media, schedule and reviews of the
+			cards go with a statement each, and one 'r' in the change log has views reload.
+			rebuild drops the indexes and makes them again after, the full text one included,
+			which beats taking the rows out of them when at least half of them go.
+		"""
+		schema = list(self.database.select("""SELECT type, name, sql FROM sqlite_master WHERE tbl_name='notecard_table'
+												AND (type='trigger' AND name IN ('notecard_fts_delete', 'change_log_delete', 'media_delete', 'schedule_delete')
+												OR type='index' AND sql IS NOT NULL)"""))		#Not the primary key's
+		dropped = [(kind, name, sql) for kind, name, sql in schema if kind == 'trigger' or rebuild]
+		names = set(name for kind, name, sql in dropped)
+		staged = "SELECT id FROM notecard_deletes"
+		size, chunks = self.in_chunks(ids)
+		steps = [("DELETE FROM notecard_deletes", ()),
+				("INSERT OR IGNORE INTO notecard_deletes (id) VALUES %s" % ','.join(['(?)'] * size), Many(chunks))]
+		steps += [("DROP %s %s" % (kind.upper(), name), ()) for kind, name, sql in dropped]
+		if 'notecard_fts_delete' in names and not rebuild:
+			steps.append(("""INSERT INTO notecard_fts (notecard_fts, rowid, front, back)
+							SELECT 'delete', id, front, back FROM notecard_table WHERE id IN (%s)""" % staged, ()))
+		for trigger, table in [('media_delete', 'media_table'), ('schedule_delete', 'schedule_table'), ('schedule_delete', 'review_table')]:
+			if trigger in names:
+				steps.append(("DELETE FROM %s WHERE card_id IN (%s)" % (table, staged), ()))
+		steps.append(("DELETE FROM notecard_table WHERE id IN (%s)" % staged, ()))
+		if self.fts and rebuild:
+			steps.append(("INSERT INTO notecard_fts (notecard_fts) VALUES ('rebuild')", ()))
+		steps.append(("INSERT INTO change_log (card_id, change) VALUES (-1, 'r')", ()))
+		steps += [(sql, ()) for kind, name, sql in dropped]
+		steps.append(("DELETE FROM notecard_deletes", ()))
+		return Steps(*steps)
+
+	def forget(self, ids):
+		"""Takes deleted notecards out of everything kept in memory but the cache.
+		"""
+		with self.lock:
+			self.ids.release_many(ids)
+			self.sampler.remove_many(ids)
+			if self.snapshot is not None:
+				self.snapshot.remove_many(ids)
+			if self.similarity is not None:
+				self.similarity.remove_many(ids)
+			self.scheduler.remove_many(ids)
+
+	def get_all_notecards(self):
+		return [ i for i in self.database.read("SELECT * FROM notecard_table")]
+
+	def get_page(self, offset, limit, order_by='id', descending=False, ids=None):
+		"""Returns up to limit (id, front, back) notecards, skipping the first offset of them
+			in the given order. ids, if not None, limits it to those notecards.
+		"""
+		if order_by not in ('id', 'front', 'back'):
+			raise ValueError("Can't order by %r" % order_by)
+		direction = ' DESC' if descending else ''
+		#Ties go by rowid, which the indexes already hold, so the whole ORDER BY comes out of one
+		order = order_by + direction + (', rowid' + direction if order_by != 'id' else '')
+		where, decks = self.deck_filter()
+		if ids is not None:
+			where += ' AND id IN (%s)' % ','.join('?' * len(ids))
+		return list(self.database.read("SELECT id, front, back FROM notecard_table WHERE %s ORDER BY %s LIMIT ? OFFSET ?"
+										% (where, order), decks + list(ids or []) + [limit, offset]))
+
+	def get_notecard_by_id(self, _id):
+		card = self.snapshot.card(_id) if self.snapshot is not None else self.cache.card(_id)
+		if card is None:
+			version, read = self.cache.source(('id', _id))
+			row = next(read("SELECT id, front, back FROM notecard_table WHERE id=?", [_id]))
+			self.cache.store_cards(version, [row])
+			card = row[1:]
+		return card
+
+	def edit_notecard(self, _id, front=None, back=None):
+		self.update_notecards([(_id, front, back)])
+
+	def update_notecards(self, rows):
+		"""Edits each (id, front, back) of rows, with one UPDATE, so in one transaction. Empty
+			values keep what is already there.
+		"""
+		rows = list(rows)
+		if not rows:
+			return
+		edits = {}		#The same id twice makes one edit, as if they were done in turn
+		for _id, front, back in rows:
+			old = edits.get(_id, (None, None))
+			edits[_id] = (front or old[0], back or old[1])
+		#The new values go in a temporary table for one UPDATE to pick up, as every statement
+		#has the full text index write out what it holds. Merging in SQL means we don't
+		#have to read the cards first, which a reader could answer with stale copies. The
+		#table is shared, so the three run as one request that nobody else's edits get into.
+		ticket = self.database.execute(Steps(
+			("INSERT INTO notecard_edits (id, front, back) VALUES (?,?,?)",
+				Many([(_id, front, back) for _id, (front, back) in edits.items()])),
+			("""UPDATE notecard_table SET
+				front=COALESCE(NULLIF((SELECT front FROM notecard_edits WHERE notecard_edits.id = notecard_table.id), ''), front),
+				back=COALESCE(NULLIF((SELECT back FROM notecard_edits WHERE notecard_edits.id = notecard_table.id), ''), back)
+				WHERE id IN (SELECT id FROM notecard_edits)""", None),
+			("DELETE FROM notecard_edits", None)))
+		if len(rows) > self.cache.MAX_DIRTY:
+			self.cache.clear(ticket)
+		else:
+			for _id, front, back in rows:
+				self.cache.edit(ticket, _id, front, back)
+		for _id, front, back in rows:
+			if self.snapshot is not None:
+				self.snapshot.edit(_id, front, back)
+			if self.similarity is not None and back:
+				self.similarity.add(_id, back)
+		self.changed()
+
+	def changed(self):
+		"""Called after every change to the notecards, to throw away what was derived from them.
+		"""
+		if self.prefetcher:
+			self.prefetcher.invalidate()
+
+	def lookup(self, front):
+		"""This function looks up the front of a notecard and returns the back, or "" if there is none.
+		"""
+		answer = self.cache.answer(front)
+		if answer is None:
+			version, read = self.cache.source(('front', front))
+			answer = next(read("SELECT id, back FROM notecard_table WHERE front =? LIMIT 1", [front]), (None, u''))
+			self.cache.store_answer(version, front, *answer)
+		return answer[1] or ""
+
+	def search(self, query, limit=50):
+		"""Returns up to limit (id, front, back) notecards matching query: fronts starting with it
+			first, then full text matches on every word's prefix in the front or back, best first.
+		"""
+		query = query.strip()
+		if not query:
+			return []
+
+		#A range on the front index, rather than LIKE, which can't use it
+		where, decks = self.deck_filter()
+		notecards = list(self.database.read("SELECT id, front, back FROM notecard_table WHERE %s AND front >= ? AND front < ?\
+											ORDER BY front LIMIT ?" % where, decks + [query, query + u'\U0010ffff', limit]))
+		if self.fts and len(notecards) < limit:
+			match = ' '.join('"%s"*' % word.replace('"', '""') for word in query.split())
+			found = set(notecard[0] for notecard in notecards)
+			where, decks = self.deck_filter('notecard_table.deck_id')
+			for notecard in self.database.read("SELECT notecard_fts.rowid, notecard_fts.front, notecard_fts.back FROM notecard_fts\
+												JOIN notecard_table ON notecard_table.id = notecard_fts.rowid\
+												WHERE notecard_fts MATCH ? AND %s ORDER BY rank LIMIT ?" % where, [match] + decks + [limit]):
+				if notecard[0] not in found:
+					notecards.append(notecard)
+		return notecards[:limit]
+
+	def get_notecards(self, ids):
+		"""Returns the (front, back) of each id that exists, in the order of ids.
+		"""
+		if self.snapshot is not None:
+			return self.snapshot.get(ids)
+		ids = list(ids)
+		notecards = {}
+		missing = []
+		for _id in ids:
+			card = self.cache.card(_id)
+			if card is None:
+				missing.append(_id)
+			else:
+				notecards[_id] = card
+		if missing:
+			version, read = self.cache.source(*[('id', _id) for _id in missing])
+			rows = list(read("SELECT id, front, back FROM notecard_table WHERE id IN (%s)" % ','.join('?' * len(missing)), missing))
+			self.cache.store_cards(version, rows)
+			notecards.update((row[0], row[1:]) for row in rows)
+		return [notecards[_id] for _id in ids if _id in notecards]
+
+	def attach_media(self, _id, source, mime_type):
+		"""Stores what the file object, or file name, source holds and attaches it to notecard
+			_id. Returns its digest. The same content is only stored once, however many cards have it.
+		"""
+		digest, size = self.media.put(source)
+		self.database.execute("INSERT OR REPLACE INTO media_table (card_id, digest, mime_type, size) VALUES (?,?,?,?)",
+								[_id, digest, mime_type, size])
+		return digest
+
+	def detach_media(self, _id, digest):
+		"""Takes digest off notecard _id. What's stored stays until prune_media().
+		"""
+		self.database.execute("DELETE FROM media_table WHERE card_id=? AND digest=?", [_id, digest])
+
+	def get_media(self, _id):
+		"""Returns (digest, mime_type, size) for everything attached to notecard _id, without
+			reading any of it; see MediaStore.chunks() for that.
+		"""
+		return list(self.database.read("SELECT digest, mime_type, size FROM media_table WHERE card_id=? ORDER BY rowid", [_id]))
+
+	def prune_media(self):
+		"""Removes the stored media no notecard has any more and returns how many files went.
+		"""
+		#From the writer, which has seen every attach_media() so far
+		used = set(row[0] for row in self.database.select("SELECT DISTINCT digest FROM media_table"))
+		return self.media.prune(used)
+
+	def random_notecard(self):
+		"""This function returns a tuple (front, back), choosing randomly from database.
+		"""
+		return self.get_notecards(self.sampler.sample(1))[0]
+
+	def random_question(self, choices=3):
+		"""This function returns a tuple (front, answer_index, choice1, choice2,...)
+			where front is the question, answer_index indicates which choice from the remaining is the correct answer.
+			There are as many choices as asked for, or as there are notecards with other backs if that is fewer.
+		"""
+		#Drawing ids from the sampler is O(choices), ORDER BY RANDOM() would sort the whole table
+		return self.make_question(self.get_notecards(self.question_ids(None, choices)), choices)
+
+	def question(self, _id, choices=3):
+		"""Like random_question, but asks about notecard _id.
+		"""
+		return self.make_question(self.get_notecards(self.question_ids(_id, choices)), choices)
+
+	def question_ids(self, _id=None, choices=3):
+		"""Returns the ids of the notecards for a question about _id, or a random one if it's None:
+			_id first, then candidates for the other choices, alike ones first if self.similarity
+			has any. There are a few more than needed, make_question() drops those with the same back.
+		"""
+		if _id is None:
+			ids = self.sampler.sample(1)
+			if not ids:
+				return []
+			_id = ids[0]
+		others = []
+		if self.similarity is not None:
+			others = self.similarity.similar(_id, choices, lambda other: self.sampler.is_selected(self.sampler.deck_of(other)))
+		others += [other for other in self.sampler.sample(choices) if other != _id and other not in others]
+		return [_id] + others
+
+	def next_question(self, choices=3):
+		"""Returns (id, question) for the card the scheduler wants to ask next, see random_question.
+		"""
+		_id = self.scheduler.next_card()
+		return _id, self.question(_id, choices)
+
+	def ready_question(self):
+		"""Like next_question, but from the prefetched ones if there are any. Returns None
+			if there are no notecards.
+		"""
+		if self.prefetcher:
+			return self.prefetcher.get()
+		return self.next_question() if len(self.sampler) else None
+
+	def make_question(self, notecards, choices=None):
+		"""Turns [(front, back), ...] into a question about the first one. With choices, there are
+			at most that many and none of the others has the right back.
+		"""
+		front = notecards[0][0]
+
+		backs = [notecard[1] for notecard in notecards[1:]]		# remember a notecard is (front, back), 
+																# This collects all the backs of the notecards
+		if choices is None:
+			choices = backs
+		else:
+			choices = [back for i, back in enumerate(backs) if back != notecards[0][1] and back not in backs[:i]][:choices - 1]
+
+		#And now insert the right choice into the choices, randomly offcourse
+		r = random.randint(0,len(choices))		#Choosing a random spot
+		choices.insert(r, notecards[0][1])		#Insert the right choice
+		return [front, r] + choices
+
+	def count_notecards(self):
+		"""Returns how many notecards there are in the selected decks.
+		"""
+		where, decks = self.deck_filter()
+		return next(self.database.read("SELECT COUNT(*) FROM notecard_table WHERE " + where, decks))[0]
+
+	def deck_filter(self, column='deck_id'):
+		"""Returns (condition, parameters) limiting a query on notecard_table to the selected decks.
+		"""
+		if self.sampler.selected is None:
+			return '1', []
+		decks = sorted(self.sampler.selected)
+		return '%s IN (%s)' % (column, ','.join('?' * len(decks))), decks
+
+	def get_decks(self):
+		"""Returns (id, name, count) for every deck, by name. Read by the readers, unless a
+			deck was added or deleted since the last commit.
+		"""
+		ticket = self.deck_ticket
+		read = self.database.read if ticket is None or self.database.is_committed(ticket) else self.database.select
+		return [(deck, name, self.sampler.size(deck)) for deck, name in read("SELECT id, name FROM deck_table ORDER BY name")]
+
+	def get_deck(self, name):
+		"""Returns the id of the deck called name, or None.
+		"""
+		rows = list(self.database.select("SELECT id FROM deck_table WHERE name=?", [name]))
+		return rows[0][0] if rows else None
+
+	def add_deck(self, name):
+		"""Creates a deck called name, unless there is one already, and returns its id.
+		"""
+		deck = self.get_deck(name)
+		if deck is None:
+			deck = list(self.database.select("SELECT COALESCE(MAX(id), -1) + 1 FROM deck_table"))[0][0]
+			self.deck_ticket = self.database.execute("INSERT INTO deck_table (id, name) VALUES (?,?)", [deck, name])
+		return deck
+
+	def delete_deck(self, deck_id):
+		"""Deletes a deck and every notecard in it. The default deck, 0, only gets emptied.
+		"""
+		ids = self.sampler.sampler(deck_id).all()
+		ticket = self.database.execute("DELETE FROM notecard_table WHERE deck_id=?", [deck_id])
+		if deck_id != 0:
+			self.deck_ticket = self.database.execute("DELETE FROM deck_table WHERE id=?", [deck_id])
+		self.forget(ids)
+		self.cache.clear(ticket)
+		if self.sampler.selected is not None and deck_id in self.sampler.selected and deck_id != 0:
+			self.sampler.select(self.sampler.selected - set([deck_id]) or None)
+		self.changed()
+
+	def select_decks(self, deck_ids):
+		"""Limits questions, counts, pages and searches to the decks in deck_ids, or lifts the
+			limit if it's None. Nothing is read again, every deck's ids are already in memory.
+		"""
+		self.sampler.select(deck_ids)
+		self.changed()
+
+	def selected_decks(self):
+		"""Returns the set of selected decks, or None if they all are.
+		"""
+		return self.sampler.selected
+
+	def flush(self):
+		"""Blocks until every change so far has been committed, so the readers see it.
+		"""
+		self.database.flush()
+
+	def stats(self, reset=False):
+		"""Per statement timings and queue depths so far, see safeDatabase.stats(), and
+			how the notecard cache did.
+		"""
+		stats = self.database.stats(reset)
+		stats['cache'] = self.cache.stats(reset)
+		return stats
+
+	def close(self):
+		"""Writes what the scheduler still holds and closes the database.
+		"""
+		if self.prefetcher:
+			self.prefetcher.close()
+		self.scheduler.flush()
+		if self.snapshot_file:
+			self.poll()		#So the saved snapshot has what other processes wrote too
+			self.database.flush()
+			last = self.last_change()
+			if last != self.snapshot.seq or not os.path.exists(self.snapshot_file):
+				self.snapshot.save(self.snapshot_file, last)
+			if self.similarity is not None and not any(thread.is_alive() for thread in self.indexing):
+				if last != self.similarity.seq or not os.path.exists(self.similar_file):
+					self.similarity.save(self.similar_file, last)
+		self.database.close()
+
+
+class MyDialect(csv.excel):
+	def __init__(self):
+		csv.Dialect.__init__(self)
+		self.delimiter = '|'
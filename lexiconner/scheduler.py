@@ -0,0 +1,237 @@
+"""Deciding what to ask next: the SM-2 scheduler and the question prefetcher.
+"""
+import time
+import threading
+import traceback
+import heapq
+import collections
+
+from lexiconner.database import Many
+
+DAY = 24 * 60 * 60
+
+
+class Scheduler(object):
+	"""Decides which notecard to ask next, using SM-2 spaced repetition.
+
+		Cards that have been answered at least once have a state [due, interval, ease, repetitions]
+		in self.cards and a (due, id) entry in the heap of their deck in self.due, so only the
+		selected decks' heaps are looked at. Rescheduling pushes a new entry and leaves the old
+		one behind, to be skipped when it reaches the top. Cards that have never been answered
+		have no state and are picked at random from the selected decks once nothing is due.
+
+		Answers go to review_table and states to schedule_table batch_size at a time.
+	"""
+	SNOOZE = 10 * 60		#How long a card that was asked but not answered stays away
+	RETRY = 10 * 60			#When a card that was answered wrong comes back
+
+	def __init__(self, database, sampler, batch_size=20):
+		self.database = database
+		self.sampler = sampler
+		self.batch_size = batch_size
+		self.lock = threading.Lock()
+		self.create_tables()
+		self.cards = {}
+		for row in self.database.select("SELECT card_id, due, interval, ease, repetitions FROM schedule_table"):
+			self.cards[row[0]] = list(row[1:])
+		self.due = {}		#Deck -> heap of (due, id)
+		for _id, state in self.cards.items():
+			self.due.setdefault(self.sampler.deck_of(_id), []).append((state[0], _id))
+		for heap in self.due.values():
+			heapq.heapify(heap)
+		self.reviews = []		#(card_id, time, correct) not written yet
+		self.changed = {}		#States not written yet, by card id
+		self.snoozed = {}		#Card id -> (due before it was snoozed, due since), see unsnooze()
+
+	def create_tables(self):
+		self.database.execute("""CREATE TABLE IF NOT EXISTS review_table
+								(card_id	INT 	NOT NULL,
+								reviewed	REAL	NOT NULL,
+								correct		INT		NOT NULL);""")
+		self.database.execute("CREATE INDEX IF NOT EXISTS review_card ON review_table (card_id)")
+		self.database.execute("""CREATE TABLE IF NOT EXISTS schedule_table
+								(card_id		INT 	PRIMARY KEY 	NOT NULL,
+								due 			REAL					NOT NULL,
+								interval		REAL					NOT NULL,
+								ease			REAL					NOT NULL,
+								repetitions		INT						NOT NULL);""")
+		#A deleted card takes its history with it, its id may be handed out again
+		self.database.execute("""CREATE TRIGGER IF NOT EXISTS schedule_delete AFTER DELETE ON notecard_table BEGIN
+									DELETE FROM schedule_table WHERE card_id = old.id;
+									DELETE FROM review_table WHERE card_id = old.id;
+								END""")
+
+	def next_card(self):
+		"""Returns the id of the card to ask next: the most overdue one, or a new one if none are due,
+			or None if there are no cards. It is snoozed until it gets answered.
+		"""
+		now = time.time()
+		with self.lock:
+			first = None		#Heap whose top is due first
+			for deck, heap in self.due.items():
+				if not self.sampler.is_selected(deck):
+					continue
+				while heap and self.cards.get(heap[0][1], (None,))[0] != heap[0][0]:
+					heapq.heappop(heap)		#Rescheduled or deleted since
+				if heap and (first is None or heap[0] < first[0]):
+					first = heap
+			if first is None or first[0][0] > now:
+				_id = self.new_card()
+				if _id is not None:
+					return _id
+			if first is None:
+				return None
+			_id = first[0][1]
+			self.snoozed[_id] = (self.cards[_id][0], now + self.SNOOZE)
+			self.cards[_id][0] = now + self.SNOOZE
+			heapq.heapreplace(first, (now + self.SNOOZE, _id))
+			return _id
+
+	def unsnooze(self, ids):
+		"""Gives the cards in ids back the place next_card() took them from, for when their
+			questions were thrown away without being asked. Cards answered since keep their new one.
+		"""
+		with self.lock:
+			for _id in ids:
+				due, snoozed = self.snoozed.pop(_id, (None, None))
+				state = self.cards.get(_id)
+				if state is not None and state[0] == snoozed:
+					state[0] = due
+					heapq.heappush(self.due.setdefault(self.sampler.deck_of(_id), []), (due, _id))
+
+	def new_card(self, tries=20):
+		"""Returns a random card that has never been answered, or None if it can't find one quickly.
+		"""
+		for _id in self.sampler.sample(tries):
+			if _id not in self.cards:
+				return _id
+
+	def record(self, _id, correct):
+		"""Reschedules card _id after it was answered, correct being whether it was on the first try.
+		"""
+		now = time.time()
+		with self.lock:
+			self.snoozed.pop(_id, None)
+			due, interval, ease, repetitions = self.cards.get(_id, (now, 0, 2.5, 0))
+			quality = 4 if correct else 1
+			ease = max(1.3, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+			if correct:
+				repetitions += 1
+				interval = DAY if repetitions == 1 else 6 * DAY if repetitions == 2 else interval * ease
+			else:
+				repetitions = 0
+				interval = self.RETRY
+			state = self.cards[_id] = [now + interval, interval, ease, repetitions]
+			heapq.heappush(self.due.setdefault(self.sampler.deck_of(_id), []), (state[0], _id))
+			self.changed[_id] = state
+			self.reviews.append((_id, now, int(correct)))
+			if len(self.reviews) >= self.batch_size:
+				self.write()
+
+	def remove(self, _id):
+		"""Forgets card _id, which has been deleted.
+		"""
+		self.remove_many([_id])
+
+	def remove_many(self, ids):
+		with self.lock:
+			ids = set(ids)
+			for _id in ids:
+				self.cards.pop(_id, None)
+				self.changed.pop(_id, None)
+				self.snoozed.pop(_id, None)
+			self.reviews = [review for review in self.reviews if review[0] not in ids]
+
+	def write(self):
+		"""Queues the answers and states that haven't been written yet. Call with self.lock held.
+		"""
+		#Cards deleted while their question was open are left out
+		if self.reviews:
+			self.database.execute("INSERT INTO review_table (card_id, reviewed, correct) SELECT ?,?,?\
+									WHERE EXISTS (SELECT 1 FROM notecard_table WHERE id=?)",
+									Many([review + (review[0],) for review in self.reviews]))
+			self.reviews = []
+		if self.changed:
+			self.database.execute("INSERT OR REPLACE INTO schedule_table (card_id, due, interval, ease, repetitions)\
+									SELECT ?,?,?,?,? WHERE EXISTS (SELECT 1 FROM notecard_table WHERE id=?)",
+									Many([[_id] + state + [_id] for _id, state in self.changed.items()]))
+			self.changed = {}
+
+	def flush(self):
+		with self.lock:
+			self.write()
+
+
+class QuestionPrefetcher(threading.Thread):
+	"""Keeps a few questions ready, so a question window doesn't have to wait for the database.
+		The thread tops self.ready up to size whenever one is taken. invalidate() throws away
+		everything made before a notecard changed, including a question being made right then;
+		the scheduler gets those cards back where they were, as they were never asked.
+	"""
+	def __init__(self, notecards, size=3, choices=3):
+		super(QuestionPrefetcher, self).__init__()
+		self.daemon = True
+		self.notecards = notecards
+		self.size = size
+		self.choices = choices
+		self.ready = collections.deque()		#(id, question)
+		self.generation = 0			#Goes up on every invalidate()
+		self.condition = threading.Condition()
+		self.closed = False
+		self.start()
+
+	def run(self):
+		empty = None		#Generation in which there turned out to be no notecards
+		committed = 0		#Generation whose changes the readers are known to see
+		while True:
+			with self.condition:
+				while not self.closed and (len(self.ready) >= self.size or empty == self.generation):
+					self.condition.wait()
+				if self.closed:
+					return
+				generation = self.generation
+			try:
+				if committed != generation:
+					self.notecards.flush()		#Or the readers might not see what changed
+					committed = generation
+				question = self.make()
+			except Exception:
+				traceback.print_exc()
+				question = None
+			with self.condition:
+				if question is None:
+					empty = generation
+				elif generation == self.generation:
+					self.ready.append(question)
+					question = None
+			if question is not None:
+				self.notecards.scheduler.unsnooze([question[0]])		#Thrown away meanwhile
+
+	def make(self):
+		"""Returns (id, question) straight from the database, or None if there are no notecards.
+		"""
+		if not len(self.notecards.sampler):
+			return None
+		return self.notecards.next_question(self.choices)
+
+	def get(self):
+		"""Returns (id, question), see NotecardsHandler.next_question, or None if there are no
+			notecards. Only goes to the database if nothing is ready.
+		"""
+		with self.condition:
+			question = self.ready.popleft() if self.ready else None
+			self.condition.notify()
+		return question or self.make()
+
+	def invalidate(self):
+		with self.condition:
+			dropped = [question[0] for question in self.ready]
+			self.ready.clear()
+			self.generation += 1
+			self.condition.notify()
+		self.notecards.scheduler.unsnooze(dropped)
+
+	def close(self):
+		with self.condition:
+			self.closed = True
+			self.condition.notify()
@@ -0,0 +1,349 @@
+"""A quiz server on a Unix domain socket, Python 3 only:
+
+	python3 -m lexiconner.server [--database FILE] [--socket PATH]
+
+Every client shares the one NotecardsHandler, so its writer, snapshot and scheduler, through an
+AsyncNotecardsHandler on a single event loop; no client has a connection of its own. Requests
+and responses are JSON objects, one to a line:
+
+	{"id": 1, "op": "question"}
+	{"id": 1, "result": {"card": 12, "front": "chien", "choices": ["cat", "dog", "bird"]}}
+	{"id": 2, "op": "answer", "card": 12, "choice": 1}
+	{"id": 2, "result": {"correct": true, "answer": 1}}
+
+A client may send any number of requests without waiting. They take effect in the order they
+were sent, so a count after an add counts the new card, and the responses come back in that
+order too, each with the id it was sent with. See QuizProtocol for the ops.
+
+Written without async/await, as lexiconner.aio is.
+"""
+import os
+import sys
+import json
+import signal
+import socket
+import asyncio
+import argparse
+import collections
+
+from lexiconner.aio import AsyncNotecardsHandler
+from lexiconner.config import DATABASE_FILE, SOCKET_FILE, make_config_dir
+from lexiconner.notecards import NotecardsHandler
+
+
+class RequestError(Exception):
+	"""A request that can't be answered, its message goes back to the client.
+	"""
+
+
+class QuizProtocol(asyncio.Protocol):
+	"""One client. Each line is a request, answered by the method do_<op>, which returns the
+		result or a future of it. Responses wait for those of the requests before them.
+		Requests that only read run side by side, but a write (an op in WRITES) only starts
+		once every request before it is done, and those after it wait for it to be committed.
+
+		Ops, besides id and op:
+			question [choices]		the card the scheduler asks next: {card, front, choices},
+									or null if there are none
+			random [choices]		the same for a random card
+			answer card choice		checks the choice against the last question about card, the
+									first answer to it goes to the scheduler: {correct, answer}
+			lookup front			the back of the notecard with front, or ""
+			get ids					[[front, back], ...] of the ids that exist
+			count					how many notecards there are in the selected decks
+			add front back [deck]	adds a notecard once it's committed, returns its id
+
+		Once MAX_PENDING responses are waiting, or the client isn't reading them, no more
+		requests are read from it until it catches up.
+	"""
+	MAX_LINE = 64 * 1024
+	MAX_PENDING = 64
+	MAX_ASKED = 1024		#Questions kept for answers, the oldest go first
+	WRITES = frozenset(['add'])
+
+	def __init__(self, server):
+		self.server = server
+		self.notecards = server.notecards
+		self.transport = None
+		self.buffer = b''
+		self.pending = collections.deque()		#(request id, future), in the order they came
+		self.asked = collections.OrderedDict()		#Card id -> index of the right choice
+		self.reading = True
+		self.writing = True
+		self.last_write = None		#Future of the last write, until it's done
+
+	def connection_made(self, transport):
+		self.transport = transport
+		self.server.clients.add(self)
+
+	def connection_lost(self, error):
+		self.server.clients.discard(self)
+		for request_id, future in self.pending:
+			future.cancel()
+		self.pending.clear()
+
+	def data_received(self, data):
+		lines = (self.buffer + data).split(b'\n')
+		self.buffer = lines.pop()		#Not a whole line yet
+		for line in lines:
+			if self.transport.is_closing():
+				return
+			if line.strip():
+				self.request(line)
+		if len(self.buffer) > self.MAX_LINE:
+			self.respond(None, error="line too long")
+			self.transport.close()
+			return
+		self.throttle()
+
+	def request(self, line):
+		request_id = None
+		try:
+			request = json.loads(line.decode('utf-8'))
+			if not isinstance(request, dict):
+				raise RequestError("a request is a JSON object")
+			request_id = request.get('id')
+			method = getattr(self, 'do_' + str(request.get('op')), None)
+			if method is None:
+				raise RequestError("no such op: %s" % request.get('op'))
+		except Exception as e:
+			result = self.server.loop.create_future()
+			result.set_exception(e)
+		else:
+			result = self.start(method, request)
+		self.pending.append((request_id, result))
+		result.add_done_callback(self.send_ready)
+
+	def start(self, method, request):
+		"""Returns a future of method(request), called now or once what it must wait for is done.
+		"""
+		write = request.get('op') in self.WRITES
+		if write:
+			before = [future for request_id, future in self.pending if not future.done()]
+		else:
+			before = [self.last_write] if self.last_write is not None and not self.last_write.done() else []
+		if not before:
+			result = self.call(method, request)
+		else:
+			result = self.server.loop.create_future()
+			def relay(future):
+				if result.cancelled():
+					return
+				if future.cancelled():
+					result.cancel()
+				elif future.exception() is not None:
+					result.set_exception(future.exception())
+				else:
+					result.set_result(future.result())
+			def go(ignored):
+				if not result.cancelled():
+					self.call(method, request).add_done_callback(relay)
+			asyncio.gather(*before, return_exceptions=True).add_done_callback(go)
+		if write:
+			self.last_write = result
+		return result
+
+	def call(self, method, *args):
+		"""Returns a future of method(*args), failed if it raised.
+		"""
+		try:
+			result = method(*args)
+		except Exception as e:
+			result = self.server.loop.create_future()
+			result.set_exception(e)
+		if not isinstance(result, asyncio.Future):
+			result = self.notecards.done(result)
+		return result
+
+	def send_ready(self, future=None):
+		"""Writes the responses that are ready, in order.
+		"""
+		while self.pending and self.pending[0][1].done():
+			request_id, future = self.pending.popleft()
+			if future.cancelled():
+				continue
+			error = future.exception()
+			if error is None:
+				self.respond(request_id, result=future.result())
+			elif isinstance(error, (RequestError, KeyError, ValueError, TypeError)):
+				self.respond(request_id, error=str(error) if not isinstance(error, KeyError) else "missing %s" % error)
+			else:
+				self.respond(request_id, error="%s: %s" % (type(error).__name__, error))
+		self.throttle()
+
+	def respond(self, request_id, **response):
+		if self.transport is None or self.transport.is_closing():
+			return
+		response['id'] = request_id
+		self.transport.write(json.dumps(response, separators=(',', ':')).encode('utf-8') + b'\n')
+
+	def throttle(self):
+		"""Stops reading requests while too many responses wait, or can't be written.
+		"""
+		if self.transport is None or self.transport.is_closing():
+			return
+		reading = self.writing and len(self.pending) < self.MAX_PENDING
+		if reading != self.reading:
+			self.reading = reading
+			if reading:
+				self.transport.resume_reading()
+			else:
+				self.transport.pause_reading()
+
+	def pause_writing(self):
+		self.writing = False
+		self.throttle()
+
+	def resume_writing(self):
+		self.writing = True
+		self.throttle()
+
+	def ask(self, _id, question):
+		"""Keeps the answer of question about _id and returns what the client gets of it.
+		"""
+		front, answer_index = question[:2]
+		self.asked.pop(_id, None)
+		self.asked[_id] = answer_index
+		if len(self.asked) > self.MAX_ASKED:
+			self.asked.popitem(last=False)
+		return {'card': _id, 'front': front, 'choices': question[2:]}
+
+	def do_question(self, request):
+		choices = int(request.get('choices', 3))
+		return self.notecards.then(self.notecards.next_question(choices),
+									lambda question: question and self.ask(*question))
+
+	def do_random(self, request):
+		choices = int(request.get('choices', 3))
+		ids = self.notecards.notecards.sampler.sample(1)
+		if not ids:
+			return None
+		return self.notecards.then(self.notecards.question(ids[0], choices), lambda question: self.ask(ids[0], question))
+
+	def do_answer(self, request):
+		_id, choice = int(request['card']), int(request['choice'])
+		if _id not in self.asked:
+			raise RequestError("card %d hasn't been asked" % _id)
+		answer = self.asked.pop(_id)		#Only the first try counts
+		self.notecards.notecards.scheduler.record(_id, choice == answer)
+		return {'correct': choice == answer, 'answer': answer}
+
+	def do_lookup(self, request):
+		return self.notecards.lookup(request['front'])
+
+	def do_get(self, request):
+		return self.notecards.then(self.notecards.get_notecards([int(_id) for _id in request['ids']]),
+									lambda cards: [list(card) for card in cards])
+
+	def do_count(self, request):
+		return self.notecards.count_notecards()
+
+	def do_add(self, request):
+		front, back, deck = request['front'], request['back'], request.get('deck')
+		if not isinstance(front, str) or not isinstance(back, str) or not front or not back:
+			raise RequestError("front and back must be strings, and not empty")
+		if deck is not None and (not isinstance(deck, int) or isinstance(deck, bool)):
+			raise RequestError("deck must be a deck id")
+		notecards = self.notecards.notecards
+		_id = notecards.get_smallest_avialable_id()
+		return self.notecards.add_notecard(_id, front, back, deck)
+
+
+class QuizServer(object):
+	"""Serves an AsyncNotecardsHandler on a Unix domain socket. The answers the scheduler holds
+		are written out every SCHEDULE_FLUSH seconds, as the indicator does, and what other
+		processes write is taken in every POLL_INTERVAL seconds, on a thread of the loop's executor.
+	"""
+	SCHEDULE_FLUSH = 60
+	POLL_INTERVAL = 2
+
+	def __init__(self, notecards):
+		self.notecards = notecards
+		self.loop = notecards.loop
+		self.clients = set()
+		self.server = None
+		self.path = None
+		self.timer = None
+		self.poll_timer = None
+
+	def start(self, path):
+		"""Returns a future done once it's listening on path. A socket left there by a server
+			that's gone is replaced, one that's still answering is an error.
+		"""
+		if os.path.exists(path):
+			probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			try:
+				probe.connect(path)
+			except socket.error:
+				os.remove(path)		#Nobody home
+			else:
+				raise RuntimeError("%s is already being served" % path)
+			finally:
+				probe.close()
+		self.path = path
+		def listening(server):
+			self.server = server
+			os.chmod(path, 0o600)		#Only for this user
+			self.flush()
+			self.poll_timer = self.loop.call_later(self.POLL_INTERVAL, self.poll)
+		return self.notecards.then(asyncio.ensure_future(
+							self.loop.create_unix_server(lambda: QuizProtocol(self), path), loop=self.loop), listening)
+
+	def flush(self):
+		self.notecards.notecards.scheduler.flush()
+		self.timer = self.loop.call_later(self.SCHEDULE_FLUSH, self.flush)
+
+	def poll(self):
+		def polled(future):
+			if not future.cancelled() and future.exception() is not None:
+				sys.stderr.write("Couldn't read the changes: %s\n" % future.exception())
+			if self.server is not None and self.server.is_serving():
+				self.poll_timer = self.loop.call_later(self.POLL_INTERVAL, self.poll)
+		self.poll_timer = None
+		self.loop.run_in_executor(None, self.notecards.notecards.poll).add_done_callback(polled)
+
+	def close(self):
+		"""Stops listening and hangs up on every client. Returns a future done once it's closed.
+		"""
+		for timer in (self.timer, self.poll_timer):
+			if timer is not None:
+				timer.cancel()
+		for client in list(self.clients):
+			client.transport.close()
+		if self.server is None:
+			return self.notecards.done(None)
+		self.server.close()
+		if self.path and os.path.exists(self.path):
+			os.remove(self.path)
+		return asyncio.ensure_future(self.server.wait_closed(), loop=self.loop)
+
+
+def main(argv=None):
+	"""Serves the notecards until interrupted.
+	"""
+	parser = argparse.ArgumentParser(prog='python3 -m lexiconner.server', description="Serves quizzes on a Unix domain socket.")
+	parser.add_argument('--database', default=DATABASE_FILE, help="defaults to %(default)s")
+	parser.add_argument('--socket', default=SOCKET_FILE, help="defaults to %(default)s")
+	args = parser.parse_args(argv)
+
+	if args.database == DATABASE_FILE or args.socket == SOCKET_FILE:
+		make_config_dir()
+
+	loop = asyncio.new_event_loop()
+	asyncio.set_event_loop(loop)
+	notecards = NotecardsHandler(args.database, readers=2, snapshot=True, similar=True)		#Questions never wait on the database
+	server = QuizServer(AsyncNotecardsHandler(notecards, loop))
+	try:
+		loop.run_until_complete(server.start(args.socket))
+		for signum in (signal.SIGINT, signal.SIGTERM):
+			loop.add_signal_handler(signum, loop.stop)
+		sys.stderr.write("Serving %s on %s\n" % (args.database, args.socket))
+		loop.run_forever()
+		loop.run_until_complete(server.close())
+	finally:
+		notecards.close()
+		loop.close()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,257 @@
+"""SimilarityIndex, which finds notecards whose backs look alike, for distractors that aren't
+trivially wrong.
+"""
+import os
+import zlib
+import array
+import random
+import struct
+import itertools
+import threading
+
+from lexiconner.snapshot import to_bytes, from_bytes
+
+EMPTY = 0x7fffffff		#Bigger than any hash, once masked to fit in 32 bits
+
+class SimilarityIndex(object):
+	"""Locality sensitive hashing over the character trigrams of each back. A back's MinHash
+		signature is one hash of its trigrams, split into SIGNATURE bins by value with the
+		smallest kept in each (one permutation hashing), so a back takes one pass over its
+		trigrams. Cut into BANDS bands, each band of a signature is hashed to a key. Backs
+		sharing a key likely share many trigrams, and the more bands they share the more.
+
+		Each band is a hash table of circular doubly linked lists kept in arrays: self.heads[band]
+		holds a card of every bucket, self.next, self.prev and self.keys the rest, indexed by
+		id, as NotecardsHandler keeps ids below MAX_ID; -1 is none. So adding, moving and
+		removing a card are O(1), and a card costs 48 bytes, ids and keys being 32 bit.
+		similar() moves the head on past the cards it looked at, so a bucket of many alike
+		backs takes turns.
+
+		Hashes are CRC-32s rather than hash(), which Python salts per process, so an index
+		saved by save() still matches the backs added after load() does.
+	"""
+	BANDS = 4
+	ROWS = 2		#Bins to a band, more makes matches rarer and closer
+	SIGNATURE = BANDS * ROWS
+	MAX_WALK = 32		#Most cards looked at in a bucket, those made of the same back can get long
+	MAGIC = b'LXSIMI1\n'
+	HEADER = struct.Struct('=8sqqqqq')		#Magic, seq, item size, buckets, length of the columns, cards
+
+	def __init__(self, buckets=1024):
+		self.lock = threading.Lock()
+		self.cards = 0
+		self.resize(buckets)
+		self.keys = [array.array('i') for band in range(self.BANDS)]
+		self.next = [array.array('i') for band in range(self.BANDS)]
+		self.prev = [array.array('i') for band in range(self.BANDS)]
+		self.touched = None		#Ids written to while a build() runs, which it must leave alone
+		self.builds = 0
+		self.seq = 0		#Last change_log seq in here, as of save() or load()
+
+	def __len__(self):
+		return self.cards
+
+	def resize(self, buckets):
+		self.mask = buckets - 1		#A power of two
+		self.heads = [array.array('i', [-1]) * buckets for band in range(self.BANDS)]
+
+	def signature(self, text):
+		"""Returns the BANDS keys of text.
+		"""
+		data = (u' %s ' % text.lower()).encode('utf-8') if not isinstance(text, bytes) else b' ' + text.lower() + b' '
+		size = self.SIGNATURE
+		mins = [EMPTY] * size
+		for h in map(zlib.crc32, set([data[i:i + 3] for i in range(len(data) - 2)])):
+			h &= EMPTY
+			if h < mins[h % size]:
+				mins[h % size] = h
+		steps = [0] * size
+		if EMPTY in mins and min(mins) != EMPTY:
+			#Short backs leave bins empty, which would make all short backs alike. Those take
+			#the next bin that isn't, with how far it is (densification)
+			steps = [next(step for step in range(size) if mins[(b + step) % size] != EMPTY) for b in range(size)]
+			mins = [mins[(b + step) % size] for b, step in enumerate(steps)]
+		rows = self.ROWS
+		band = struct.Struct('=%di' % (2 * rows))
+		return [zlib.crc32(band.pack(*(mins[i * rows:(i + 1) * rows] + steps[i * rows:(i + 1) * rows]))) & EMPTY
+				for i in range(self.BANDS)]
+
+	def _grow(self, _id):
+		if _id >= len(self.keys[0]):
+			grow = array.array('i', [-1]) * (_id + 1 - len(self.keys[0]))
+			for columns in (self.keys, self.next, self.prev):
+				for column in columns:
+					column.extend(grow)
+
+	def _link(self, band, _id, key):
+		"""Puts _id last in its bucket, just before the head.
+		"""
+		heads, nxt, prev = self.heads[band], self.next[band], self.prev[band]
+		bucket = key & self.mask
+		self.keys[band][_id] = key
+		head = heads[bucket]
+		if head == -1:
+			heads[bucket] = nxt[_id] = prev[_id] = _id
+		else:
+			nxt[_id], prev[_id] = head, prev[head]
+			nxt[prev[head]] = _id
+			prev[head] = _id
+
+	def _unlink(self, band, _id):
+		heads, nxt, prev = self.heads[band], self.next[band], self.prev[band]
+		bucket = self.keys[band][_id] & self.mask
+		if nxt[_id] == _id:
+			heads[bucket] = -1
+		else:
+			nxt[prev[_id]] = nxt[_id]
+			prev[nxt[_id]] = prev[_id]
+			if heads[bucket] == _id:
+				heads[bucket] = nxt[_id]
+		self.keys[band][_id] = nxt[_id] = prev[_id] = -1
+
+	def _put(self, _id, back):
+		self._grow(_id)
+		if self.keys[0][_id] == -1:
+			self.cards += 1
+			if self.cards > 2 * (self.mask + 1):
+				self._rehash(4 * (self.mask + 1))
+		else:
+			for band in range(self.BANDS):
+				self._unlink(band, _id)
+		for band, key in enumerate(self.signature(back)):
+			self._link(band, _id, key)
+
+	def _rehash(self, buckets):
+		"""Spreads the cards over more buckets, so the lists stay short.
+		"""
+		self.resize(buckets)
+		for band in range(self.BANDS):
+			keys = self.keys[band]
+			for _id in range(len(keys)):
+				if keys[_id] != -1:
+					self._link(band, _id, keys[_id])
+
+	def add(self, _id, back):
+		"""Adds notecard _id, or moves it if its back changed.
+		"""
+		with self.lock:
+			if self.touched is not None:
+				self.touched.add(_id)
+			self._put(_id, back)
+
+	def remove(self, _id):
+		self.remove_many([_id])
+
+	def remove_many(self, ids):
+		"""Removes the cards in ids, a band at a time: _unlink() inlined, which matters for
+			bulk deletes of tens of thousands.
+		"""
+		with self.lock:
+			if self.touched is not None:
+				self.touched.update(ids)
+			length = len(self.keys[0])
+			present = set(_id for _id in ids if 0 <= _id < length and self.keys[0][_id] != -1)
+			mask = self.mask
+			for band in range(self.BANDS):
+				heads, nxt, prev, keys = self.heads[band], self.next[band], self.prev[band], self.keys[band]
+				for _id in present:
+					after = nxt[_id]
+					bucket = keys[_id] & mask
+					if after == _id:
+						heads[bucket] = -1
+					else:
+						before = prev[_id]
+						nxt[before] = after
+						prev[after] = before
+						if heads[bucket] == _id:
+							heads[bucket] = after
+					keys[_id] = nxt[_id] = prev[_id] = -1
+			self.cards -= len(present)
+
+	def build(self, chunks):
+		"""Adds chunks of (id, back) rows, as safeDatabase.stream() returns them. Meant for a
+			thread of its own, as it takes a while: add() and remove() may be called meanwhile,
+			what they did isn't undone with what the rows say.
+		"""
+		with self.lock:
+			if not self.builds:
+				self.touched = set()
+			self.builds += 1
+		try:
+			for chunk in chunks:
+				with self.lock:		#A chunk at a time, so the others get a turn
+					for _id, back in chunk:
+						if _id not in self.touched:
+							self._put(_id, back)
+		finally:
+			with self.lock:
+				self.builds -= 1
+				if not self.builds:
+					self.touched = None
+
+	def save(self, path, seq=None):
+		"""Writes the index to path, as of change seq, for load(). The file is replaced at once.
+		"""
+		with self.lock:
+			if seq is not None:
+				self.seq = seq
+			with open(path + '.tmp', 'wb') as index:
+				index.write(self.HEADER.pack(self.MAGIC, self.seq, self.keys[0].itemsize, self.mask + 1,
+												len(self.keys[0]), self.cards))
+				for band in range(self.BANDS):
+					for column in (self.heads, self.keys, self.next, self.prev):
+						index.write(to_bytes(column[band]))
+			os.rename(path + '.tmp', path)
+
+	@classmethod
+	def load(cls, path):
+		"""Reads an index save() wrote, or returns None if it can't be used.
+		"""
+		try:
+			index = open(path, 'rb')
+		except IOError:
+			return None
+		with index:
+			header = index.read(cls.HEADER.size)
+			if len(header) < cls.HEADER.size:
+				return None
+			magic, seq, itemsize, buckets, length, cards = cls.HEADER.unpack(header)
+			self = cls(buckets)
+			if magic != cls.MAGIC or itemsize != self.keys[0].itemsize:
+				return None		#Some other format, or written by another architecture
+			for band in range(self.BANDS):
+				for column, size in ((self.heads, buckets), (self.keys, length), (self.next, length), (self.prev, length)):
+					data = index.read(size * itemsize)
+					if len(data) != size * itemsize:
+						return None
+					column[band] = from_bytes('i', data)
+		self.seq = seq
+		self.cards = cards
+		return self
+
+	def similar(self, _id, count, accept=None):
+		"""Returns up to count ids of notecards whose backs look like that of _id, most alike
+			first, ties in random order. accept(id), if given, must be true of each.
+		"""
+		with self.lock:
+			if not 0 <= _id < len(self.keys[0]) or self.keys[0][_id] == -1:
+				return []
+			shared = {}		#Id -> bands in common
+			for band in range(self.BANDS):
+				keys, nxt, heads = self.keys[band], self.next[band], self.heads[band]
+				key = keys[_id]
+				bucket = key & self.mask
+				other = heads[bucket]
+				for step in range(self.MAX_WALK):
+					if other != _id and keys[other] == key:		#Not another key in the same bucket
+						shared[other] = shared.get(other, 0) + 1
+					other = nxt[other]
+					if other == heads[bucket]:
+						break
+				heads[bucket] = other		#The next question starts where this one stopped
+		ids = list(shared)
+		random.shuffle(ids)
+		ids.sort(key=shared.get, reverse=True)
+		if accept is not None:
+			ids = itertools.islice((other for other in ids if accept(other)), count)
+		return list(ids)[:count]
@@ -0,0 +1,260 @@
+"""DeckSnapshot, a compact read-only copy of every front and back, so questions are made without
+asking the database.
+"""
+import os
+import copy
+import mmap
+import array
+import struct
+import threading
+
+
+def to_bytes(column):
+	return column.tobytes() if hasattr(column, 'tobytes') else column.tostring()
+
+def utf8(text):
+	"""What gets stored for text, which may come as UTF-8 already, as gtk hands it on Python 2.
+	"""
+	return text if isinstance(text, bytes) else text.encode('utf-8')
+
+def from_bytes(typecode, data):
+	column = array.array(typecode)
+	if hasattr(column, 'frombytes'):
+		column.frombytes(data)
+	else:
+		column.fromstring(data)
+	return column
+
+
+class DeckSnapshot(object):
+	"""Every notecard's front and back, packed: the strings are UTF-8 one after another, string
+		i running from self.starts[i] to self.starts[i + 1], and self.fronts and self.backs
+		hold the string of each card, indexed by id as NotecardsHandler keeps ids below
+		MAX_ID; -1 means there is no such card. Equal strings are stored once, so the backs a deck repeats cost
+		nothing. That's about 30 bytes a card besides the text, where a tuple of two strings
+		takes some 200.
+
+		The strings can also stay in a file saved by save() and mapped by load(), only the
+		pages that get read are then ever in memory. Written cards get their strings
+		appended in memory, what they replace is left where it is until it makes up half the
+		text and compact() drops it.
+	"""
+	MAGIC = b'LXSNAP1\n'
+	HEADER = struct.Struct('=8sqqqqq')		#Magic, seq, item size, cards, strings, text bytes
+	MAX_INTERNED = 65536		#Strings add_many() remembers, past that the dict would take more than it saves
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.fronts = array.array('l')
+		self.backs = array.array('l')
+		self.starts = array.array('l', [0])
+		self.mapped = b''		#Text of the strings in the file, if it's mapped
+		self.mapped_at = 0		#Where it starts in there
+		self.mapped_bytes = 0
+		self.text = bytearray()		#Text of every other string, at offsets from mapped_bytes on
+		self.interned = None		#Bytes -> string, while adding many
+		self.garbage = 0		#Bytes of the strings no card uses any more
+		self.cards = 0
+		self.seq = 0		#Last change_log seq in here, see NotecardsHandler.changes_since()
+
+	def __len__(self):
+		return self.cards
+
+	def build(self, chunks, seq=0):
+		"""Fills an empty snapshot from chunks of (id, front, back) rows, as safeDatabase.stream() returns them.
+		"""
+		with self.lock:
+			self.interned = {}
+			for chunk in chunks:
+				self._add_many(chunk)
+			self.interned = None
+			self.seq = seq
+		return self
+
+	def _string(self, i):
+		start, end = self.starts[i], self.starts[i + 1]
+		if end <= self.mapped_bytes:
+			return self.mapped[self.mapped_at + start:self.mapped_at + end]
+		return bytes(self.text[start - self.mapped_bytes:end - self.mapped_bytes])
+
+	def _intern(self, data):
+		interned = self.interned
+		if interned is not None:
+			i = interned.get(data)
+			if i is not None:
+				return i
+			if len(interned) < self.MAX_INTERNED:
+				interned[data] = len(self.starts) - 1
+		self.text += data
+		self.starts.append(self.starts[-1] + len(data))
+		return len(self.starts) - 2
+
+	def _grow(self, _id):
+		if _id >= len(self.fronts):
+			grow = array.array('l', [-1]) * (_id + 1 - len(self.fronts))
+			self.fronts.extend(grow)
+			self.backs.extend(grow)
+
+	def _put(self, _id, front, back):
+		self._grow(_id)
+		if self.fronts[_id] == -1:
+			self.cards += 1
+		self.fronts[_id] = self._replace(self.fronts[_id], utf8(front))
+		self.backs[_id] = self._replace(self.backs[_id], utf8(back))
+
+	def _replace(self, i, data):
+		"""Returns the string for data, to take the place of string i, or of nothing if it's -1.
+		"""
+		if i != -1:
+			if self._string(i) == data:
+				return i
+			self._drop(i)
+		return self._intern(data)
+
+	def _drop(self, i):
+		#Strings shared by several cards get counted once per card, compact() makes it right again
+		self.garbage += self.starts[i + 1] - self.starts[i]
+
+	def card(self, _id):
+		"""Returns the (front, back) of _id, or None.
+		"""
+		with self.lock:
+			return self._card(_id)
+
+	def _card(self, _id):
+		if not 0 <= _id < len(self.fronts) or self.fronts[_id] == -1:
+			return None
+		return self._string(self.fronts[_id]).decode('utf-8'), self._string(self.backs[_id]).decode('utf-8')
+
+	def get(self, ids):
+		"""Returns the (front, back) of each id that exists, in the order of ids.
+		"""
+		with self.lock:
+			cards = [self._card(_id) for _id in ids]
+		return [card for card in cards if card is not None]
+
+	def add(self, _id, front, back):
+		with self.lock:
+			self._put(_id, front, back)
+
+	def add_many(self, cards):
+		"""Adds (id, front, back) cards, storing the strings they repeat once, or at least
+			the first MAX_INTERNED different ones.
+		"""
+		with self.lock:
+			self.interned = {}
+			self._add_many(cards)
+			self.interned = None
+
+	def _add_many(self, cards):
+		cards = list(cards)
+		if not cards:
+			return
+		self._grow(max(card[0] for card in cards))
+		fronts, backs, intern = self.fronts, self.backs, self._intern
+		for _id, front, back in cards:
+			if fronts[_id] != -1:
+				self._put(_id, front, back)
+				continue
+			#New cards, which is nearly all of them, skip what _put() checks
+			fronts[_id] = intern(utf8(front))
+			backs[_id] = intern(utf8(back))
+			self.cards += 1
+
+	def edit(self, _id, front=None, back=None):
+		"""Empty values are left as they were, as in NotecardsHandler.edit_notecard().
+		"""
+		with self.lock:
+			old = self._card(_id)
+			if old is not None:
+				self._put(_id, front or old[0], back or old[1])
+				self._compact_if_needed()
+
+	def remove(self, _id):
+		self.remove_many([_id])
+
+	def remove_many(self, ids):
+		with self.lock:
+			for _id in ids:
+				if 0 <= _id < len(self.fronts) and self.fronts[_id] != -1:
+					self._drop(self.fronts[_id])
+					self._drop(self.backs[_id])
+					self.fronts[_id] = self.backs[_id] = -1
+					self.cards -= 1
+			self._compact_if_needed()
+
+	def _compact_if_needed(self):
+		if self.garbage * 2 > self.starts[-1]:
+			self._compact()
+
+	def compact(self):
+		"""Copies the strings cards still use into a fresh text, each once, and lets go of the file.
+		"""
+		with self.lock:
+			self._compact()
+
+	def _compact(self):
+		old = copy.copy(self)		#Reads the strings from where they are now
+		self.fronts, self.backs = array.array('l', [-1]) * len(old.fronts), array.array('l', [-1]) * len(old.backs)
+		self.starts = array.array('l', [0])
+		self.mapped, self.mapped_at, self.mapped_bytes = b'', 0, 0
+		self.text = bytearray()
+		self.garbage = 0
+		self.interned = {}
+		for _id in range(len(old.fronts)):
+			if old.fronts[_id] != -1:
+				self.fronts[_id] = self._intern(old._string(old.fronts[_id]))
+				self.backs[_id] = self._intern(old._string(old.backs[_id]))
+		self.interned = None
+
+	def save(self, path, seq=None):
+		"""Writes the snapshot to path, as of change seq, for load(). The file is replaced at once.
+		"""
+		with self.lock:
+			if seq is not None:
+				self.seq = seq
+			if self.garbage * 4 > self.starts[-1]:
+				self._compact()		#No point keeping it on disk
+			with open(path + '.tmp', 'wb') as snapshot:
+				snapshot.write(self.HEADER.pack(self.MAGIC, self.seq, self.fronts.itemsize, len(self.fronts),
+												len(self.starts) - 1, self.starts[-1]))
+				for column in (self.fronts, self.backs, self.starts):
+					snapshot.write(to_bytes(column))
+				snapshot.write(self.mapped[self.mapped_at:self.mapped_at + self.mapped_bytes])
+				snapshot.write(self.text)
+			os.rename(path + '.tmp', path)
+
+	@classmethod
+	def load(cls, path, use_mmap=True):
+		"""Reads a snapshot save() wrote, or returns None if it can't be used. With use_mmap the
+			text stays in the file, mapped read only, instead of being read in.
+		"""
+		try:
+			snapshot = open(path, 'rb')
+		except IOError:
+			return None
+		with snapshot:
+			header = snapshot.read(cls.HEADER.size)
+			if len(header) < cls.HEADER.size:
+				return None
+			magic, seq, itemsize, cards, strings, text_bytes = cls.HEADER.unpack(header)
+			self = cls()
+			if magic != cls.MAGIC or itemsize != self.fronts.itemsize:
+				return None		#Some other format, or written by another architecture
+			columns = [snapshot.read(cards * itemsize), snapshot.read(cards * itemsize), snapshot.read((strings + 1) * itemsize)]
+			if [len(column) for column in columns] != [cards * itemsize, cards * itemsize, (strings + 1) * itemsize]:
+				return None
+			self.fronts, self.backs, self.starts = [from_bytes('l', column) for column in columns]
+			if use_mmap and text_bytes:
+				self.mapped = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)		#Stays valid once the file is closed
+				self.mapped_at = snapshot.tell()
+				self.mapped_bytes = text_bytes
+				if len(self.mapped) < self.mapped_at + text_bytes:
+					return None
+			else:
+				self.text = bytearray(snapshot.read(text_bytes))
+				if len(self.text) != text_bytes:
+					return None
+		self.seq = seq
+		self.cards = len(self.fronts) - self.fronts.count(-1)
+		return self
@@ -0,0 +1,61 @@
+"""What the tests that need a NotecardsHandler share.
+"""
+import io
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from lexiconner.notecards import NotecardsHandler
+
+
+def csv_file(text):
+	"""What import_csv() reads: bytes on Python 2, text on Python 3.
+	"""
+	return io.BytesIO(text.encode('utf-8')) if str is bytes else io.StringIO(text)
+
+
+class Quiet(object):
+	"""Swallows the tracebacks threads print, like the worker's for statements nobody waits for.
+	"""
+	def __enter__(self):
+		self.stderr, sys.stderr = sys.stderr, self
+	def __exit__(self, *error):
+		sys.stderr = self.stderr
+	def write(self, text):
+		pass
+	def flush(self):
+		pass
+
+
+class NotecardsTestCase(unittest.TestCase):
+	"""Each test gets a directory of its own, and every handler open() made is closed after
+		it. Two handlers on one file stand in for two processes.
+	"""
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix='lexiconner-test-')
+		self.path = os.path.join(self.directory, 'test.db')
+		self.handlers = []
+
+	def tearDown(self):
+		for notecards in self.handlers:
+			close(notecards)
+		shutil.rmtree(self.directory)
+
+	def open(self, **kwargs):
+		notecards = NotecardsHandler(self.path, **kwargs)
+		self.handlers.append(notecards)
+		return notecards
+
+	def add(self, notecards, front, back=u'back', deck_id=None):
+		return notecards.add_notecard(notecards.get_smallest_avialable_id(), front, back, deck_id)
+
+
+def close(notecards):
+	"""Closes notecards and waits for its threads to be done.
+	"""
+	notecards.close()
+	notecards.database.join()
+	for reader in notecards.database.readers:
+		reader.join()
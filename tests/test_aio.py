@@ -0,0 +1,73 @@
+"""AsyncNotecardsHandler: futures resolved by the database threads. Python 3 only, as it is.
+"""
+import unittest
+
+try:
+	import asyncio
+	from lexiconner.aio import AsyncNotecardsHandler
+except ImportError:		#Python 2
+	asyncio = None
+
+from tests.support import NotecardsTestCase, csv_file
+
+
+@unittest.skipIf(asyncio is None, "lexiconner.aio needs asyncio")
+class AsyncNotecardsTest(NotecardsTestCase):
+	def setUp(self):
+		NotecardsTestCase.setUp(self)
+		self.loop = asyncio.new_event_loop()
+		self.addCleanup(self.loop.close)
+
+	def open(self, **kwargs):
+		notecards = NotecardsTestCase.open(self, **kwargs)
+		notecards.import_csv(csv_file(u''.join(u'front%d|back%d\n' % (i, i) for i in range(25))))
+		notecards.flush()		#For the readers
+		return AsyncNotecardsHandler(notecards, self.loop)
+
+	def wait(self, future):
+		return self.loop.run_until_complete(asyncio.wait_for(future, 10))
+
+	def read(self, rows, count=None):
+		"""Reads count rows off the async iterator rows, or all of them.
+		"""
+		read = []
+		while count is None or len(read) < count:
+			try:
+				read.append(self.wait(rows.__anext__()))
+			except StopAsyncIteration:
+				break
+		return read
+
+	def test_calls_resolve_on_the_loop(self):
+		notecards = self.open(readers=1)
+		_id = self.wait(notecards.add_notecard(notecards.notecards.get_smallest_avialable_id(), u'chien', u'dog'))
+		self.assertEqual(_id, 25)
+		backs = self.wait(asyncio.gather(notecards.lookup(u'chien'), notecards.lookup(u'front3'), notecards.lookup(u'nope')))
+		self.assertEqual(backs, [u'dog', u'back3', u''])
+		self.wait(notecards.edit_notecard(_id, back=u'hound'))
+		self.assertEqual(self.wait(notecards.get_notecard_by_id(_id)), (u'chien', u'hound'))
+		self.assertEqual(self.wait(notecards.count_notecards()), 26)
+
+	def test_iter_all_reads_every_page(self):
+		notecards = self.open(readers=1)
+		rows = self.read(notecards.iter_all(page=10))
+		self.assertEqual(rows, [(i, u'front%d' % i, u'back%d' % i) for i in range(25)])
+		self.assertEqual(self.read(notecards.iter_all(page=25)), rows)		#A last page that's empty
+
+	def test_an_abandoned_iterator_holds_nobody_up(self):
+		notecards = self.open(readers=1)
+		self.assertEqual(len(self.read(notecards.iter_all(page=2), 1)), 1)		#Never closed
+		self.assertEqual(self.wait(notecards.lookup(u'front20')), u'back20')		#On the only reader
+
+	def test_the_writer_is_free_between_pages(self):
+		notecards = self.open(readers=0)
+		rows = notecards.iter_all(page=5)
+		read = self.read(rows, 3)
+		self.wait(notecards.delete_notecard(24))
+		read += self.read(rows)
+		self.assertEqual([row[0] for row in read], list(range(24)))
+		self.wait(rows.aclose())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,95 @@
+"""update_notecards() and delete_notecards(): many notecards in one writer request.
+"""
+import io
+import threading
+import unittest
+
+from lexiconner.notecards import NotecardsHandler
+from tests.support import NotecardsTestCase, csv_file
+
+
+def lines(count):
+	return csv_file(u''.join(u'front%d|back%d\n' % (i, i) for i in range(count)))
+
+
+class BulkTest(NotecardsTestCase):
+	def test_update_notecards(self):
+		notecards = self.open()
+		ids = [self.add(notecards, front) for front in [u'un', u'deux', u'trois']]
+		notecards.update_notecards([(ids[0], u'eins', u''), (ids[1], None, u'two'), (ids[0], u'', u'one')])
+		notecards.flush()
+		self.assertEqual(notecards.get_notecards(ids), [(u'eins', u'one'), (u'deux', u'two'), (u'trois', u'back')])
+		self.assertEqual([card[0] for card in notecards.search(u'eins')], [ids[0]])
+		self.assertEqual(notecards.search(u'un'), [])
+
+	def test_concurrent_updates_all_land(self):
+		notecards = self.open()
+		notecards.import_csv(lines(400))
+		def edit(start):
+			for _id in range(start, 400, 4):
+				notecards.edit_notecard(_id, back=u'edited%d' % _id)
+		threads = [threading.Thread(target=edit, args=(start,)) for start in range(4)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		notecards.flush()
+		backs = dict(notecards.database.read("SELECT id, back FROM notecard_table"))
+		self.assertEqual(backs, dict((_id, u'edited%d' % _id) for _id in range(400)))
+
+	def test_delete_notecards(self):
+		notecards = self.open()
+		count = NotecardsHandler.IN_CHUNK + 3		#A padded last chunk
+		notecards.import_csv(lines(count))
+		kept = [1, count - 1]
+		seq = notecards.last_change()
+		notecards.delete_notecards([_id for _id in range(count) if _id not in kept])
+		notecards.flush()
+		self.assertEqual(notecards.count_notecards(), 2)
+		self.assertEqual(notecards.get_notecards(range(count)), [(u'front1', u'back1'), (u'front%d' % (count - 1), u'back%d' % (count - 1))])
+		self.assertEqual(notecards.search(u'back0'), [])
+		self.assertEqual(notecards.lookup(u'front2'), u'')
+		self.assertEqual(notecards.get_smallest_avialable_id(), 0)
+		self.assertEqual(notecards.ids.take_many(3), [0, 2, 3])
+		self.assertEqual(len(notecards.changes_since(seq)[1]), count - 2)		#Row by row
+		notecards.delete_notecards([])
+
+	def test_many_are_deleted_by_set(self):
+		notecards = self.open()
+		count = NotecardsHandler.CHANGE_LOG_LIMIT * 3
+		notecards.import_csv(lines(count))
+		gone = [_id for _id in range(count) if _id % 3]		#Fewer than half stay, the indexes are made again
+		for _id in (0, 1):
+			notecards.scheduler.record(_id, True)
+			notecards.attach_media(_id, io.BytesIO(b'picture'), 'image/png')
+		notecards.scheduler.flush()
+		seq = notecards.last_change()
+		notecards.delete_notecards(gone + gone[:10])		#Twice over makes no difference
+		notecards.flush()
+		self.assertEqual(notecards.count_notecards(), count // 3)
+		self.assertEqual(notecards.changes_since(seq)[1], None)		#Views reload
+		self.assertEqual([card[1] for card in notecards.search(u'back%d' % (count - 3))], [u'front%d' % (count - 3)])
+		self.assertEqual(notecards.search(u'back%d' % (count - 1)), [])
+		for table in ('media_table', 'schedule_table', 'review_table'):
+			self.assertEqual(list(notecards.database.read("SELECT DISTINCT card_id FROM %s" % table)), [(0,)])
+		indexes = list(notecards.database.read("SELECT name FROM sqlite_master WHERE type='index' AND name LIKE 'notecard_%'"))
+		self.assertEqual(len(indexes), 4)
+		seq = notecards.last_change()
+		notecards.delete_notecard(0)		#The triggers are back
+		notecards.flush()
+		self.assertEqual(notecards.changes_since(seq)[1], {0: 'd'})
+		self.assertEqual(notecards.get_media(0), [])
+
+	def test_fewer_keep_the_indexes(self):
+		notecards = self.open()
+		count = NotecardsHandler.CHANGE_LOG_LIMIT * 4
+		notecards.import_csv(lines(count))
+		notecards.delete_notecards([_id for _id in range(count) if _id % 3 == 0])
+		notecards.flush()
+		self.assertEqual(notecards.count_notecards(), count - len(range(0, count, 3)))
+		self.assertEqual(notecards.search(u'back%d' % (count - 1)), [])		#Its full text rows taken out one by one
+		self.assertEqual([card[1] for card in notecards.search(u'back%d' % (count - 2))], [u'front%d' % (count - 2)])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,91 @@
+"""NotecardCache: what it keeps, what it drops, and where it sends the reads of keys just written.
+"""
+import unittest
+
+from lexiconner.cache import NotecardCache
+from tests.support import NotecardsTestCase
+
+
+class FakeDatabase(object):
+	"""Just the tickets: those in self.committed have been committed.
+	"""
+	def __init__(self):
+		self.committed = set()
+	def is_committed(self, ticket):
+		return ticket in self.committed
+	def select(self, req, arg=None):
+		pass
+	def read(self, req, arg=None):
+		pass
+
+
+class NotecardCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.database = FakeDatabase()
+		self.cache = NotecardCache(self.database)
+
+	def test_writes_go_to_the_writer_until_committed(self):
+		self.assertEqual(self.cache.source(('id', 1))[1], self.database.read)
+		self.cache.add(7, 1, u'chien', u'dog')
+		self.assertEqual(self.cache.card(1), (u'chien', u'dog'))
+		self.assertEqual(self.cache.source(('front', u'chien'))[1], self.database.select)
+		self.assertEqual(self.cache.source(('id', 2))[1], self.database.read)
+		self.database.committed.add(7)
+		self.assertEqual(self.cache.source(('id', 1))[1], self.database.read)
+
+	def test_reads_older_than_a_write_are_not_kept(self):
+		version, read = self.cache.source(('id', 1))
+		self.cache.edit(3, 1, back=u'new')
+		self.cache.store_cards(version, [(1, u'chien', u'old')])
+		self.assertEqual(self.cache.card(1), None)
+		version, read = self.cache.source(('id', 1))
+		self.cache.store_cards(version, [(1, u'chien', u'new')])
+		self.assertEqual(self.cache.card(1), (u'chien', u'new'))
+
+	def test_edits_drop_the_answers_of_both_fronts(self):
+		self.cache.store_cards(0, [(1, u'chien', u'dog')])
+		self.cache.store_answer(0, u'chien', 1, u'dog')
+		self.cache.store_answer(0, u'chat', None, u'')
+		self.cache.edit(1, 1, front=u'chat')
+		self.assertEqual(self.cache.card(1), (u'chat', u'dog'))		#Empty values are kept
+		self.assertEqual(self.cache.answer(u'chien'), None)
+		self.assertEqual(self.cache.answer(u'chat'), None)
+		self.cache.remove(2, 1)
+		self.assertEqual(self.cache.card(1), None)
+
+	def test_least_recently_used_go_first(self):
+		cache = NotecardCache(self.database, max_bytes=3 * self.cache.size(0, (u'f', u'b')))
+		cache.store_cards(0, [(_id, u'f', u'b') for _id in range(3)])
+		cache.card(0)
+		cache.store_cards(0, [(3, u'f', u'b')])
+		self.assertEqual(cache.card(0), (u'f', u'b'))
+		self.assertEqual(cache.card(1), None)
+		self.assertEqual(cache.card(2), (u'f', u'b'))
+		self.assertLessEqual(cache.bytes, cache.max_bytes)
+		self.assertGreater(cache.stats()['evictions'], 0)
+
+	def test_clear_sends_everything_to_the_writer(self):
+		self.cache.store_cards(0, [(1, u'chien', u'dog')])
+		self.cache.clear(5)
+		self.assertEqual(self.cache.card(1), None)
+		self.assertEqual(self.cache.source(('id', 2))[1], self.database.select)
+		self.database.committed.add(5)
+		self.assertEqual(self.cache.source(('id', 2))[1], self.database.read)
+
+
+class NotecardsCacheTest(NotecardsTestCase):
+	def test_reads_see_their_own_writes(self):
+		notecards = self.open(readers=2)
+		card = self.add(notecards, u'chien', u'dog')
+		self.assertEqual(notecards.lookup(u'chien'), u'dog')
+		notecards.edit_notecard(card, back=u'hound')		#Not committed yet
+		self.assertEqual(notecards.lookup(u'chien'), u'hound')
+		self.assertEqual(notecards.get_notecards([card]), [(u'chien', u'hound')])
+		notecards.flush()
+		notecards.cache.stats(reset=True)
+		self.assertEqual(notecards.lookup(u'chien'), u'hound')
+		self.assertEqual(notecards.cache.stats()['hits'], 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,56 @@
+"""The change log, and what views learn from changes_since().
+"""
+import unittest
+
+from tests.support import NotecardsTestCase, csv_file
+
+
+class ChangeLogTest(NotecardsTestCase):
+	def test_changes_since(self):
+		notecards = self.open()
+		old = self.add(notecards, u'old')
+		gone = self.add(notecards, u'gone')
+		notecards.flush()
+		seq = notecards.last_change()
+		new = self.add(notecards, u'new')
+		notecards.edit_notecard(new, back=u'edited')
+		notecards.edit_notecard(old, back=u'edited')
+		notecards.delete_notecard(gone)
+		brief = self.add(notecards, u'brief')
+		notecards.delete_notecard(brief)
+		notecards.flush()
+		last, changes = notecards.changes_since(seq)
+		self.assertEqual(last, notecards.last_change())
+		self.assertEqual(changes, {new: 'i', old: 'u', gone: 'd'})
+		self.assertEqual(notecards.changes_since(seq, deletes=True)[1], {new: 'i', old: 'u', gone: 'd', brief: 'd'})
+		self.assertEqual(notecards.changes_since(last), (last, {}))
+		self.assertEqual(notecards.changes_since(seq, limit=2)[1], None)		#Too many
+
+	def test_import_makes_views_reload(self):
+		notecards = self.open()
+		seq = notecards.last_change()
+		self.assertEqual(notecards.import_csv(csv_file(u'un|one\ndeux|two\ntrois|three\n')), 3)
+		notecards.flush()
+		self.assertEqual(notecards.changes_since(seq)[1], None)
+		self.assertEqual([card[1] for card in notecards.search(u'two')], [u'deux'])
+		seq = notecards.last_change()
+		card = self.add(notecards, u'quatre', u'four')		#The triggers are back
+		notecards.flush()
+		self.assertEqual(notecards.changes_since(seq)[1], {card: 'i'})
+
+	def test_compacting_prunes_the_log(self):
+		notecards = self.open()
+		notecards.CHANGE_LOG_KEEP = 2
+		for front in [u'un', u'deux', u'trois', u'quatre']:
+			self.add(notecards, front)
+		notecards.flush()
+		notecards.maintenance.compact()
+		notecards.flush()
+		last = notecards.last_change()
+		self.assertEqual(list(notecards.database.read("SELECT seq FROM change_log")), [(last - 1,), (last,)])
+		self.assertEqual(notecards.changes_since(0), (last, None))		#Too far behind
+		self.assertEqual(notecards.changes_since(last - 2)[1], {2: 'i', 3: 'i'})
+
+
+if __name__ == '__main__':
+	unittest.main()
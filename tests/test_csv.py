@@ -0,0 +1,42 @@
+"""Importing and exporting front|back files.
+"""
+import io
+import unittest
+
+from tests.support import NotecardsTestCase, csv_file
+
+
+class CsvTest(NotecardsTestCase):
+	def export(self, notecards, deck_id=None):
+		output = io.BytesIO() if str is bytes else io.StringIO()
+		count = notecards.export_csv(output, deck_id)
+		text = output.getvalue()
+		return count, text.decode('utf-8') if isinstance(text, bytes) else text
+
+	def test_round_trip(self):
+		notecards = self.open()
+		lines = u'chien|dog\ncaf\xe9|coffee\n"a|b"|pipe\n'
+		self.assertEqual(notecards.import_csv(csv_file(lines), batch_size=2), 3)
+		self.assertEqual(notecards.lookup(u'caf\xe9'), u'coffee')
+		self.assertEqual(notecards.lookup(u'a|b'), u'pipe')
+		self.assertEqual(self.export(notecards), (3, lines.replace(u'\n', u'\r\n')))
+
+	def test_import_into_a_deck(self):
+		notecards = self.open()
+		self.add(notecards, u'chien', u'dog')
+		deck = notecards.add_deck(u'Birds')
+		self.assertEqual(notecards.import_csv(csv_file(u'oiseau|bird\naigle|eagle\n'), deck_id=deck), 2)
+		self.assertEqual(self.export(notecards, deck), (2, u'oiseau|bird\r\naigle|eagle\r\n'))
+		self.assertEqual(notecards.get_decks(), [(deck, u'Birds', 2), (0, u'Default', 1)])
+
+	def test_failed_import_leaves_nothing(self):
+		notecards = self.open()
+		self.assertRaises(ValueError, notecards.import_csv, csv_file(u'un|one\ndeux\n'))
+		self.assertEqual(notecards.count_notecards(), 0)
+		self.assertEqual(notecards.get_smallest_avialable_id(), 0)
+		self.assertEqual(notecards.search(u'one'), [])
+		self.assertEqual(notecards.import_csv(csv_file(u'un|one\n')), 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
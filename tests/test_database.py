@@ -0,0 +1,131 @@
+"""safeDatabase: what gets committed when, and where the errors of statements end up.
+"""
+import os
+import time
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from lexiconner.database import safeDatabase, Many, Steps
+from tests.support import Quiet
+
+
+class SafeDatabaseTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix='lexiconner-test-')
+		self.databases = []
+		self.database = self.open(readers=1)
+
+	def tearDown(self):
+		for database in self.databases:
+			database.close()
+			database.join()
+			for reader in database.readers:
+				reader.join()
+		shutil.rmtree(self.directory)
+
+	def open(self, **kwargs):
+		database = safeDatabase(os.path.join(self.directory, 'test.db'), **kwargs)
+		database.execute("CREATE TABLE IF NOT EXISTS numbers (x INT PRIMARY KEY)")
+		database.flush()
+		self.databases.append(database)
+		return database
+
+	def numbers(self):
+		return [x for x, in self.database.read("SELECT x FROM numbers ORDER BY x")]
+
+	def test_flush_commits_what_was_queued(self):
+		self.database.execute("INSERT INTO numbers VALUES (?)", [1])
+		ticket = self.database.execute("INSERT INTO numbers VALUES (?)", [2])
+		self.database.flush()
+		self.assertTrue(self.database.is_committed(ticket))
+		self.assertEqual(self.numbers(), [1, 2])		#On the reader's connection
+
+	def test_flush_raises_an_error_nobody_waited_for(self):
+		self.database.execute("INSERT INTO numbers VALUES (1)")
+		with Quiet():
+			self.database.execute("INSERT INTO numbers VALUES (1)")
+			self.assertRaises(sqlite3.IntegrityError, self.database.flush)
+		self.database.flush()		#Only the once
+		self.assertEqual(self.numbers(), [1])		#The rest of the batch still went in
+
+	def test_batch_waits_flush_interval(self):
+		database = self.open(flush_interval=30)
+		ticket = database.execute("INSERT INTO numbers VALUES (1)")
+		time.sleep(0.2)
+		self.assertFalse(database.is_committed(ticket))		#The queue ran dry, but it's early yet
+		self.assertEqual(self.numbers(), [])
+		start = time.time()
+		database.flush()
+		self.assertLess(time.time() - start, 5)
+		self.assertEqual(self.numbers(), [1])
+
+	def test_max_batch_commits_straight_away(self):
+		database = self.open(flush_interval=30, max_batch=3)
+		tickets = [database.execute("INSERT INTO numbers VALUES (?)", [x]) for x in range(4)]
+		deadline = time.time() + 5
+		while not database.is_committed(tickets[2]) and time.time() < deadline:
+			time.sleep(0.01)
+		self.assertTrue(database.is_committed(tickets[2]))
+		self.assertFalse(database.is_committed(tickets[3]))
+		self.assertEqual(self.numbers(), [0, 1, 2])
+
+	def test_select_raises_its_own_error(self):
+		self.assertRaises(sqlite3.OperationalError, list, self.database.select("SELECT * FROM missing"))
+		self.database.flush()		#Somebody got it already
+
+	def test_stream_sends_chunks(self):
+		for x in range(600):
+			self.database.execute("INSERT INTO numbers VALUES (?)", [x])
+		chunks = list(self.database.stream("SELECT x FROM numbers ORDER BY x"))
+		self.assertEqual([len(chunk) for chunk in chunks], [256, 256, 88])
+		self.assertEqual([x for x, in sum(chunks, [])], list(range(600)))
+
+	def test_abandoned_stream_lets_the_worker_go(self):
+		for x in range(2000):
+			self.database.execute("INSERT INTO numbers VALUES (?)", [x])
+		stream = self.database.stream("SELECT x FROM numbers", maxsize=1)
+		next(stream)
+		stream.close()
+		self.database.execute("INSERT INTO numbers VALUES (-1)")
+		self.database.flush()
+		self.assertEqual(self.numbers()[0], -1)
+
+	def test_executemany_is_all_or_nothing(self):
+		self.assertRaises(sqlite3.IntegrityError, self.database.executemany, "INSERT INTO numbers VALUES (?)", [(1,), (2,), (1,)])
+		self.database.executemany("INSERT INTO numbers VALUES (?)", ((x,) for x in range(3, 6)))
+		self.database.flush()
+		self.assertEqual(self.numbers(), [3, 4, 5])
+
+	def test_steps_are_all_or_nothing(self):
+		self.database.execute("INSERT INTO numbers VALUES (1)")
+		steps = Steps(("INSERT INTO numbers VALUES (?)", [2]), ("INSERT INTO numbers VALUES (?)", Many([(3,), (1,)])))
+		self.assertRaises(sqlite3.IntegrityError, list, self.database.select(steps))
+		steps = Steps(("INSERT INTO numbers VALUES (?)", [4]), ("SELECT COUNT(*) FROM numbers", None))
+		self.assertEqual(list(self.database.select(steps)), [(2,)])		#The rows of the last one
+		self.database.flush()
+		self.assertEqual(self.numbers(), [1, 4])
+
+	def test_stats_count_the_statements(self):
+		self.database.stats(reset=True)
+		for x in range(10):
+			self.database.execute("INSERT INTO numbers VALUES (?)", [x])
+		self.database.flush()
+		self.numbers()
+		select = 'SELECT x FROM numbers ORDER BY x'
+		deadline = time.time() + 5
+		while select not in self.database.stats()['queries'] and time.time() < deadline:
+			time.sleep(0.01)		#Counted once the rows are on their way
+		stats = self.database.stats()
+		self.assertEqual(stats['queries']['INSERT INTO numbers VALUES (?)']['calls'], 10)
+		self.assertEqual(stats['queries'][select]['rows'], 10)
+		self.assertEqual(stats['queues']['writer']['depth'], 0)
+		self.assertIn('readers', stats['queues'])
+		self.assertGreaterEqual(stats['commits']['statements'], 10)
+		self.database.stats(reset=True)
+		self.assertEqual(self.database.stats()['queries'], {})
+
+
+if __name__ == '__main__':
+	unittest.main()
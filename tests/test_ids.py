@@ -0,0 +1,93 @@
+"""IdAllocator, and the ids NotecardsHandler takes from it.
+"""
+import random
+import sqlite3
+import unittest
+
+from lexiconner.notecards import NotecardsHandler, IdAllocator
+from tests.support import NotecardsTestCase
+
+
+class IdAllocatorTest(unittest.TestCase):
+	def test_holes_go_first(self):
+		ids = IdAllocator([0, 1, 4, 5, 9])
+		self.assertEqual(ids.smallest(), 2)
+		self.assertEqual(ids.take_many(4), [2, 3, 6, 7])
+		self.assertEqual(ids.smallest(), 8)
+		ids.release_many([1, 4, 5])
+		self.assertEqual(ids.take_many(4), [1, 4, 5, 8])
+		self.assertEqual(ids.take_many(2), [10, 11])
+
+	def test_take_and_release(self):
+		ids = IdAllocator()
+		ids.take(3)
+		self.assertEqual(ids.take_many(4), [0, 1, 2, 4])
+		ids.release(2)
+		ids.release(2)		#Free already
+		ids.take(1000)		#Taken already
+		self.assertEqual(ids.smallest(), 2)
+		ids.take(2)
+		self.assertEqual(ids.smallest(), 5)
+
+	def test_releasing_the_top_gives_back_the_tail(self):
+		ids = IdAllocator(range(10))
+		ids.release_many(range(5, 10))
+		self.assertEqual((ids.next, ids.starts, ids.ends), (5, [], []))
+
+	def test_sparse_ids_take_a_range_each(self):
+		ids = IdAllocator([0, 10 ** 7])
+		self.assertEqual((ids.starts, ids.ends), ([1], [10 ** 7]))
+		self.assertEqual(ids.take_many(3), [1, 2, 3])
+
+	def test_against_a_set(self):
+		for seed in range(20):
+			rand = random.Random(seed)
+			used = set(rand.sample(range(200), 60))
+			ids = IdAllocator(sorted(used))
+			for step in range(300):
+				action = rand.random()
+				if action < 0.3:
+					_id = rand.randrange(250)
+					ids.take(_id)
+					used.add(_id)
+				elif action < 0.5:
+					taken = ids.take_many(rand.randrange(6))
+					self.assertEqual(taken, sorted(set(taken)))
+					self.assertFalse(used.intersection(taken))
+					used.update(taken)
+				else:
+					released = rand.sample(range(250), rand.randrange(1, 40 if action < 0.6 else 3))
+					ids.release_many(released)
+					used.difference_update(released)
+				self.assertEqual(ids.smallest(), min(set(range(len(used) + 1)) - used))
+				self.assertTrue(all(ends < starts for ends, starts in zip(ids.ends, ids.starts[1:])))
+
+
+class NotecardIdsTest(NotecardsTestCase):
+	def test_smallest_free_id(self):
+		notecards = self.open()
+		ids = [self.add(notecards, front) for front in [u'un', u'deux', u'trois']]
+		self.assertEqual(ids, [0, 1, 2])
+		notecards.delete_notecard(1)
+		self.assertEqual(notecards.get_smallest_avialable_id(), 1)
+		self.assertEqual(self.add(notecards, u'quatre'), 1)
+		self.assertEqual(notecards.get_smallest_avialable_id(), 3)
+
+	def test_ids_beyond_max_id_are_refused(self):
+		notecards = self.open()
+		self.assertRaises(ValueError, notecards.add_notecard, -1, u'front', u'back')
+		self.assertRaises(ValueError, notecards.add_notecard, NotecardsHandler.MAX_ID + 1, u'front', u'back')
+		self.assertRaises(ValueError, notecards.add_notecard, 1.5, u'front', u'back')
+		self.assertEqual(notecards.count_notecards(), 0)
+
+	def test_database_with_ids_beyond_max_id_is_refused(self):
+		self.open()
+		connection = sqlite3.connect(self.path)
+		with connection:
+			connection.execute("INSERT INTO notecard_table (id, front, back) VALUES (?, 'far', 'away')", [NotecardsHandler.MAX_ID + 1])
+		connection.close()
+		self.assertRaises(ValueError, NotecardsHandler, self.path)
+
+
+if __name__ == '__main__':
+	unittest.main()
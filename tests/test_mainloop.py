@@ -0,0 +1,118 @@
+"""JobScheduler and WorkerPool, on a main loop that is only pretend.
+"""
+import itertools
+import threading
+import unittest
+
+from lexiconner.mainloop import JobScheduler, WorkerPool
+from tests.support import Quiet
+
+
+class FakeLoop(object):
+	"""Keeps the timeouts and idle callbacks it's given; run() calls the idle ones, on
+		whatever thread calls it.
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.timeouts = {}		#Source id -> (milliseconds, callback)
+		self.idle = []
+		self.sources = itertools.count(1)
+	def timeout_add(self, milliseconds, callback):
+		source = next(self.sources)
+		self.timeouts[source] = (milliseconds, callback)
+		return source
+	def timeout_add_seconds(self, seconds, callback):
+		return self.timeout_add(seconds * 1000, callback)
+	def source_remove(self, source):
+		del self.timeouts[source]
+	def idle_add(self, callback, *args):
+		with self.lock:
+			self.idle.append((callback, args))
+	def run(self):
+		with self.lock:
+			idle, self.idle = self.idle, []
+		for callback, args in idle:
+			callback(*args)
+
+
+class JobSchedulerTest(unittest.TestCase):
+	def setUp(self):
+		self.now = 1000.0
+		self.loop = FakeLoop()
+		self.jobs = JobScheduler(self.loop, clock=lambda: self.now)
+		self.ran = []
+
+	def fire(self, at):
+		"""Moves the clock to at and fires the only timeout, as the main loop would.
+		"""
+		self.now = at
+		(source, (milliseconds, callback)), = self.loop.timeouts.items()
+		del self.loop.timeouts[source]
+		callback()
+
+	def test_one_timeout_for_the_first_job_due(self):
+		self.jobs.every(10, self.ran.append, 'slow')
+		self.jobs.every(0.5, self.ran.append, 'fast')
+		self.assertEqual([milliseconds for milliseconds, callback in self.loop.timeouts.values()], [500])
+		self.fire(1000.5)
+		self.assertEqual(self.ran, ['fast'])
+		self.fire(1010)
+		self.assertEqual(self.ran, ['fast', 'fast', 'slow', 'fast'])		#Not once for every run missed
+		self.assertEqual(len(self.loop.timeouts), 1)
+
+	def test_cancelled_jobs_stop(self):
+		job = self.jobs.every(5, self.ran.append, 'job')
+		other = self.jobs.every(5, lambda: job.cancel())		#From inside another job
+		self.fire(1005)
+		self.assertEqual(self.ran, ['job'])
+		other.cancel()
+		self.assertEqual(self.loop.timeouts, {})
+
+	def test_a_broken_job_keeps_its_turn(self):
+		def broken():
+			raise RuntimeError("broken")
+		self.jobs.every(1, broken)
+		self.jobs.every(1, self.ran.append, 'job')
+		with Quiet():
+			self.fire(1001)
+			self.fire(1002)
+		self.assertEqual(self.ran, ['job', 'job'])
+
+
+class WorkerPoolTest(unittest.TestCase):
+	def setUp(self):
+		self.loop = FakeLoop()
+		self.workers = WorkerPool(self.loop, size=2)
+
+	def tearDown(self):
+		self.workers.close()
+		for thread in self.workers.threads:
+			thread.join()
+
+	def test_results_come_back_on_the_loop(self):
+		results, errors = [], []
+		self.workers.submit(sum, ([1, 2, 3],), callback=results.append)
+		self.workers.submit(int, ('x',), callback=results.append, errback=errors.append)
+		self.workers.close()
+		for thread in self.workers.threads:
+			thread.join()
+		self.assertEqual((results, errors), ([], []))		#Not until the loop runs them
+		self.loop.run()
+		self.assertEqual(results, [6])
+		self.assertEqual([type(error) for error in errors], [ValueError])
+
+	def test_work_runs_side_by_side(self):
+		second = threading.Event()
+		waited = []
+		self.workers.submit(lambda: second.wait(5), callback=waited.append)		#Would time out on a single thread
+		self.workers.submit(second.set)
+		self.workers.close()
+		for thread in self.workers.threads:
+			thread.join()
+		self.loop.run()
+		self.assertTrue(second.is_set())
+		self.assertNotEqual(waited, [False])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,52 @@
+"""Maintenance: backups that can be opened, kept to a number, and compaction.
+"""
+import os
+import sqlite3
+import unittest
+
+from lexiconner.maintenance import Maintenance, MaintenanceStopped
+from tests.support import NotecardsTestCase, csv_file
+
+
+class MaintenanceTest(NotecardsTestCase):
+	def setUp(self):
+		NotecardsTestCase.setUp(self)
+		self.notecards = self.open()
+		self.notecards.import_csv(csv_file(u''.join(u'front%d|%s\n' % (i, u'back' * 50) for i in range(2000))))
+		self.notecards.flush()
+		self.maintenance = self.notecards.maintenance
+
+	def test_backups_hold_the_notecards(self):
+		path = self.maintenance.backup()
+		self.assertEqual(self.maintenance.backups(), [path])
+		backup = sqlite3.connect(path)
+		try:
+			self.assertEqual(backup.execute("SELECT COUNT(*) FROM notecard_table").fetchone(), (2000,))
+		finally:
+			backup.close()
+
+	def test_only_the_newest_are_kept(self):
+		maintenance = Maintenance(self.notecards.database, self.maintenance.directory, keep=2)
+		os.makedirs(maintenance.directory)
+		old = [os.path.join(maintenance.directory, maintenance.prefix + name + '.db') for name in ('20200101-000000', '20210101-000000')]
+		for path in old:
+			open(path, 'wb').close()
+		path = maintenance.backup()
+		self.assertEqual(maintenance.backups(), [old[1], path])
+
+	def test_compact_gives_back_the_space_of_deleted_cards(self):
+		self.notecards.delete_notecards(range(2000))
+		self.notecards.flush()
+		self.assertGreater(self.maintenance.compact(), 0)
+		self.assertEqual(next(self.notecards.database.select("PRAGMA freelist_count"))[0], 0)
+		self.assertEqual(self.maintenance.compact(), 0)
+
+	def test_nothing_runs_once_stopped(self):
+		self.maintenance.stop()
+		self.assertRaises(MaintenanceStopped, self.maintenance.backup)
+		self.maintenance.run()		#Stops quietly
+		self.assertEqual(self.maintenance.backups(), [])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,56 @@
+"""MediaStore, and the media notecards have attached.
+"""
+import io
+import os
+import time
+import unittest
+
+from lexiconner.media import MediaStore
+from tests.support import NotecardsTestCase
+
+
+class MediaStoreTest(NotecardsTestCase):
+	def setUp(self):
+		NotecardsTestCase.setUp(self)
+		self.store = MediaStore(os.path.join(self.directory, 'media'))
+
+	def test_the_same_content_is_stored_once(self):
+		picture = b'picture' * 30000		#Several chunks
+		digest, size = self.store.put(io.BytesIO(picture))
+		self.assertEqual(size, len(picture))
+		self.assertEqual(self.store.put(io.BytesIO(picture)), (digest, size))
+		self.assertEqual([stored for stored, modified in self.store.digests()], [digest])
+		self.assertEqual(b''.join(self.store.chunks(digest)), picture)
+		self.assertEqual(os.listdir(os.path.dirname(self.store.path(digest))), [digest[2:]])		#No .part left
+
+	def test_prune_spares_what_is_used_or_new(self):
+		used, unused = self.store.put(io.BytesIO(b'used'))[0], self.store.put(io.BytesIO(b'unused'))[0]
+		self.assertEqual(self.store.prune(set([used])), 0)		#Could be about to be attached
+		old = time.time() - 2 * 60 * 60
+		for digest in (used, unused):
+			os.utime(self.store.path(digest), (old, old))
+		self.assertEqual(self.store.prune(set([used])), 1)
+		self.assertTrue(self.store.exists(used))
+		self.assertFalse(self.store.exists(unused))
+
+
+class AttachedMediaTest(NotecardsTestCase):
+	def test_attached_then_pruned_with_the_card(self):
+		notecards = self.open()
+		dog, cat = self.add(notecards, u'chien', u'dog'), self.add(notecards, u'chat', u'cat')
+		digest = notecards.attach_media(dog, io.BytesIO(b'woof'), 'audio/ogg')
+		notecards.attach_media(cat, io.BytesIO(b'woof'), 'audio/ogg')		#Stored once
+		notecards.flush()
+		self.assertEqual(notecards.get_media(dog), [(digest, 'audio/ogg', 4)])
+		old = time.time() - 2 * 60 * 60
+		os.utime(notecards.media.path(digest), (old, old))
+		notecards.delete_notecard(dog)
+		self.assertEqual(notecards.prune_media(), 0)		#The cat still has it
+		notecards.delete_notecard(cat)
+		self.assertEqual(notecards.prune_media(), 1)
+		notecards.flush()
+		self.assertEqual(notecards.get_media(dog), [])
+
+
+if __name__ == '__main__':
+	unittest.main()
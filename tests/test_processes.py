@@ -0,0 +1,104 @@
+"""Two handlers on one file, standing in for two processes: their ids, and what poll() takes in.
+"""
+import sqlite3
+import threading
+import time
+import unittest
+
+from tests.support import NotecardsTestCase, csv_file
+
+
+class ProcessesTest(NotecardsTestCase):
+	def test_poll_takes_in_what_others_wrote(self):
+		first, second = self.open(), self.open()
+		self.assertEqual(first.poll(), {})
+		card = self.add(second, u'chat', u'cat')
+		self.assertEqual(first.poll(), {card: 'i'})
+		self.assertEqual(first.poll(), {})
+		self.assertEqual(first.get_notecards([card]), [(u'chat', u'cat')])
+		self.assertNotEqual(first.get_smallest_avialable_id(), card)
+		second.edit_notecard(card, back=u'kitten')
+		second.flush()
+		self.assertEqual(first.poll(), {card: 'u'})
+		self.assertEqual(first.lookup(u'chat'), u'kitten')
+
+	def test_poll_counts_our_cards_deleted_elsewhere(self):
+		first, second = self.open(), self.open()
+		card = self.add(first, u'chat')
+		second.poll()
+		second.delete_notecard(card)
+		second.flush()
+		self.assertEqual(first.poll(), {card: 'd'})
+		self.assertEqual(first.count_notecards(), 0)
+		self.assertEqual(first.get_smallest_avialable_id(), card)
+
+	def test_poll_reloads_after_an_import_elsewhere(self):
+		first, second = self.open(), self.open()
+		second.import_csv(csv_file(u'un|one\ndeux|two\n'))
+		self.assertEqual(first.poll(), None)
+		self.assertEqual(first.count_notecards(), 2)
+		self.assertEqual(first.get_smallest_avialable_id(), 2)
+
+	def test_adds_from_two_handlers_get_their_own_ids(self):
+		first, second = self.open(), self.open()
+		one = self.add(first, u'un')
+		two = self.add(second, u'deux')		#Has not polled, so thinks one is free
+		self.assertNotEqual(one, two)
+		self.assertEqual(sorted([one, two]), [0, 1])
+		first.poll()
+		self.assertEqual(first.get_notecards([one, two]), [(u'un', u'back'), (u'deux', u'back')])
+
+	def test_import_skips_ids_taken_elsewhere(self):
+		first, second = self.open(snapshot=True), self.open(snapshot=True)
+		card = self.add(first, u'un', u'one')
+		first.flush()
+		self.assertEqual(second.import_csv(csv_file(u'deux|two\ntrois|three\n')), 2)		#Has not polled either
+		self.assertEqual(second.count_notecards(), 3)
+		ids = sorted(row[0] for row in second.database.read("SELECT id FROM notecard_table"))
+		self.assertEqual(ids, [0, 1, 2])
+		self.assertEqual(second.lookup(u'deux'), u'two')
+		self.assertEqual(second.get_smallest_avialable_id(), 3)
+		self.assertEqual([second.sampler.deck_of(_id) for _id in ids], [None, 0, 0])		#Card 0 waits for poll()
+		self.assertEqual(second.snapshot.get(ids), [(u'trois', u'three'), (u'deux', u'two')])		#deux moved past it
+		self.assertEqual(second.poll(), None)
+		self.assertEqual(second.snapshot.get([card]), [(u'un', u'one')])
+		self.assertEqual(first.poll(), None)
+		self.assertEqual(first.get_smallest_avialable_id(), 3)
+
+	def test_adds_while_reloading_land_in_the_new_ids(self):
+		notecards = self.open()
+		self.add(notecards, u'un')
+		added = []
+		adding = threading.Thread(target=lambda: added.append(self.add(notecards, u'deux')))
+		load_ids = notecards.load_ids
+		def loading():
+			loaded = load_ids()
+			adding.start()
+			time.sleep(0.2)		#Long enough for the add to be done, if nothing held it back
+			return loaded
+		notecards.load_ids = loading
+		notecards.reload()
+		adding.join()
+		self.assertEqual(added, [1])
+		self.assertEqual(notecards.sampler.deck_of(1), 0)
+		self.assertEqual(notecards.get_smallest_avialable_id(), 2)
+
+	def test_waits_for_the_write_lock_are_counted(self):
+		notecards = self.open()
+		notecards.flush()
+		other = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)		#Another process, writing
+		other.execute('BEGIN IMMEDIATE')
+		release = threading.Timer(0.2, other.close)		#Rolls it back
+		release.start()
+		try:
+			self.add(notecards, u'un')
+			notecards.flush()
+		finally:
+			release.join()
+		busy = notecards.database.stats()['busy']
+		self.assertEqual((busy['waits'], busy['failures']), (1, 0))
+		self.assertGreater(busy['total_ms'], 100)
+
+
+if __name__ == '__main__':
+	unittest.main()
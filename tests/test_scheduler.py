@@ -0,0 +1,102 @@
+"""The SM-2 Scheduler, and the QuestionPrefetcher in front of it.
+"""
+import time
+import unittest
+
+from lexiconner.scheduler import DAY
+from tests.support import NotecardsTestCase, close
+
+
+class SchedulerTest(NotecardsTestCase):
+	def setUp(self):
+		NotecardsTestCase.setUp(self)
+		self.notecards = self.open()
+		self.ids = [self.add(self.notecards, front) for front in [u'un', u'deux', u'trois']]
+		self.scheduler = self.notecards.scheduler
+
+	def test_answers_reschedule(self):
+		before = time.time()
+		self.scheduler.record(self.ids[0], True)
+		due, interval, ease, repetitions = self.scheduler.cards[self.ids[0]]
+		self.assertEqual((interval, repetitions), (DAY, 1))
+		self.assertGreaterEqual(due, before + DAY)
+		self.scheduler.record(self.ids[0], True)
+		self.assertEqual(self.scheduler.cards[self.ids[0]][1::2], [6 * DAY, 2])
+		self.assertAlmostEqual(self.scheduler.cards[self.ids[0]][2], ease)		#Right answers keep it
+		self.scheduler.record(self.ids[0], False)
+		due, interval, new_ease, repetitions = self.scheduler.cards[self.ids[0]]
+		self.assertEqual((interval, repetitions), (self.scheduler.RETRY, 0))
+		self.assertLess(new_ease, ease)
+
+	def test_due_cards_go_first_and_get_snoozed(self):
+		self.scheduler.RETRY = -1000		#Wrong answers are overdue straight away
+		self.scheduler.record(self.ids[2], False)
+		self.scheduler.record(self.ids[1], False)
+		self.assertEqual(self.scheduler.next_card(), self.ids[2])		#The most overdue
+		self.assertEqual(self.scheduler.next_card(), self.ids[1])
+		self.assertEqual(self.scheduler.next_card(), self.ids[0])		#Both snoozed, so the new one
+		self.scheduler.unsnooze([self.ids[1]])
+		self.assertEqual(self.scheduler.next_card(), self.ids[1])
+
+	def test_cards_not_due_wait(self):
+		for _id in self.ids:
+			self.scheduler.record(_id, True)
+		self.assertEqual(self.scheduler.next_card(), self.ids[0])		#Nothing new, so the first due
+		self.notecards.delete_notecards(self.ids)
+		self.assertEqual(self.scheduler.next_card(), None)
+
+	def test_states_are_kept(self):
+		self.scheduler.record(self.ids[0], True)
+		self.scheduler.record(self.ids[1], False)
+		state = list(self.scheduler.cards[self.ids[0]])
+		self.notecards.delete_notecard(self.ids[1])		#Takes its history along
+		self.handlers.remove(self.notecards)
+		close(self.notecards)
+		notecards = self.open()
+		self.assertEqual(notecards.scheduler.cards, {self.ids[0]: state})
+		reviews = list(notecards.database.select("SELECT card_id, correct FROM review_table"))
+		self.assertEqual(reviews, [(self.ids[0], 1)])
+
+
+def wait_for(condition, timeout=5):
+	deadline = time.time() + timeout
+	while not condition() and time.time() < deadline:
+		time.sleep(0.01)
+	return condition()
+
+
+class QuestionPrefetcherTest(NotecardsTestCase):
+	def setUp(self):
+		NotecardsTestCase.setUp(self)
+		self.notecards = self.open(prefetch=3)
+		self.prefetcher = self.notecards.prefetcher
+
+	def ready(self):
+		with self.prefetcher.condition:
+			return [_id for _id, question in self.prefetcher.ready]
+
+	def test_no_notecards_no_questions(self):
+		self.assertEqual(self.notecards.ready_question(), None)
+
+	def test_questions_are_kept_ready(self):
+		for front, back in [(u'un', u'one'), (u'deux', u'two'), (u'trois', u'three'), (u'quatre', u'four')]:
+			self.add(self.notecards, front, back)
+		self.assertTrue(wait_for(lambda: len(self.ready()) == 3))
+		_id, question = self.notecards.ready_question()
+		front, answer = question[:2]
+		self.assertEqual(self.notecards.lookup(front), question[2:][answer])
+		self.assertTrue(wait_for(lambda: len(self.ready()) == 3))		#Topped up again
+
+	def test_changes_give_the_cards_their_place_back(self):
+		self.notecards.scheduler.RETRY = -1000		#Wrong answers are overdue straight away
+		ids = [self.add(self.notecards, u'front%d' % i, u'back%d' % i) for i in range(6)]
+		for _id in ids:
+			self.notecards.scheduler.record(_id, False)
+		self.notecards.changed()		#Throws away what was made from new cards meanwhile
+		self.assertTrue(wait_for(lambda: self.ready() == ids[:3]))
+		self.notecards.edit_notecard(ids[5], back=u'edited')
+		self.assertTrue(wait_for(lambda: self.ready() == ids[:3]), self.ready())		#Not ids[3:]
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,90 @@
+"""The quiz server's protocol, over a real Unix socket. Python 3 only, as the server is.
+"""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+try:
+	import asyncio
+	from lexiconner.aio import AsyncNotecardsHandler
+	from lexiconner.server import QuizServer
+except ImportError:		#Python 2
+	asyncio = None
+
+from lexiconner.notecards import NotecardsHandler
+from tests.support import close
+
+
+@unittest.skipIf(asyncio is None, "the server needs asyncio")
+class QuizServerTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix='lexiconner-test-')
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)		#As main() does
+		self.notecards = NotecardsHandler(os.path.join(self.directory, 'test.db'), readers=1, snapshot=True)
+		for front, back in [('chien', 'dog'), ('chat', 'cat'), ('oiseau', 'bird'), ('poisson', 'fish')]:
+			self.notecards.add_notecard(self.notecards.get_smallest_avialable_id(), front, back)
+		self.server = QuizServer(AsyncNotecardsHandler(self.notecards, self.loop))
+		self.path = os.path.join(self.directory, 'test.sock')
+		self.loop.run_until_complete(self.server.start(self.path))
+		self.reader, self.writer = self.loop.run_until_complete(asyncio.open_unix_connection(self.path))
+
+	def tearDown(self):
+		self.writer.close()
+		self.loop.run_until_complete(self.server.close())
+		close(self.notecards)
+		self.loop.close()
+		asyncio.set_event_loop(None)
+		shutil.rmtree(self.directory)
+
+	def ask(self, *requests):
+		"""Sends requests, dicts or raw lines, all at once and returns the responses.
+		"""
+		lines = [request if isinstance(request, bytes) else json.dumps(request).encode('utf-8') for request in requests]
+		self.writer.write(b''.join(line + b'\n' for line in lines))
+		read = lambda: self.loop.run_until_complete(asyncio.wait_for(self.reader.readline(), 10))
+		return [json.loads(read().decode('utf-8')) for line in lines]
+
+	def test_responses_come_back_in_order(self):
+		responses = self.ask(*[{'id': i, 'op': 'lookup', 'front': front} for i, front in enumerate(['chat', 'chien', 'nope'] * 20)])
+		self.assertEqual([response['id'] for response in responses], list(range(60)))
+		self.assertEqual([response['result'] for response in responses[:3]], ['cat', 'dog', ''])
+
+	def test_question_and_answer(self):
+		question, = self.ask({'id': 1, 'op': 'question', 'choices': 3})
+		card = question['result']
+		self.assertEqual(len(card['choices']), 3)
+		right = self.notecards.lookup(card['front'])
+		answer, again = self.ask({'id': 2, 'op': 'answer', 'card': card['card'], 'choice': card['choices'].index(right)},
+								{'id': 3, 'op': 'answer', 'card': card['card'], 'choice': 0})
+		self.assertEqual(answer['result'], {'correct': True, 'answer': card['choices'].index(right)})
+		self.assertIn('error', again)		#Only the first answer counts
+
+	def test_add_then_count_sees_the_new_card(self):
+		add, count, lookup = self.ask({'id': 1, 'op': 'add', 'front': 'cheval', 'back': 'horse'},
+									{'id': 2, 'op': 'count'}, {'id': 3, 'op': 'lookup', 'front': 'cheval'})
+		self.assertEqual(add['result'], 4)
+		self.assertEqual(count['result'], 5)
+		self.assertEqual(lookup['result'], 'horse')
+		got, = self.ask({'id': 4, 'op': 'get', 'ids': [4, 99]})
+		self.assertEqual(got['result'], [['cheval', 'horse']])
+
+	def test_add_checks_what_it_takes(self):
+		responses = self.ask({'id': 1, 'op': 'add', 'front': '', 'back': 'nothing'},
+							{'id': 2, 'op': 'add', 'front': 7, 'back': 'seven'},
+							{'id': 3, 'op': 'add', 'front': 'vrai', 'back': 'true', 'deck': True},
+							{'id': 4, 'op': 'count'})
+		self.assertEqual([sorted(response) for response in responses[:3]], [['error', 'id']] * 3)
+		self.assertEqual(responses[3]['result'], 4)
+
+	def test_bad_requests_get_errors(self):
+		responses = self.ask(b'not json', b'[1, 2]', {'id': 3, 'op': 'dance'}, {'id': 4, 'op': 'count'})
+		self.assertEqual([sorted(response) for response in responses[:3]], [['error', 'id']] * 3)
+		self.assertEqual(responses[2]['id'], 3)
+		self.assertEqual(responses[3], {'id': 4, 'result': 4})
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,75 @@
+"""SimilarityIndex: which backs look alike, in this process and the next.
+"""
+import os
+import sys
+import subprocess
+import unittest
+
+from lexiconner.similarity import SimilarityIndex
+from tests.support import NotecardsTestCase, close
+
+BACKS = [u'the red house', u'the red houses', u'a green tree', u'green trees', u'quantum chromodynamics']
+
+
+class SimilarityIndexTest(NotecardsTestCase):
+	def setUp(self):
+		NotecardsTestCase.setUp(self)
+		self.index = SimilarityIndex()
+		self.index.build([list(enumerate(BACKS))])
+
+	def test_alike_backs_are_found(self):
+		self.assertEqual(self.index.similar(0, 1), [1])
+		self.assertEqual(self.index.similar(2, 1), [3])
+		self.assertEqual(self.index.similar(4, 3), [])
+		self.index.remove(1)
+		self.assertEqual(self.index.similar(0, 1), [])
+		self.index.add(4, u'the red mouse')		#Moves it
+		self.assertEqual(self.index.similar(0, 1), [4])
+
+	def test_signatures_are_the_same_in_every_process(self):
+		script = 'from lexiconner.similarity import SimilarityIndex; print(SimilarityIndex().signature(u"the red house"))'
+		signatures = set()
+		for seed in ('1', '2'):
+			env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+			signatures.add(subprocess.check_output([sys.executable, '-c', script], env=env).strip())
+		self.assertEqual(len(signatures), 1)
+		self.assertEqual(signatures.pop().decode('ascii'), str(self.index.signature(u'the red house')))
+
+	def test_saved_and_loaded(self):
+		path = os.path.join(self.directory, 'test.similar')
+		self.index.save(path, seq=5)
+		index = SimilarityIndex.load(path)
+		self.assertEqual((index.seq, len(index)), (5, len(BACKS)))
+		self.assertEqual(index.similar(0, 1), [1])
+		index.add(5, u'the red house!')
+		self.assertEqual(sorted(index.similar(0, 2)), [1, 5])
+		with open(path, 'r+b') as saved:
+			saved.truncate(os.path.getsize(path) - 1)
+		self.assertEqual(SimilarityIndex.load(path), None)
+
+
+class SimilarFileTest(NotecardsTestCase):
+	def open(self, **kwargs):
+		notecards = NotecardsTestCase.open(self, snapshot_file=os.path.join(self.directory, 'test.snapshot'), similar=True, **kwargs)
+		for thread in notecards.indexing:
+			thread.join()
+		return notecards
+
+	def test_kept_across_runs_with_the_changes_between(self):
+		notecards = self.open()
+		ids = [self.add(notecards, u'front%d' % i, back) for i, back in enumerate(BACKS)]
+		self.handlers.remove(notecards)
+		close(notecards)
+		self.assertTrue(os.path.exists(os.path.join(self.directory, 'test.similar')))
+		other = NotecardsTestCase.open(self)		#Another process
+		other.delete_notecard(ids[1])
+		other.edit_notecard(ids[4], back=u'the red mouse')
+		other.flush()
+		notecards = self.open()
+		self.assertEqual(notecards.indexing, [])		#Not built again
+		self.assertEqual(notecards.similarity.seq, notecards.last_change())
+		self.assertEqual(notecards.similarity.similar(ids[0], 1), [ids[4]])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,73 @@
+"""DeckSnapshot, saved and loaded, and the one a NotecardsHandler keeps in snapshot_file.
+"""
+import os
+import unittest
+
+from lexiconner.snapshot import DeckSnapshot
+from tests.support import NotecardsTestCase, close
+
+
+class DeckSnapshotTest(NotecardsTestCase):
+	def setUp(self):
+		NotecardsTestCase.setUp(self)
+		self.file = os.path.join(self.directory, 'test.snapshot')
+		self.snapshot = DeckSnapshot().build([[(0, u'chien', u'dog'), (2, u'chat', u'pet')], [(3, u'lapin', u'pet')]], seq=7)
+
+	def test_saved_and_loaded(self):
+		self.snapshot.save(self.file)
+		for use_mmap in (True, False):
+			snapshot = DeckSnapshot.load(self.file, use_mmap)
+			self.assertEqual((snapshot.seq, len(snapshot)), (7, 3))
+			self.assertEqual(snapshot.get(range(5)), [(u'chien', u'dog'), (u'chat', u'pet'), (u'lapin', u'pet')])
+			self.assertEqual(snapshot.card(1), None)
+
+	def test_changes_after_loading(self):
+		self.snapshot.save(self.file)
+		snapshot = DeckSnapshot.load(self.file)
+		snapshot.edit(2, back=u'cat')
+		snapshot.remove(0)
+		snapshot.add(5, u'\xe9cureuil', u'squirrel')
+		self.assertEqual(snapshot.get(range(6)), [(u'chat', u'cat'), (u'lapin', u'pet'), (u'\xe9cureuil', u'squirrel')])
+		snapshot.save(self.file, seq=9)		#Over the file it's mapped from
+		snapshot = DeckSnapshot.load(self.file)
+		self.assertEqual(snapshot.seq, 9)
+		self.assertEqual(snapshot.get(range(6)), [(u'chat', u'cat'), (u'lapin', u'pet'), (u'\xe9cureuil', u'squirrel')])
+
+	def test_what_cant_be_used_is_not_loaded(self):
+		self.assertEqual(DeckSnapshot.load(self.file), None)
+		self.snapshot.save(self.file)
+		with open(self.file, 'r+b') as snapshot:
+			snapshot.truncate(os.path.getsize(self.file) - 1)
+		self.assertEqual(DeckSnapshot.load(self.file), None)
+		with open(self.file, 'wb') as snapshot:
+			snapshot.write(b'Something else entirely')
+		self.assertEqual(DeckSnapshot.load(self.file), None)
+
+
+class SnapshotFileTest(NotecardsTestCase):
+	def test_kept_across_runs_with_the_changes_between(self):
+		snapshot_file = os.path.join(self.directory, 'test.snapshot')
+		notecards = self.open(snapshot_file=snapshot_file)
+		ids = [self.add(notecards, front, back) for front, back in [(u'un', u'one'), (u'deux', u'two'), (u'trois', u'three')]]
+		self.handlers.remove(notecards)
+		close(notecards)
+		self.assertTrue(os.path.exists(snapshot_file))
+		other = self.open()		#Another process, with no snapshot
+		other.edit_notecard(ids[0], back=u'uno')
+		other.delete_notecard(ids[1])
+		self.assertEqual(self.add(other, u'quatre', u'four'), ids[1])		#Where deux was
+		other.flush()
+		notecards = self.open(snapshot_file=snapshot_file)
+		self.assertEqual(notecards.snapshot.seq, notecards.last_change())
+		self.assertEqual(notecards.snapshot.get(ids), [(u'un', u'uno'), (u'quatre', u'four'), (u'trois', u'three')])
+
+	def test_one_from_another_database_is_dropped(self):
+		snapshot_file = os.path.join(self.directory, 'other.snapshot')
+		DeckSnapshot().build([[(0, u'elsewhere', u'nope')]], seq=1000).save(snapshot_file)
+		notecards = self.open(snapshot_file=snapshot_file)
+		self.add(notecards, u'un', u'one')
+		self.assertEqual(notecards.snapshot.get(range(2)), [(u'un', u'one')])
+
+
+if __name__ == '__main__':
+	unittest.main()